@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
-import paramiko
-import telnetlib
+import argparse
 import time
 import random
+from sessions import SessionPool, link_flap
 
 VM1 = {
     "host": "VM1_MGMT_IP",
@@ -24,54 +24,19 @@ ROUTER_TELNET_HOST = "127.0.0.1"
 ROUTER_TELNET_PORT = 5000
 INTERFACES = ["Fa1/0", "Fa2/0"]
 
+# Sessions SSH / Telnet gardées ouvertes d'un événement à l'autre (sessions.py)
+pool = SessionPool()
+
 def ssh_command(host, user, password, cmd):
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    client.connect(host, username=user, password=password, timeout=5)
-    stdin, stdout, stderr = client.exec_command(cmd)
-    exit_code = stdout.channel.recv_exit_status()
-    out_str = stdout.read().decode()
-    err_str = stderr.read().decode()
-    client.close()
-    return (out_str, err_str, exit_code)
+    return pool.ssh(host, user, password).run(cmd)
 
 def link_down_up(interface):
     print(f"=== [ROUTER] LinkDown/Up on {interface} ===")
     try:
-        tn = telnetlib.Telnet(ROUTER_TELNET_HOST, ROUTER_TELNET_PORT, timeout=5)
-        tn.read_until(b"#", timeout=5)
-
-        tn.write(b"conf t\r\n")
-        tn.read_until(b"(config)#", timeout=5)
-
-        tn.write(f"interface {interface}\r\n".encode('ascii'))
-        tn.read_until(b"(config-if)#", timeout=5)
-        tn.write(b"shutdown\r\n")
-        time.sleep(0.5)
-        tn.write(b"end\r\n")
-        tn.read_until(b"#", timeout=5)
-
-        tn.write(b"wr\r\n")
-        tn.read_until(b"#", timeout=5)
-
-        print(f"   -> Interface {interface} est désactivée.")
         down_time = random.randint(20, 40)
-        print(f"   -> Attente {down_time} secondes avant réactivation.")
-        time.sleep(down_time)
-
-        tn.write(b"conf t\r\n")
-        tn.read_until(b"(config)#", timeout=5)
-        tn.write(f"interface {interface}\r\n".encode('ascii'))
-        tn.read_until(b"(config-if)#", timeout=5)
-        tn.write(b"no shutdown\r\n")
-        time.sleep(0.5)
-        tn.write(b"end\r\n")
-        tn.read_until(b"#", timeout=5)
-
-        tn.write(b"wr\r\n")
-        tn.read_until(b"#", timeout=5)
-        tn.close()
-
+        link_flap(pool.telnet(ROUTER_TELNET_HOST, ROUTER_TELNET_PORT), interface, down_time,
+                  on_down=lambda: print(f"   -> Interface {interface} est désactivée.\n"
+                                        f"   -> Attente {down_time} secondes avant réactivation."))
         print(f"   [OK] LinkDown/Up terminé sur {interface}.\n")
     except Exception as e:
         print(f"   [ERREUR Telnet] {e}\n")
@@ -140,6 +105,22 @@ def run_vm_events(num_events):
         time.sleep(pause)
 
 def main():
+    parser = argparse.ArgumentParser(description="Simulation d'anomalies sur le lab")
+    parser.add_argument("--scenario", default=None,
+                        help="fichier de scénario JSON : événements en parallèle et "
+                             "planning reproductible (scenario_engine.py)")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    if args.scenario:
+        from scenario_engine import load_scenario, run_scenario
+        scenario = load_scenario(args.scenario)
+        if args.seed is not None:
+            scenario["seed"] = args.seed
+        run_scenario(scenario)
+        return
+    if args.seed is not None:
+        random.seed(args.seed)
+
     print("\n============================")
     print(" DÉMARRAGE DE LA SIMULATION ")
     print("============================\n")
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sessions import SessionPool, link_flap
+
+# Moteur de scénarios : un fichier JSON déclaratif décrit les équipements et
+# les familles d'événements ; avec la graine (seed) du fichier, le planning
+# produit est toujours le même. Les événements se chevauchent librement
+# entre VMs et interfaces (pool de threads, sessions SSH/Telnet
+# persistantes), mais jamais deux à la fois sur la même ressource (même VM
+# pour un type donné, même interface d'un routeur). Chaque événement injecté
+# est journalisé avec ses horodatages réels de début et de fin
+# (EVENTS_LOG), qui servent de vérité terrain pour l'étiquetage.
+#
+# Format du scénario :
+# {
+#   "seed": 42, "duration": 3600, "max_parallel": 16, "save_config": true,
+#   "devices": {
+#     "VM1": {"kind": "ssh", "host": "...", "user": "...", "password": "...",
+#             "other_vm_ip": "20.0.0.1"},
+#     "R1":  {"kind": "telnet", "host": "127.0.0.1", "port": 5000,
+#             "interfaces": ["Fa1/0", "Fa2/0"]}
+#   },
+#   "events": [
+#     {"type": "CPU", "targets": ["VM1", "VM2"], "count": 20,
+#      "duration": [60, 300], "cpus": [1, 2]},
+#     {"type": "LINK_FLAP", "targets": ["R1"], "count": 5, "down": [20, 40]},
+#     {"type": "PING", "targets": ["VM1"], "at": [120, 900], "packets": [60, 120]}
+#   ]
+# }
+# "targets" vaut par défaut toutes les VMs (tous les routeurs pour
+# LINK_FLAP) ; "at" fixe les instants de départ (secondes depuis le début)
+# au lieu de les tirer au hasard (un instant qui chevauche un autre
+# événement sur la même ressource est refusé) ; les intervalles [min, max] sont tirés
+# uniformément, une liste de valeurs est un choix parmi elles.
+
+EVENTS_LOG = "anomaly_events.csv"
+# "length" : durée prévue (s), qui borne un événement sans fin journalisée
+EVENT_FIELDS = ["event_id", "type", "target", "interface", "command", "length", "scheduled",
+                "start", "end", "status", "detail"]
+MAX_PARALLEL = 16
+# Tirages d'un instant de départ avant d'abandonner un événement dont la
+# ressource est toujours occupée
+PLACEMENT_TRIES = 50
+# Marge entre deux événements sur la même ressource (secondes)
+RESOURCE_GAP = 10
+
+VM_EVENTS = ("CPU", "MEM", "IPERF", "PING", "CMD")
+
+def draw(rng, spec, default):
+    # [min, max] -> entier tiré uniformément, liste -> choix, scalaire -> tel quel
+    if spec is None:
+        spec = default
+    if isinstance(spec, list):
+        if len(spec) == 2 and all(isinstance(v, int) for v in spec) and spec[0] <= spec[1]:
+            return rng.randint(spec[0], spec[1])
+        return rng.choice(spec)
+    return spec
+
+def load_scenario(path):
+    with open(path, encoding="utf-8") as f:
+        scenario = json.load(f)
+    for name, device in scenario["devices"].items():
+        if device.get("kind") not in ("ssh", "telnet"):
+            raise ValueError(f"Équipement {name} : kind doit valoir 'ssh' ou 'telnet'")
+    for spec in scenario["events"]:
+        if spec["type"] not in VM_EVENTS + ("LINK_FLAP",):
+            raise ValueError(f"Type d'événement inconnu : {spec['type']}")
+    return scenario
+
+def event_command(rng, spec, device):
+    # -> (commande, durée prévue en secondes)
+    kind = spec["type"]
+    if kind == "CPU":
+        duration = draw(rng, spec.get("duration"), [60, 300])
+        cpus = draw(rng, spec.get("cpus"), [1, 2])
+        return f"stress -c {cpus} --timeout {duration}", duration
+    if kind == "MEM":
+        duration = draw(rng, spec.get("duration"), [60, 300])
+        size = draw(rng, spec.get("sizes"), [512, 1024, 2048])
+        return f"stress --vm 1 --vm-bytes {size}M --timeout {duration}", duration
+    if kind == "IPERF":
+        duration = draw(rng, spec.get("duration"), [60, 300])
+        return f"iperf3 -c {device['other_vm_ip']} -t {duration}", duration
+    if kind == "PING":
+        packets = draw(rng, spec.get("packets"), [60, 120])
+        return f"ping -c {packets} {device['other_vm_ip']}", packets
+    duration = draw(rng, spec.get("duration"), 60)
+    return spec["command"].format(duration=duration, **device), duration
+
+def build_timeline(scenario):
+    # Planning reproductible : liste de dicts triée par instant de départ
+    rng = random.Random(scenario.get("seed", 0))
+    devices = scenario["devices"]
+    horizon = scenario.get("duration", 3600)
+    busy = {}
+    timeline = []
+
+    def free(resource, start, length):
+        return all(start + length + RESOURCE_GAP <= s or e + RESOURCE_GAP <= start
+                   for s, e in busy.get(resource, []))
+
+    for spec in scenario["events"]:
+        kind = spec["type"]
+        wanted = "telnet" if kind == "LINK_FLAP" else "ssh"
+        targets = spec.get("targets") or [name for name, device in devices.items()
+                                          if device["kind"] == wanted]
+        starts = spec.get("at")
+        count = len(starts) if starts is not None else spec.get("count", 1)
+        for i in range(count):
+            target = rng.choice(targets)
+            device = devices[target]
+            interface = ""
+            if kind == "LINK_FLAP":
+                interface = rng.choice(spec.get("interfaces") or device["interfaces"])
+                length = draw(rng, spec.get("down"), [20, 40])
+                command = f"shutdown / {length}s / no shutdown"
+                resource = (target, interface)
+            else:
+                command, length = event_command(rng, spec, device)
+                resource = (target, kind)
+            if starts is not None:
+                # instant imposé : refusé s'il chevauche un événement sur la même ressource
+                start = starts[i]
+                if not free(resource, start, length):
+                    where = " ".join(filter(None, (target, interface)))
+                    print(f"[PLANNING] {kind} sur {where} à {start}s refusé : "
+                          f"ressource déjà occupée")
+                    continue
+            else:
+                for _ in range(PLACEMENT_TRIES):
+                    start = rng.uniform(0, max(horizon - length, 0))
+                    if free(resource, start, length):
+                        break
+                else:
+                    print(f"[PLANNING] {kind} sur {target} abandonné : ressource toujours occupée")
+                    continue
+            busy.setdefault(resource, []).append((start, start + length))
+            timeline.append({"type": kind, "target": target, "interface": interface,
+                             "command": command, "length": length, "offset": round(start, 3)})
+
+    timeline.sort(key=lambda event: (event["offset"], event["target"], event["interface"]))
+    for event_id, event in enumerate(timeline, 1):
+        event["event_id"] = event_id
+    return timeline
+
+def timestamp(t):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t)) + f".{int(t % 1 * 1000):03d}"
+
+class EventLog:
+
+    def __init__(self, path=EVENTS_LOG):
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, newline="") as f:
+                header = next(csv.reader(f), None)
+            if header is not None and header != EVENT_FIELDS:
+                # journal d'une version précédente : mis de côté, pas complété
+                os.replace(path, path + ".old")
+                print(f"[JOURNAL] ancien format, renommé en {path}.old")
+        self.csvfile = open(path, "a", newline="")
+        self.writer = csv.DictWriter(self.csvfile, fieldnames=EVENT_FIELDS)
+        if self.csvfile.tell() == 0:
+            self.writer.writeheader()
+
+    def write(self, event, scheduled, start, end, status, detail=""):
+        row = {"event_id": event["event_id"], "type": event["type"], "target": event["target"],
+               "interface": event["interface"], "command": event["command"],
+               "length": event["length"], "scheduled": timestamp(scheduled),
+               "start": timestamp(start) if start else "", "end": timestamp(end) if end else "",
+               "status": status, "detail": detail}
+        with self.lock:
+            self.writer.writerow(row)
+            self.csvfile.flush()
+
+    def close(self):
+        self.csvfile.close()
+
+def run_event(event, scenario, pool, log, scheduled):
+    device = scenario["devices"][event["target"]]
+    times = {}
+    print(f"[{timestamp(time.time())}] #{event['event_id']} {event['type']} "
+          f"{event['target']} {event['interface']} : {event['command']}")
+    try:
+        if event["type"] == "LINK_FLAP":
+            session = pool.telnet(device["host"], device["port"])
+            link_flap(session, event["interface"], event["length"],
+                      on_down=lambda: times.setdefault("start", time.time()),
+                      on_up=lambda: times.setdefault("end", time.time()),
+                      save=scenario.get("save_config", True))
+            status, detail = "OK", ""
+        else:
+            session = pool.ssh(device["host"], device["user"], device["password"])
+            out, err, code = session.run(event["command"],
+                                         on_start=lambda: times.setdefault("start", time.time()))
+            times["end"] = time.time()
+            status = "OK" if code == 0 else "ERROR"
+            detail = "" if code == 0 else f"exit code={code}, stderr={err.strip()[:200]}"
+    except Exception as e:
+        status, detail = "FAILED", f"{type(e).__name__}: {e}"
+        if "start" in times:
+            # commencé puis interrompu : fin à l'instant de l'échec
+            times.setdefault("end", time.time())
+    log.write(event, scheduled, times.get("start"), times.get("end"), status, detail)
+    if status != "OK":
+        print(f"    [ERREUR] #{event['event_id']} {detail}")
+
+def run_scenario(scenario, log_path=EVENTS_LOG, max_parallel=None, time_scale=1.0):
+    # Lance chaque événement à son instant (offset * time_scale après le
+    # départ) ; bloque jusqu'à la fin du dernier
+    timeline = build_timeline(scenario)
+    max_parallel = max_parallel or scenario.get("max_parallel", MAX_PARALLEL)
+    pool = SessionPool()
+    log = EventLog(log_path)
+    print(f"[SCÉNARIO] {len(timeline)} événements, {max_parallel} en parallèle au plus")
+    origin = time.time()
+    origin_mono = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+            for event in timeline:
+                delay = origin_mono + event["offset"] * time_scale - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(run_event, event, scenario, pool, log,
+                                origin + event["offset"] * time_scale)
+    finally:
+        pool.close()
+        log.close()
+    return timeline
+
+def main():
+    parser = argparse.ArgumentParser(description="Injection d'anomalies pilotée par scénario")
+    parser.add_argument("scenario", help="fichier de scénario JSON")
+    parser.add_argument("--seed", type=int, default=None, help="remplace la graine du scénario")
+    parser.add_argument("--log", default=EVENTS_LOG, help="journal CSV des événements")
+    parser.add_argument("--max-parallel", type=int, default=None)
+    parser.add_argument("--dry-run", action="store_true",
+                        help="affiche le planning sans rien injecter")
+    args = parser.parse_args()
+
+    scenario = load_scenario(args.scenario)
+    if args.seed is not None:
+        scenario["seed"] = args.seed
+    if args.dry_run:
+        for event in build_timeline(scenario):
+            print(f"{event['offset']:>9.1f}s  #{event['event_id']:<4} {event['type']:<9} "
+                  f"{event['target']:<8} {event['interface']:<7} {event['command']}")
+        return
+    run_scenario(scenario, args.log, args.max_parallel)
+
+if __name__ == "__main__":
+    main()
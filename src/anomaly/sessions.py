@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+import telnetlib
+import threading
+import time
+import paramiko
+
+# Sessions persistantes vers les équipements du lab, partagées entre les
+# threads de la simulation :
+#   - SSH : une connexion paramiko par VM, chaque commande ouvre un canal sur
+#     la même connexion (multiplexage), au plus MAX_SSH_CHANNELS à la fois ;
+#     reconnexion automatique si la connexion est tombée
+#   - Telnet : une session console par routeur, protégée par un verrou ; un
+#     bloc de commandes de configuration passe en une fois et le verrou est
+#     relâché pendant les attentes, donc plusieurs interfaces d'un même
+#     routeur peuvent être en panne en même temps
+
+SSH_TIMEOUT = 5
+# sshd limite à 10 sessions par connexion (MaxSessions)
+MAX_SSH_CHANNELS = 8
+TELNET_TIMEOUT = 5
+# Essais du "no shutdown" de fin de coupure, espacés de RESTORE_DELAY secondes
+RESTORE_TRIES = 5
+RESTORE_DELAY = 5
+
+class SshSession:
+
+    def __init__(self, host, user, password, max_channels=MAX_SSH_CHANNELS):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.client = None
+        self.lock = threading.Lock()
+        self.channels = threading.BoundedSemaphore(max_channels)
+
+    def connect(self):
+        # (ré)ouvre la connexion si besoin ; appelé sous self.lock
+        transport = self.client.get_transport() if self.client else None
+        if transport is not None and transport.is_active():
+            return self.client
+        if self.client is not None:
+            self.client.close()
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(self.host, username=self.user, password=self.password,
+                       timeout=SSH_TIMEOUT)
+        client.get_transport().set_keepalive(30)
+        self.client = client
+        return client
+
+    def run(self, cmd, on_start=None):
+        # -> (stdout, stderr, exit code) ; on_start() est appelé dès que la
+        # commande est lancée sur la VM (horodatage du début de l'événement)
+        with self.channels:
+            for attempt in (1, 2):
+                with self.lock:
+                    client = self.connect()
+                try:
+                    stdin, stdout, stderr = client.exec_command(cmd)
+                    break
+                except (paramiko.SSHException, EOFError, OSError):
+                    # connexion coupée entre deux commandes : une seule reprise
+                    with self.lock:
+                        if self.client is client:
+                            client.close()
+                            self.client = None
+                    if attempt == 2:
+                        raise
+            if on_start is not None:
+                on_start()
+            exit_code = stdout.channel.recv_exit_status()
+            return stdout.read().decode(), stderr.read().decode(), exit_code
+
+    def close(self):
+        with self.lock:
+            if self.client is not None:
+                self.client.close()
+                self.client = None
+
+class TelnetSession:
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.tn = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if self.tn is None:
+            self.tn = telnetlib.Telnet(self.host, self.port, timeout=TELNET_TIMEOUT)
+            # réveille la console et attend le prompt privilégié
+            self.tn.write(b"\r\n")
+            self.tn.read_until(b"#", timeout=TELNET_TIMEOUT)
+        return self.tn
+
+    def send(self, tn, line, prompt):
+        tn.write(line.encode("ascii") + b"\r\n")
+        data = tn.read_until(prompt, timeout=TELNET_TIMEOUT)
+        if not data.endswith(prompt):
+            raise TimeoutError(f"Pas de prompt {prompt!r} après '{line}' sur "
+                               f"{self.host}:{self.port}")
+
+    def configure(self, interface, commands, save=True):
+        # "conf t / interface X / <commands> / end [/ wr]" en un seul bloc
+        with self.lock:
+            for attempt in (1, 2):
+                try:
+                    tn = self.connect()
+                    self.send(tn, "conf t", b"(config)#")
+                    self.send(tn, f"interface {interface}", b"(config-if)#")
+                    for command in commands:
+                        self.send(tn, command, b"(config-if)#")
+                    self.send(tn, "end", b"#")
+                    if save:
+                        self.send(tn, "wr", b"#")
+                    return
+                except (EOFError, OSError, TimeoutError):
+                    # console fermée ou désynchronisée : nouvelle session
+                    self.close_locked()
+                    if attempt == 2:
+                        raise
+
+    def close_locked(self):
+        if self.tn is not None:
+            try:
+                self.tn.close()
+            finally:
+                self.tn = None
+
+    def close(self):
+        with self.lock:
+            self.close_locked()
+
+class SessionPool:
+    # Une session par équipement, créée à la première utilisation
+
+    def __init__(self):
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def ssh(self, host, user, password):
+        key = ("ssh", host, user)
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None:
+                session = self.sessions[key] = SshSession(host, user, password)
+        return session
+
+    def telnet(self, host, port):
+        key = ("telnet", host, port)
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None:
+                session = self.sessions[key] = TelnetSession(host, port)
+        return session
+
+    def close(self):
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+        for session in sessions:
+            session.close()
+
+def restore_interface(session, interface, save=True):
+    for attempt in range(1, RESTORE_TRIES + 1):
+        try:
+            session.configure(interface, ["no shutdown"], save)
+            return
+        except (EOFError, OSError, TimeoutError) as e:
+            if attempt == RESTORE_TRIES:
+                raise
+            print(f"    [RESTAURATION] {interface} sur {session.host} : {e}, "
+                  f"nouvel essai dans {RESTORE_DELAY}s")
+            time.sleep(RESTORE_DELAY)
+
+def link_flap(session, interface, down_time, on_down=None, on_up=None, save=True):
+    # shutdown, attente de down_time secondes (session libre pendant ce
+    # temps), no shutdown ; le no shutdown est tenté quoi qu'il arrive (même
+    # si le shutdown a échoué en cours de route) pour ne jamais laisser
+    # l'interface coupée
+    try:
+        session.configure(interface, ["shutdown"], save)
+        if on_down is not None:
+            on_down()
+        time.sleep(down_time)
+    finally:
+        restore_interface(session, interface, save)
+        if on_up is not None:
+            on_up()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+import argparse
+import ast
+import asyncio
+import bisect
+import json
+import os
+import random
+import threading
+import time
+from pyasn1.codec.ber import decoder, encoder
+from pysnmp.proto import api, rfc1902, rfc1905
+
+# Simulated SNMP agents for the poller benchmark: one UDP endpoint per device
+# on a loopback address (127.0.x.y), answering GET, GETNEXT and GETBULK for
+# the OIDs of the poller's DEVICES templates plus an interface table
+# (ifDescr, ifName, status, HC octet, error and discard counters) of
+# FARM_INTERFACES interfaces. Latency, jitter and dropped requests (timeouts)
+# can be injected per request.
+
+POLLER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           "..", "telemetry", "snmp_poller.py")
+FARM_PORT = 16100
+FARM_NETWORK = "127.0"
+
+FARM_INTERFACES = 4
+# Interface table columns -> simulated column name
+IF_COLUMNS = {
+    "1.3.6.1.2.1.2.2.1.2": "ifDescr",
+    "1.3.6.1.2.1.2.2.1.7": "ifAdminStatus",
+    "1.3.6.1.2.1.2.2.1.8": "ifOperStatus",
+    "1.3.6.1.2.1.2.2.1.13": "ifInDiscards",
+    "1.3.6.1.2.1.2.2.1.14": "ifInErrors",
+    "1.3.6.1.2.1.2.2.1.19": "ifOutDiscards",
+    "1.3.6.1.2.1.2.2.1.20": "ifOutErrors",
+    "1.3.6.1.2.1.31.1.1.1.1": "ifName",
+    "1.3.6.1.2.1.31.1.1.1.6": "ifHCInOctets",
+    "1.3.6.1.2.1.31.1.1.1.10": "ifHCOutOctets",
+}
+# Interface counter growth, bytes per second
+COUNTER_RATE = 125000
+# Error and discard counter growth, per second
+ERROR_RATE = 0.5
+
+def load_device_templates(path=POLLER_PATH):
+    # DEVICES from snmp_poller.py, read with ast so the poller (and pysnmp's
+    # hlapi) is not imported in the benchmark process
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == "DEVICES"
+                                                for t in node.targets):
+            return ast.literal_eval(node.value)
+    raise ValueError(f"No DEVICES dict in {path}")
+
+def farm_devices(count, templates=None):
+    # `count` devices cycling over the templates, one loopback address each
+    templates = templates or load_device_templates()
+    names = list(templates)
+    devices = {}
+    for i in range(count):
+        template = templates[names[i % len(names)]]
+        device = json.loads(json.dumps(template))
+        device["ip"] = f"{FARM_NETWORK}.{1 + i // 250}.{1 + i % 250}"
+        device.setdefault("snmp_if_index", 1)
+        device.setdefault("farm_interfaces", FARM_INTERFACES)
+        devices[f"{names[i % len(names)]}-{i + 1}"] = device
+    return devices
+
+def metric_value(metric, device_state, now):
+    # value (pysnmp type) for a metric name of the DEVICES templates
+    if metric == "sysUpTime":
+        return rfc1902.TimeTicks(int((now - device_state["booted"]) * 100))
+    if metric in ("memTotal", "swapTotal"):
+        return rfc1902.Integer(4000000)
+    if metric in ("memUsed", "memFree", "swapAvail", "memPoolUsed", "memPoolFree"):
+        return rfc1902.Integer(random.randint(500000, 3500000))
+    return rfc1902.Integer(random.randint(0, 100))
+
+def oid_key(oid):
+    return tuple(int(part) for part in oid.strip(".").split("."))
+
+def interface_value(column, if_index, device_state, now):
+    # value of an interface table cell; the last interface is down
+    if column in ("ifDescr", "ifName"):
+        return rfc1902.OctetString(f"eth{if_index - 1}")
+    if column == "ifAdminStatus":
+        return rfc1902.Integer(1)
+    if column == "ifOperStatus":
+        return rfc1902.Integer(2 if if_index == device_state["down"] else 1)
+    elapsed = now - device_state["booted"]
+    if column.startswith("ifHC"):
+        return rfc1902.Counter64(int(elapsed * COUNTER_RATE * if_index) % 2 ** 64)
+    return rfc1902.Counter32(int(elapsed * ERROR_RATE) % 2 ** 32)
+
+class FarmAgent(asyncio.DatagramProtocol):
+
+    def __init__(self, farm, name, device):
+        self.farm = farm
+        self.name = name
+        self.state = {"booted": time.time() - random.randint(1000, 100000),
+                      "down": device.get("farm_interfaces", FARM_INTERFACES)}
+        self.values = {oid.strip("."): metric for metric, oid in device["oids"].items()}
+        for if_index in range(1, device.get("farm_interfaces", FARM_INTERFACES) + 1):
+            for column, name in IF_COLUMNS.items():
+                self.values[f"{column}.{if_index}"] = (name, if_index)
+        # sorted OIDs for GETNEXT / GETBULK
+        self.keys = sorted(oid_key(oid) for oid in self.values)
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def value(self, oid, now):
+        metric = self.values.get(oid)
+        if metric is None:
+            return rfc1905.noSuchObject
+        if isinstance(metric, tuple):
+            return interface_value(*metric, self.state, now)
+        return metric_value(metric, self.state, now)
+
+    def next_oid(self, oid):
+        # first OID after `oid`, None past the last one
+        position = bisect.bisect_right(self.keys, oid_key(oid))
+        if position == len(self.keys):
+            return None
+        return ".".join(map(str, self.keys[position]))
+
+    def next_var_bind(self, oid, now):
+        next_oid = self.next_oid(str(oid))
+        if next_oid is None:
+            return oid, rfc1905.endOfMibView
+        return rfc1902.ObjectName(next_oid), self.value(next_oid, now)
+
+    def bulk_var_binds(self, oids, non_repeaters, max_repetitions, now):
+        # non-repeaters once, then max_repetitions rows of the repeaters
+        var_binds = [self.next_var_bind(oid, now) for oid in oids[:non_repeaters]]
+        current = list(oids[non_repeaters:])
+        for _ in range(max_repetitions if current else 0):
+            row = [self.next_var_bind(oid, now) for oid in current]
+            var_binds.extend(row)
+            current = [oid for oid, _ in row]
+            if all(val is rfc1905.endOfMibView for _, val in row):
+                break
+        return var_binds
+
+    def datagram_received(self, data, addr):
+        received = time.time()
+        farm = self.farm
+        farm.requests += 1
+        if farm.drop_rate and random.random() < farm.drop_rate:
+            farm.dropped += 1
+            return
+        p_mod = api.protoModules[api.protoVersion2c]
+        try:
+            request, _ = decoder.decode(data, asn1Spec=p_mod.Message())
+        except Exception:
+            farm.errors += 1
+            return
+        response = p_mod.apiMessage.getResponse(request)
+        request_pdu = p_mod.apiMessage.getPDU(request)
+        response_pdu = p_mod.apiMessage.getPDU(response)
+        oids = [oid for oid, _ in p_mod.apiPDU.getVarBinds(request_pdu)]
+        if request_pdu.isSameTypeWith(p_mod.GetBulkRequestPDU()):
+            var_binds = self.bulk_var_binds(
+                oids, int(p_mod.apiBulkPDU.getNonRepeaters(request_pdu)),
+                int(p_mod.apiBulkPDU.getMaxRepetitions(request_pdu)), received)
+        elif request_pdu.isSameTypeWith(p_mod.GetNextRequestPDU()):
+            var_binds = [self.next_var_bind(oid, received) for oid in oids]
+        else:
+            var_binds = [(oid, self.value(str(oid), received)) for oid in oids]
+        p_mod.apiPDU.setVarBinds(response_pdu, var_binds)
+        payload = encoder.encode(response)
+
+        delay = farm.latency + (random.uniform(-farm.jitter, farm.jitter) if farm.jitter else 0)
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self.respond, payload, addr, received)
+        else:
+            self.respond(payload, addr, received)
+
+    def respond(self, payload, addr, received):
+        self.transport.sendto(payload, addr)
+        sent = time.time()
+        self.farm.log.append((self.name, received, sent))
+        self.farm.last_response[self.name] = sent
+
+class AgentFarm:
+    # Runs every agent on one asyncio loop in a background thread;
+    # log holds (device name, request received, response sent) per answer
+
+    def __init__(self, devices, port=FARM_PORT, latency=0.0, jitter=0.0, drop_rate=0.0):
+        self.devices = devices
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.requests = 0
+        self.dropped = 0
+        self.errors = 0
+        self.log = []
+        self.last_response = {}
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="agent-farm",
+                                       daemon=True)
+        self.transports = []
+
+    async def open(self):
+        for name, device in self.devices.items():
+            transport, _ = await self.loop.create_datagram_endpoint(
+                lambda name=name, device=device: FarmAgent(self, name, device),
+                local_addr=(device["ip"], self.port))
+            self.transports.append(transport)
+
+    def start(self):
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.open(), self.loop).result()
+        return self
+
+    def stop(self):
+        for transport in self.transports:
+            self.loop.call_soon_threadsafe(transport.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated SNMP agent farm on loopback addresses")
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--port", type=int, default=FARM_PORT)
+    parser.add_argument("--interfaces", type=int, default=FARM_INTERFACES,
+                        help="interfaces per agent")
+    parser.add_argument("--latency", type=float, default=0.0, help="response delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- random delay in seconds")
+    parser.add_argument("--drop-rate", type=float, default=0.0,
+                        help="fraction of requests left unanswered")
+    parser.add_argument("--write-devices", default=None,
+                        help="write the farm's devices as JSON for snmp_poller.py --devices")
+    args = parser.parse_args()
+
+    devices = farm_devices(args.devices)
+    for device in devices.values():
+        device["farm_interfaces"] = args.interfaces
+    if args.write_devices:
+        with open(args.write_devices, "w", encoding="utf-8") as f:
+            json.dump(devices, f, indent=1)
+    farm = AgentFarm(devices, args.port, args.latency, args.jitter, args.drop_rate).start()
+    print(f"{len(devices)} agents answering on {FARM_NETWORK}.x.y:{args.port}")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"{farm.requests} requests, {farm.dropped} dropped, {farm.errors} errors")
+    except KeyboardInterrupt:
+        farm.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+import socket
+import struct
+import time
+from array import array
+import numpy as np
+from pyasn1.codec.ber import encoder
+from pysnmp.proto import api, rfc1902
+
+# Load generators for the collector benchmarks. Packets are encoded once and
+# only a few bytes are patched per send (sequence numbers, addresses), so the
+# sender itself is not the bottleneck. Every record carries a sequence number
+# that the benchmark finds again in the collector output:
+#   NetFlow: src_addr = FLOW_BASE_ADDR + seq
+#   traps:   a "seq=NNNNNNNNNN" OctetString varbind (SEQ_OID)
+
+FLOW_BASE_ADDR = 0x0A000000  # 10.0.0.0
+FLOWS_PER_PACKET = 30
+# v9 template re-sent every N packets, as exporters do
+TEMPLATE_REFRESH = 20
+V9_TEMPLATE_ID = 256
+
+SEQ_OID = "1.3.6.1.4.1.99999.1.0"
+SEQ_PLACEHOLDER = b"seq=0000000000"
+AGENT_BASE_ADDR = 0x0A010000  # 10.1.0.0
+AGENT_PLACEHOLDER = "10.255.255.254"
+
+# Wire layouts written from the NetFlow v5 / v9 export formats, on purpose not
+# imported from flow_decoder.py: a layout bug in the decoder then shows up in
+# the benchmark (and in test_flow_decoder.py) instead of cancelling out
+V5_HEADER = struct.Struct("!HHIIIIBBH")
+V5_RECORD = np.dtype([
+    ("src_addr", ">u4"), ("dst_addr", ">u4"), ("nexthop", ">u4"),
+    ("input", ">u2"), ("output", ">u2"),
+    ("packets", ">u4"), ("octets", ">u4"),
+    ("first", ">u4"), ("last", ">u4"),
+    ("src_port", ">u2"), ("dst_port", ">u2"),
+    ("pad1", "u1"), ("tcp_flags", "u1"), ("proto", "u1"), ("tos", "u1"),
+    ("src_as", ">u2"), ("dst_as", ">u2"),
+    ("src_mask", "u1"), ("dst_mask", "u1"), ("pad2", ">u2")
+])
+
+V9_HEADER = struct.Struct("!HHIIII")
+SET_HEADER = struct.Struct("!HH")
+# (information element, length): src/dst addr, src/dst port, proto, packets, octets
+V9_FIELDS = [(8, 4), (12, 4), (7, 2), (11, 2), (4, 1), (2, 4), (1, 4)]
+V9_RECORD = np.dtype([
+    ("src_addr", ">u4"), ("dst_addr", ">u4"), ("src_port", ">u2"), ("dst_port", ">u2"),
+    ("proto", "u1"), ("packets", ">u4"), ("octets", ">u4")
+])
+
+def flow_seq(src_ip):
+    return struct.unpack("!I", socket.inet_aton(src_ip))[0] - FLOW_BASE_ADDR
+
+def flow_records(dtype, count, seed=1):
+    # plausible flow mix: mostly TCP/UDP, some ICMP and a few suspicious ports
+    rng = np.random.default_rng(seed)
+    records = np.zeros(count, dtype=dtype)
+    records["dst_addr"] = 0x14000001 + rng.integers(0, 256, count)  # 20.0.0.x
+    records["src_port"] = rng.integers(1024, 65535, count)
+    records["dst_port"] = rng.choice([80, 443, 53, 22, 23, 445, 8080], count,
+                                     p=[0.35, 0.35, 0.12, 0.08, 0.04, 0.03, 0.03])
+    records["proto"] = rng.choice([6, 17, 1], count, p=[0.7, 0.25, 0.05])
+    records["packets"] = rng.integers(1, 1000, count)
+    records["octets"] = records["packets"] * rng.integers(40, 1500, count)
+    return records
+
+class NetflowPackets:
+    # packet(i) -> bytes of the i-th export packet, flows i*FLOWS_PER_PACKET...
+
+    def __init__(self, version=5, flows_per_packet=FLOWS_PER_PACKET):
+        if version not in (5, 9):
+            raise ValueError("NetFlow version must be 5 or 9")
+        self.version = version
+        self.flows_per_packet = flows_per_packet
+        self.records = flow_records(V5_RECORD if version == 5 else V9_RECORD, flows_per_packet)
+        self.offsets = np.arange(flows_per_packet, dtype=np.uint32)
+        self.started = time.time()
+        if version == 9:
+            fields = b"".join(struct.pack("!HH", *field) for field in V9_FIELDS)
+            body = struct.pack("!HH", V9_TEMPLATE_ID, len(V9_FIELDS)) + fields
+            self.template_set = SET_HEADER.pack(0, 4 + len(body)) + body
+
+    def packet(self, index):
+        self.records["src_addr"] = FLOW_BASE_ADDR + index * self.flows_per_packet + self.offsets
+        now = time.time()
+        uptime = int((now - self.started) * 1000)
+        if self.version == 5:
+            header = V5_HEADER.pack(5, self.flows_per_packet, uptime, int(now),
+                                    int((now % 1) * 1e9), index * self.flows_per_packet, 0, 0, 0)
+            return header + self.records.tobytes()
+
+        data = self.records.tobytes()
+        data += b"\0" * (-len(data) % 4)
+        sets = SET_HEADER.pack(V9_TEMPLATE_ID, 4 + len(data)) + data
+        count = self.flows_per_packet
+        if index % TEMPLATE_REFRESH == 0:
+            sets = self.template_set + sets
+            count += 1
+        return V9_HEADER.pack(9, count, uptime, int(now), index, 1) + sets
+
+def ip_int_bytes(value):
+    return struct.pack("!I", value)
+
+class TrapPackets:
+    # SNMPv2c linkDown traps from `agents` distinct agent addresses
+
+    def __init__(self, agents=100, community="public"):
+        self.agents = agents
+        p_mod = api.protoModules[api.protoVersion2c]
+        pdu = p_mod.TrapPDU()
+        p_mod.apiTrapPDU.setDefaults(pdu)
+        p_mod.apiTrapPDU.setVarBinds(pdu, [
+            (p_mod.ObjectIdentifier("1.3.6.1.2.1.1.3.0"), rfc1902.TimeTicks(12345)),
+            (p_mod.ObjectIdentifier("1.3.6.1.6.3.1.1.4.1.0"),
+             p_mod.ObjectIdentifier("1.3.6.1.6.3.1.1.5.3")),
+            (p_mod.ObjectIdentifier("1.3.6.1.2.1.2.2.1.1.3"), rfc1902.Integer(3)),
+            (p_mod.ObjectIdentifier("1.3.6.1.2.1.2.2.1.2.3"), rfc1902.OctetString("eth0")),
+            (p_mod.ObjectIdentifier("1.3.6.1.6.3.18.1.3.0"), rfc1902.IpAddress(AGENT_PLACEHOLDER)),
+            (p_mod.ObjectIdentifier(SEQ_OID), rfc1902.OctetString(SEQ_PLACEHOLDER)),
+        ])
+        message = p_mod.Message()
+        p_mod.apiMessage.setDefaults(message)
+        p_mod.apiMessage.setCommunity(message, community)
+        p_mod.apiMessage.setPDU(message, pdu)
+        self.template = bytearray(encoder.encode(message))
+        self.seq_at = self.template.index(SEQ_PLACEHOLDER) + 4
+        self.agent_at = self.template.index(b"\x40\x04" + socket.inet_aton(AGENT_PLACEHOLDER)) + 2
+
+    def packet(self, index):
+        self.template[self.seq_at:self.seq_at + 10] = b"%010d" % index
+        self.template[self.agent_at:self.agent_at + 4] = ip_int_bytes(
+            AGENT_BASE_ADDR + index % self.agents)
+        return bytes(self.template)
+
+def send_paced(packets, target, rate, duration=None, count=None, sent_at=None):
+    # Sends packets.packet(0), packet(1)... to target at `rate` packets per
+    # second, for `duration` seconds or `count` packets. Returns the send
+    # time (time.time()) of every packet, appended to `sent_at` if given so
+    # that it can be read while the load runs.
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * 1024 * 1024)
+    sent_at = array("d") if sent_at is None else sent_at
+    start = time.monotonic()
+    wall_start = time.time()
+    index = 0
+    try:
+        while True:
+            elapsed = time.monotonic() - start
+            if duration is not None and elapsed >= duration:
+                break
+            due = int(elapsed * rate) + 1
+            if count is not None:
+                due = min(due, count)
+                if index >= count:
+                    break
+            if index >= due:
+                time.sleep(min(0.001, 1.0 / rate))
+                continue
+            send_time = wall_start + (time.monotonic() - start)
+            while index < due:
+                try:
+                    sock.sendto(packets.packet(index), target)
+                except BlockingIOError:
+                    break
+                sent_at.append(send_time)
+                index += 1
+    finally:
+        sock.close()
+    return sent_at
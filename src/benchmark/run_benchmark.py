@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+import argparse
+import glob
+import json
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from agent_farm import AgentFarm, FARM_INTERFACES, FARM_PORT, farm_devices
+from load_generators import FLOWS_PER_PACKET, NetflowPackets, TrapPackets, flow_seq, send_paced
+
+# Localhost benchmarks of the collectors. Each run starts the collector as a
+# subprocess in a scratch directory, drives it with a load generator (or the
+# agent farm for the poller), follows its CSV output while the load runs, and
+# appends one JSON line of results to RESULTS_FILE so runs of different
+# commits can be compared (--baseline).
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(os.path.dirname(BENCH_DIR))
+TELEMETRY_DIR = os.path.join(REPO_DIR, "src", "telemetry")
+RESULTS_FILE = os.path.join(BENCH_DIR, "benchmark_results.jsonl")
+
+# Output polled every TAIL_INTERVAL seconds; the run ends once no new row
+# has appeared for DRAIN_IDLE seconds after the load (CsvSink flushes every
+# second), or after DRAIN_MAX seconds
+TAIL_INTERVAL = 0.02
+DRAIN_IDLE = 3.0
+DRAIN_MAX = 30.0
+SAMPLE_INTERVAL = 0.5
+STARTUP_TIMEOUT = 15.0
+
+NETFLOW_SRC = re.compile(r"Src:(\d+\.\d+\.\d+\.\d+):")
+TRAP_SEQ = re.compile(r"seq=(\d{10})")
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+def process_tree(pid):
+    # pid and all its descendants, from /proc/<pid>/task/*/children
+    pids = [pid]
+    for current in pids:
+        for children in glob.glob(f"/proc/{current}/task/*/children"):
+            try:
+                with open(children) as f:
+                    pids.extend(int(child) for child in f.read().split())
+            except OSError:
+                pass
+    return pids
+
+def process_usage(pid):
+    # -> (cpu seconds, rss bytes) of one process, or None once it has exited
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    # utime and stime are fields 14 and 15 of stat, rss field 24
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS, int(fields[21]) * PAGE_SIZE
+
+class ProcessMonitor(threading.Thread):
+    # CPU time and RSS of a collector and its worker processes
+
+    def __init__(self, pid):
+        super().__init__(name="process-monitor", daemon=True)
+        self.pid = pid
+        self.cpu = {}
+        self.max_rss = 0
+        self.started = time.monotonic()
+        self.stopped = threading.Event()
+
+    def sample(self):
+        rss = 0
+        for pid in process_tree(self.pid):
+            usage = process_usage(pid)
+            if usage is not None:
+                self.cpu[pid] = usage[0]
+                rss += usage[1]
+        self.max_rss = max(self.max_rss, rss)
+
+    def run(self):
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            self.sample()
+
+    def stop(self):
+        self.sample()
+        self.stopped.set()
+        self.join()
+        elapsed = time.monotonic() - self.started
+        cpu = sum(self.cpu.values())
+        return {"cpu_seconds": round(cpu, 2),
+                "cpu_percent": round(100 * cpu / elapsed, 1) if elapsed else 0.0,
+                "max_rss_mb": round(self.max_rss / 1e6, 1)}
+
+class OutputTailer(threading.Thread):
+    # Follows every file matching `pattern` (rotated and per-worker outputs
+    # included) and calls handle(line, seen) for each complete new line
+    # except headers; `seen` is when the line was first read
+
+    def __init__(self, pattern, handle):
+        super().__init__(name="output-tailer", daemon=True)
+        self.pattern = pattern
+        self.handle = handle
+        self.offsets = {}
+        self.partial = {}
+        self.last_row = None
+        self.stopped = threading.Event()
+
+    def poll(self):
+        seen = time.time()
+        for path in glob.glob(self.pattern):
+            offset = self.offsets.get(path, 0)
+            try:
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    data = f.read()
+            except OSError:
+                continue
+            if not data:
+                continue
+            self.offsets[path] = offset + len(data)
+            lines = (self.partial.pop(path, b"") + data).split(b"\n")
+            if lines[-1]:
+                self.partial[path] = lines[-1]
+            for line in lines[:-1]:
+                if line and not line.startswith(b"timestamp,"):
+                    self.handle(line.decode("utf-8", "replace"), seen)
+                    self.last_row = seen
+
+    def run(self):
+        while not self.stopped.wait(TAIL_INTERVAL):
+            self.poll()
+
+    def drain(self, load_end):
+        # wait for the collector to catch up, then stop following
+        deadline = time.time() + DRAIN_MAX
+        while time.time() < deadline:
+            last = self.last_row or load_end
+            if time.time() - max(last, load_end) >= DRAIN_IDLE:
+                break
+            time.sleep(TAIL_INTERVAL)
+        self.stopped.set()
+        self.join()
+        self.poll()
+
+def percentiles(values):
+    # latency summary in milliseconds
+    if not values:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    values = sorted(values)
+
+    def at(q):
+        return round(1000 * values[min(len(values) - 1, int(q * len(values)))], 2)
+    return {"p50_ms": at(0.50), "p95_ms": at(0.95), "p99_ms": at(0.99),
+            "max_ms": round(1000 * values[-1], 2)}
+
+def start_collector(script, args, workdir):
+    log = open(os.path.join(workdir, "collector.log"), "wb")
+    process = subprocess.Popen([sys.executable, "-u", os.path.join(TELEMETRY_DIR, script)] + args,
+                               cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+    process.log = log
+    return process
+
+def wait_for_output(process, workdir, marker):
+    # until the collector has printed `marker` (it is listening)
+    deadline = time.time() + STARTUP_TIMEOUT
+    path = os.path.join(workdir, "collector.log")
+    while time.time() < deadline:
+        if process.poll() is not None:
+            break
+        with open(path, "rb") as f:
+            if marker in f.read():
+                return
+        time.sleep(0.05)
+    stop_collector(process)
+    with open(path, encoding="utf-8", errors="replace") as f:
+        output = f.read()
+    raise RuntimeError(f"Collector did not start:\n{output[-2000:]}")
+
+def stop_collector(process):
+    # SIGINT lets the collectors flush their sinks
+    if process.poll() is None:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    process.log.close()
+
+def throughput(sent, received, duration):
+    return {"sent": sent, "received": received,
+            "offered_per_s": round(sent / duration, 1) if duration else 0.0,
+            "ingested_per_s": round(received / duration, 1) if duration else 0.0,
+            "loss": round(1 - received / sent, 6) if sent else 0.0}
+
+def bench_netflow(args, workdir):
+    collector_args = ["--listen-ip", "127.0.0.1", "--port", str(args.port),
+                      "--workers", str(args.workers), "--decoder", args.decoder]
+    process = start_collector("netflow_collector.py", collector_args, workdir)
+    wait_for_output(process, workdir, b"Listening on")
+
+    packets = NetflowPackets(args.version, args.flows_per_packet)
+    sent_at = array("d")
+    latencies = []
+    seen = set()
+
+    def handle(line, when):
+        match = NETFLOW_SRC.search(line)
+        if match is None:
+            return
+        seq = flow_seq(match.group(1))
+        if seq in seen:
+            return
+        seen.add(seq)
+        index = seq // args.flows_per_packet
+        if index < len(sent_at):
+            latencies.append(when - sent_at[index])
+
+    monitor = ProcessMonitor(process.pid)
+    tailer = OutputTailer(os.path.join(workdir, "netflow_flows*.csv"), handle)
+    monitor.start()
+    tailer.start()
+    started = time.time()
+    send_paced(packets, ("127.0.0.1", args.port), args.rate, args.duration, sent_at=sent_at)
+    load_end = time.time()
+    tailer.drain(load_end)
+    usage = monitor.stop()
+    stop_collector(process)
+
+    sent = len(sent_at) * args.flows_per_packet
+    metrics = throughput(sent, len(seen), load_end - started)
+    metrics["packets_sent"] = len(sent_at)
+    metrics["packets_per_s"] = round(len(sent_at) / (load_end - started), 1)
+    metrics.update(percentiles(latencies))
+    metrics.update(usage)
+    return metrics
+
+def bench_traps(args, workdir):
+    listener_args = ["--listen-ip", "127.0.0.1", "--port", str(args.port)]
+    process = start_collector("snmp_trap_listener.py", listener_args, workdir)
+    wait_for_output(process, workdir, b"Agent is listening")
+    # the transport is opened right after the banner
+    time.sleep(0.5)
+
+    packets = TrapPackets(args.agents)
+    sent_at = array("d")
+    latencies = []
+    seen = set()
+    suppressed = [0]
+
+    def handle(line, when):
+        if ",trap_storm," in line:
+            suppressed[0] += int(line.split(",trap_storm,", 1)[1].split(",", 1)[0])
+            return
+        match = TRAP_SEQ.search(line)
+        if match is None:
+            return
+        seq = int(match.group(1))
+        if seq in seen:
+            return
+        seen.add(seq)
+        if seq < len(sent_at):
+            latencies.append(when - sent_at[seq])
+
+    monitor = ProcessMonitor(process.pid)
+    tailer = OutputTailer(os.path.join(workdir, "snmp_traps*.csv"), handle)
+    monitor.start()
+    tailer.start()
+    started = time.time()
+    send_paced(packets, ("127.0.0.1", args.port), args.rate, args.duration, sent_at=sent_at)
+    load_end = time.time()
+    tailer.drain(load_end)
+    usage = monitor.stop()
+    stop_collector(process)
+    # the storm summaries of still open windows are written on shutdown
+    tailer.poll()
+
+    metrics = throughput(len(sent_at), len(seen), load_end - started)
+    metrics["suppressed"] = suppressed[0]
+    # suppressed traps are accounted for, not lost
+    metrics["loss"] = (round(1 - (len(seen) + suppressed[0]) / len(sent_at), 6)
+                       if sent_at else 0.0)
+    metrics.update(percentiles(latencies))
+    metrics.update(usage)
+    return metrics
+
+def poll_cycles(log, interval):
+    # farm log -> durations of the poll cycles: answers grouped by the
+    # interval slot of their request, first request to last answer
+    if not log:
+        return []
+    origin = min(received for _, received, _ in log)
+    slots = {}
+    for _, received, sent in log:
+        slot = slots.setdefault(int((received - origin) // interval), [received, sent])
+        slot[0] = min(slot[0], received)
+        slot[1] = max(slot[1], sent)
+    return [sent - received for received, sent in slots.values()]
+
+def bench_poller(args, workdir):
+    devices = farm_devices(args.devices)
+    for device in devices.values():
+        device["interval"] = args.interval
+        device["farm_interfaces"] = args.interfaces
+    devices_path = os.path.join(workdir, "devices.json")
+    with open(devices_path, "w", encoding="utf-8") as f:
+        json.dump(devices, f, indent=1)
+    farm = AgentFarm(devices, args.port, args.latency, args.jitter, args.drop_rate).start()
+
+    poller_args = ["--devices", devices_path, "--port", str(args.port), "--jitter", "0"]
+    if args.use_async:
+        poller_args += ["--async", "--max-concurrency", str(args.max_concurrency)]
+    process = start_collector("snmp_poller.py", poller_args, workdir)
+    try:
+        wait_for_output(process, workdir, b"Starting")
+    except RuntimeError:
+        farm.stop()
+        raise
+
+    latencies = []
+    counts = {"rows": 0, "timeouts": 0}
+
+    def handle(line, when):
+        counts["rows"] += 1
+        if "returned None" in line:
+            counts["timeouts"] += 1
+            return
+        source = line.split(",", 2)[1]
+        answered = farm.last_response.get(source)
+        if answered is not None:
+            latencies.append(when - answered)
+
+    monitor = ProcessMonitor(process.pid)
+    tailer = OutputTailer(os.path.join(workdir, "snmp_poll*.csv"), handle)
+    monitor.start()
+    tailer.start()
+    started = time.time()
+    time.sleep(args.duration)
+    load_end = time.time()
+    # the poller never goes idle: stop it, then read what it flushed
+    usage = monitor.stop()
+    stop_collector(process)
+    tailer.drain(time.time())
+    farm.stop()
+
+    with open(os.path.join(workdir, "collector.log"), encoding="utf-8", errors="replace") as f:
+        late = sum(1 for line in f if "s late," in line)
+    cycles = poll_cycles(farm.log, args.interval)
+    metrics = {
+        "devices": len(devices),
+        "requests": farm.requests,
+        "requests_per_s": round(farm.requests / (load_end - started), 1),
+        "rows": counts["rows"],
+        "timeout_fraction": round(counts["timeouts"] / counts["rows"], 6) if counts["rows"] else 0.0,
+        "late_polls": late,
+        "cycles": len(cycles),
+        "cycle_mean_ms": round(1000 * sum(cycles) / len(cycles), 2) if cycles else None,
+        "cycle_max_ms": round(1000 * max(cycles), 2) if cycles else None,
+    }
+    metrics.update(percentiles(latencies))
+    metrics.update(usage)
+    return metrics
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_results(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def compare(result, baseline):
+    # relative change of every numeric metric against the baseline run
+    print(f"Compared with {baseline['commit']} ({baseline['timestamp']}):")
+    for name, value in result["metrics"].items():
+        previous = baseline["metrics"].get(name)
+        if not isinstance(value, (int, float)) or not isinstance(previous, (int, float)):
+            continue
+        change = f"{100 * (value - previous) / previous:+.1f}%" if previous else "n/a"
+        print(f"  {name:18} {previous:>12} -> {value:>12}  {change}")
+
+def find_baseline(results, result, commit):
+    # latest earlier run of the same benchmark and parameters, at `commit`
+    # ("last" for the most recent one)
+    for entry in reversed(results):
+        if entry["benchmark"] != result["benchmark"] or entry["params"] != result["params"]:
+            continue
+        if commit == "last" or entry["commit"] == commit:
+            return entry
+    return None
+
+BENCHMARKS = {"netflow": bench_netflow, "traps": bench_traps, "poller": bench_poller}
+
+def main():
+    parser = argparse.ArgumentParser(description="Localhost benchmarks of the collectors")
+    parser.add_argument("--duration", type=float, default=10.0, help="load duration in seconds")
+    parser.add_argument("--results", default=RESULTS_FILE, help="JSON lines results file")
+    parser.add_argument("--baseline", default=None,
+                        help="compare with an earlier run: a commit, or 'last'")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    commands = parser.add_subparsers(dest="benchmark", required=True)
+
+    netflow = commands.add_parser("netflow", help="netflow_collector.py under a NetFlow replay")
+    netflow.add_argument("--rate", type=float, default=2000, help="packets per second")
+    netflow.add_argument("--version", type=int, choices=[5, 9], default=5)
+    netflow.add_argument("--flows-per-packet", type=int, default=FLOWS_PER_PACKET)
+    netflow.add_argument("--port", type=int, default=29999)
+    netflow.add_argument("--workers", type=int, default=1)
+    netflow.add_argument("--decoder", choices=["builtin", "netflow"], default="builtin")
+
+    traps = commands.add_parser("traps", help="snmp_trap_listener.py under a trap blast")
+    traps.add_argument("--rate", type=float, default=500, help="traps per second")
+    traps.add_argument("--agents", type=int, default=100, help="distinct agent addresses")
+    traps.add_argument("--port", type=int, default=29162,
+                       help="listener port (162, the real one, needs root)")
+
+    poller = commands.add_parser("poller", help="snmp_poller.py against the agent farm")
+    poller.add_argument("--devices", type=int, default=100)
+    poller.add_argument("--port", type=int, default=FARM_PORT)
+    poller.add_argument("--interval", type=float, default=5, help="poll interval of the devices")
+    poller.add_argument("--interfaces", type=int, default=FARM_INTERFACES,
+                        help="interfaces per simulated device")
+    poller.add_argument("--latency", type=float, default=0.0)
+    poller.add_argument("--jitter", type=float, default=0.0)
+    poller.add_argument("--drop-rate", type=float, default=0.0)
+    poller.add_argument("--async", dest="use_async", action="store_true")
+    poller.add_argument("--max-concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    params = {name: value for name, value in vars(args).items()
+              if name not in ("benchmark", "results", "baseline", "keep")}
+    workdir = tempfile.mkdtemp(prefix=f"bench-{args.benchmark}-")
+    try:
+        metrics = BENCHMARKS[args.benchmark](args, workdir)
+    finally:
+        if args.keep:
+            print(f"Scratch directory kept: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    result = {"benchmark": args.benchmark,
+              "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+              "commit": git_commit(),
+              "params": params,
+              "metrics": metrics}
+    print(json.dumps(result, indent=1))
+    previous = load_results(args.results)
+    with open(args.results, "a", encoding="utf-8") as f:
+        f.write(json.dumps(result) + "\n")
+
+    if args.baseline:
+        baseline = find_baseline(previous, result, args.baseline)
+        if baseline is None:
+            print(f"No earlier '{args.benchmark}' run with these parameters for {args.baseline}")
+        else:
+            compare(result, baseline)
+
+if __name__ == "__main__":
+    main()
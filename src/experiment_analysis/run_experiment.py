@@ -0,0 +1,308 @@
+import argparse
+import glob
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import (average_precision_score, cohen_kappa_score, matthews_corrcoef,
+                             roc_auc_score)
+from sklearn.model_selection import StratifiedKFold
+from sklearn.naive_bayes import GaussianNB
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.tree import DecisionTreeClassifier
+
+# Campagne de validation croisée sans passer par le Weka Experimenter : les
+# parties CSV / colonnaires sont encodées une fois, partagées en mémoire avec
+# les workers, et chaque (dataset, algorithme, run, fold) est une tâche du
+# pool. Les résultats gardent le schéma Key_* / métriques des exports Weka
+# (csv-files/weka_experiment_*.csv) pour être lus par le notebook.
+
+# Algorithme Weka équivalent -> (Key_Scheme, classe, options) ; les options
+# sont toujours explicites, le notebook écarte les Bayes sans options
+SCHEMES = {
+    "bayes": ("sklearn.naive_bayes.GaussianNB", GaussianNB, {"var_smoothing": 1e-9}),
+    "lazy_IBk": ("sklearn.neighbors.KNeighborsClassifier", KNeighborsClassifier,
+                 {"n_neighbors": 1}),
+    "tree_J48": ("sklearn.tree.DecisionTreeClassifier", DecisionTreeClassifier,
+                 {"criterion": "entropy", "min_samples_leaf": 2, "random_state": 1}),
+    "tree_REPTree": ("sklearn.tree.DecisionTreeClassifier", DecisionTreeClassifier,
+                     {"min_samples_leaf": 2, "ccp_alpha": 0.001, "random_state": 1}),
+    "tree_RandomForest": ("sklearn.ensemble.RandomForestClassifier", RandomForestClassifier,
+                          {"n_estimators": 100, "min_samples_leaf": 1, "random_state": 1}),
+}
+
+# Préfixe de la colonne Algorithm des résultats, pour ne pas les mélanger
+# avec ceux de Weka dans les regroupements du notebook (sk_bayes != bayes)
+ALGORITHM_PREFIX = "sk_"
+
+INPUT_PATTERN = "merged_dataset_part*.csv"
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "csv-files")
+RUNS = 1
+FOLDS = 10
+# Attributs nominaux encodés en entiers, comme dans les ARFF
+NOMINAL_COLUMNS = ["source", "record_type", "metric"]
+# Seuil de confiance de Coverage_of_Test_Cases_By_Regions (comme Weka)
+COVERAGE_LEVEL = 0.95
+
+# Datasets partagés déjà attachés dans ce worker : nom -> (X, y)
+attached = {}
+
+def load_part(path):
+    # Même nettoyage que clean_data_and_convert_csv_to_arff.py
+    if path.endswith((".parquet", ".arrow")):
+        import pyarrow.feather as feather
+        import pyarrow.parquet as pq
+        table = feather.read_table(path) if path.endswith(".arrow") else pq.read_table(path)
+        df = table.to_pandas()
+    else:
+        df = pd.read_csv(path, dtype={"source": str, "label": str})
+    df = df.drop(columns=["message"], errors="ignore")
+    source = df["source"].fillna("").str.strip()
+    df["source"] = source.mask((source == "1.0.0.4") | (source.str.upper() == "UNKNOWN"), "R1")
+    df["label"] = df["label"].fillna("").str.strip().replace("", "NORMAL")
+    return df
+
+def encode(df, with_timestamp=False):
+    # -> X (float64), y (codes), classes ; l'ordre des classes est celui des
+    # domaines ARFF (trié), la classe 0 est celle des statistiques IR de Weka
+    columns = []
+    for name in NOMINAL_COLUMNS:
+        columns.append(pd.Categorical(df[name].astype(str)).codes.astype(np.float64))
+    value = pd.to_numeric(df["value"], errors="coerce").to_numpy(dtype=np.float64)
+    columns.append(np.nan_to_num(value, nan=0.0))
+    columns.append(np.isnan(value).astype(np.float64))
+    if with_timestamp:
+        columns.append(pd.to_datetime(df["timestamp"]).astype("int64").to_numpy() / 1e9)
+    classes = sorted(df["label"].unique())
+    y = pd.Categorical(df["label"], categories=classes).codes.astype(np.int32)
+    return np.column_stack(columns), y, classes
+
+def share(array):
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+def attach(spec):
+    name, shape, dtype = spec
+    if name not in attached:
+        shm = shared_memory.SharedMemory(name=name)
+        attached[name] = (shm, np.ndarray(shape, np.dtype(dtype), buffer=shm.buf))
+    return attached[name][1]
+
+def weka_date_time():
+    return float(time.strftime("%Y%m%d.%H%M"))
+
+def class_metrics(y, pred, positive):
+    tp = int(np.sum((pred == positive) & (y == positive)))
+    fp = int(np.sum((pred == positive) & (y != positive)))
+    tn = int(np.sum((pred != positive) & (y != positive)))
+    fn = int(np.sum((pred != positive) & (y == positive)))
+    tpr = tp / (tp + fn) if tp + fn else 0.0
+    fpr = fp / (fp + tn) if fp + tn else 0.0
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    f_measure = 2 * precision * tpr / (precision + tpr) if precision + tpr else 0.0
+    return tp, fp, tn, fn, tpr, fpr, precision, f_measure
+
+def area_under(score_fn, y_true, scores):
+    if y_true.min() == y_true.max():
+        return np.nan
+    return score_fn(y_true, scores)
+
+def evaluate(y_train, y_test, proba, n_classes):
+    # Statistiques d'évaluation avec les définitions de weka.classifiers.Evaluation
+    n = len(y_test)
+    pred = proba.argmax(axis=1)
+    actual = np.zeros_like(proba)
+    actual[np.arange(n), y_test] = 1.0
+    prior = (np.bincount(y_train, minlength=n_classes) + 1.0) / (len(y_train) + n_classes)
+
+    correct = int(np.sum(pred == y_test))
+    abs_err = np.abs(proba - actual).sum(axis=1) / n_classes
+    sq_err = ((proba - actual) ** 2).sum(axis=1) / n_classes
+    prior_abs = np.abs(prior - actual).sum(axis=1) / n_classes
+    prior_sq = ((prior - actual) ** 2).sum(axis=1) / n_classes
+    mae, rmse = abs_err.mean(), np.sqrt(sq_err.mean())
+
+    p_true = np.clip(proba[np.arange(n), y_test], 1e-12, 1.0)
+    prior_true = prior[y_test]
+    sf_prior = float(-np.log2(prior_true).sum())
+    sf_scheme = float(-np.log2(p_true).sum())
+    kb = np.where(p_true >= prior_true, np.log2(p_true) - np.log2(prior_true),
+                  -(np.log2(np.clip(1 - p_true, 1e-12, 1.0)) - np.log2(1 - prior_true)))
+    kb_information = float(kb.sum())
+
+    # plus petite région de classes couvrant COVERAGE_LEVEL de probabilité
+    order = np.argsort(-proba, axis=1)
+    cumulated = np.cumsum(np.take_along_axis(proba, order, axis=1), axis=1)
+    region_size = (cumulated < COVERAGE_LEVEL).sum(axis=1) + 1
+    rank_true = np.argmax(order == y_test[:, None], axis=1)
+
+    tp, fp, tn, fn, tpr, fpr, precision, f_measure = class_metrics(y_test, pred, 0)
+    support = np.bincount(y_test, minlength=n_classes) / n
+    per_class = [class_metrics(y_test, pred, k) for k in range(n_classes)]
+    mcc = [matthews_corrcoef(y_test == k, pred == k) for k in range(n_classes)]
+    roc = [area_under(roc_auc_score, y_test == k, proba[:, k]) for k in range(n_classes)]
+    prc = [area_under(average_precision_score, y_test == k, proba[:, k]) for k in range(n_classes)]
+
+    def weighted(values):
+        values = np.asarray(values, dtype=np.float64)
+        mask = ~np.isnan(values)
+        return float(np.sum(values[mask] * support[mask]) / np.sum(support[mask])) if mask.any() else np.nan
+
+    w_tpr = weighted([m[4] for m in per_class])
+    w_fpr = weighted([m[5] for m in per_class])
+    return {
+        "Number_of_training_instances": len(y_train),
+        "Number_of_testing_instances": n,
+        "Number_correct": correct,
+        "Number_incorrect": n - correct,
+        "Number_unclassified": 0,
+        "Percent_correct": 100.0 * correct / n,
+        "Percent_incorrect": 100.0 * (n - correct) / n,
+        "Percent_unclassified": 0.0,
+        "Kappa_statistic": cohen_kappa_score(y_test, pred),
+        "Mean_absolute_error": mae,
+        "Root_mean_squared_error": rmse,
+        "Relative_absolute_error": 100.0 * mae / prior_abs.mean(),
+        "Root_relative_squared_error": 100.0 * rmse / np.sqrt(prior_sq.mean()),
+        "SF_prior_entropy": sf_prior,
+        "SF_scheme_entropy": sf_scheme,
+        "SF_entropy_gain": sf_prior - sf_scheme,
+        "SF_mean_prior_entropy": sf_prior / n,
+        "SF_mean_scheme_entropy": sf_scheme / n,
+        "SF_mean_entropy_gain": (sf_prior - sf_scheme) / n,
+        "KB_information": kb_information,
+        "KB_mean_information": kb_information / n,
+        "KB_relative_information": 100.0 * kb_information / sf_prior,
+        "True_positive_rate": tpr,
+        "Num_true_positives": tp,
+        "False_positive_rate": fpr,
+        "Num_false_positives": fp,
+        "True_negative_rate": 1.0 - fpr,
+        "Num_true_negatives": tn,
+        "False_negative_rate": 1.0 - tpr,
+        "Num_false_negatives": fn,
+        "IR_precision": precision,
+        "IR_recall": tpr,
+        "F_measure": f_measure,
+        "Matthews_correlation": mcc[0],
+        "Area_under_ROC": roc[0],
+        "Area_under_PRC": prc[0],
+        "Weighted_avg_true_positive_rate": w_tpr,
+        "Weighted_avg_false_positive_rate": w_fpr,
+        "Weighted_avg_true_negative_rate": 1.0 - w_fpr,
+        "Weighted_avg_false_negative_rate": 1.0 - w_tpr,
+        "Weighted_avg_IR_precision": weighted([m[6] for m in per_class]),
+        "Weighted_avg_IR_recall": w_tpr,
+        "Weighted_avg_F_measure": weighted([m[7] for m in per_class]),
+        "Weighted_avg_matthews_correlation": weighted(mcc),
+        "Weighted_avg_area_under_ROC": weighted(roc),
+        "Weighted_avg_area_under_PRC": weighted(prc),
+        "Unweighted_macro_avg_F_measure": float(np.mean([m[7] for m in per_class])),
+        "Unweighted_micro_avg_F_measure": correct / n,
+        "Coverage_of_Test_Cases_By_Regions": 100.0 * float(np.mean(rank_true < region_size)),
+        "Size_of_Predicted_Regions": 100.0 * float(np.mean(region_size)) / n_classes,
+    }
+
+def run_fold(task):
+    dataset, algorithm, run, fold, folds, x_spec, y_spec, n_classes = task
+    X, y = attach(x_spec), attach(y_spec)
+    splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=run)
+    train, test = list(splitter.split(np.zeros(len(y)), y))[fold - 1]
+
+    scheme, factory, options = SCHEMES[algorithm]
+    model = factory(**options)
+    started, cpu_started = time.perf_counter(), time.process_time()
+    model.fit(X[train], y[train])
+    elapsed_training, cpu_training = time.perf_counter() - started, time.process_time() - cpu_started
+
+    started, cpu_started = time.perf_counter(), time.process_time()
+    # classes absentes du fold d'entraînement : probabilité nulle
+    proba = np.zeros((len(test), n_classes))
+    proba[:, model.classes_] = model.predict_proba(X[test])
+    elapsed_testing, cpu_testing = time.perf_counter() - started, time.process_time() - cpu_started
+
+    result = {
+        "Key_Dataset": dataset,
+        "Key_Run": run,
+        "Key_Fold": fold,
+        "Key_Scheme": scheme,
+        "Key_Scheme_options": " ".join(f"{k}={v}" for k, v in options.items()),
+        "Key_Scheme_version_ID": sklearn.__version__,
+        "Date_time": weka_date_time(),
+    }
+    result.update(evaluate(y[train], y[test], proba, n_classes))
+    result.update({
+        "Elapsed_Time_training": elapsed_training,
+        "Elapsed_Time_testing": elapsed_testing,
+        "UserCPU_Time_training": cpu_training,
+        "UserCPU_Time_testing": cpu_testing,
+        "UserCPU_Time_millis_training": 1000 * cpu_training,
+        "UserCPU_Time_millis_testing": 1000 * cpu_testing,
+        "Serialized_Model_Size": len(pickle.dumps(model)),
+        "Serialized_Train_Set_Size": X[train].nbytes + y[train].nbytes,
+        "Serialized_Test_Set_Size": X[test].nbytes + y[test].nbytes,
+        "Summary": "?",
+        "Algorithm": ALGORITHM_PREFIX + algorithm,
+    })
+    return result
+
+def run_experiment(inputs, algorithms, runs=RUNS, folds=FOLDS, workers=None,
+                   output_dir=OUTPUT_DIR, with_timestamp=False):
+    blocks = []
+    tasks = []
+    try:
+        for path in inputs:
+            dataset = os.path.basename(path).split(".")[0]
+            X, y, classes = encode(load_part(path), with_timestamp)
+            x_shm, x_spec = share(X)
+            y_shm, y_spec = share(y)
+            blocks += [x_shm, y_shm]
+            print(f"{dataset} : {len(y)} instances, {len(classes)} classes")
+            for algorithm in algorithms:
+                for run in range(1, runs + 1):
+                    for fold in range(1, folds + 1):
+                        tasks.append((dataset, algorithm, run, fold, folds, x_spec, y_spec,
+                                      len(classes)))
+
+        # les folds les plus longs (forêts, k-NN) d'abord
+        cost = {"tree_RandomForest": 0, "lazy_IBk": 1}
+        tasks.sort(key=lambda task: cost.get(task[1], 2))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(run_fold, tasks, chunksize=1))
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    os.makedirs(output_dir, exist_ok=True)
+    df = pd.DataFrame(results).sort_values(["Algorithm", "Key_Dataset", "Key_Run", "Key_Fold"])
+    outputs = []
+    for algorithm, group in df.groupby("Algorithm", sort=False):
+        output = os.path.join(output_dir, f"python_experiment_{algorithm}.csv")
+        group.to_csv(output, index=False)
+        outputs.append(output)
+    return outputs
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validation croisée parallèle des algorithmes sur les parties du dataset")
+    parser.add_argument("inputs", nargs="*", help=f"parties CSV / .parquet / .arrow (défaut : {INPUT_PATTERN})")
+    parser.add_argument("--algorithms", nargs="+", choices=sorted(SCHEMES), default=sorted(SCHEMES))
+    parser.add_argument("--runs", type=int, default=RUNS)
+    parser.add_argument("--folds", type=int, default=FOLDS)
+    parser.add_argument("--workers", type=int, default=None, help="processus (défaut : un par cœur)")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--with-timestamp", action="store_true",
+                        help="ajoute le timestamp (secondes) aux attributs")
+    args = parser.parse_args()
+
+    inputs = args.inputs or sorted(glob.glob(INPUT_PATTERN))
+    for output in run_experiment(inputs, args.algorithms, args.runs, args.folds, args.workers,
+                                 args.output_dir, args.with_timestamp):
+        print(f"Résultats sauvegardés : {output}")
@@ -0,0 +1,161 @@
+import csv
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Ingestion des résultats d'expériences (exports ARFF du Weka Experimenter et
+# CSV de run_experiment.py) dans un store colonnaire unique. Chaque fichier
+# source est converti une seule fois : un index garde sa taille, sa date et
+# le hash de son contenu, et seuls les fichiers nouveaux ou modifiés sont
+# relus. Le store consolidé (results.parquet) se charge en quelques ms.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ARFF_DIR = os.path.join(BASE_DIR, "weka-files")
+CSV_DIR = os.path.join(BASE_DIR, "csv-files")
+CACHE_DIR = os.path.join(BASE_DIR, ".results-cache")
+RESULTS_STORE = "results.parquet"
+INDEX_FILE = "index.json"
+# Version du schéma des parties en cache : les entrées d'une autre version
+# sont reconverties (2 : colonne Source)
+CACHE_SCHEMA = 2
+# Colonne Source : "weka" pour les ARFF de l'Experimenter, "sklearn" pour les
+# CSV de run_experiment.py, gardée dans le store et les regroupements
+ARFF_SOURCE = "weka"
+CSV_SOURCE = "sklearn"
+
+def extract_algorithm_name(file_path):
+    # 'weka_experiment_tree_RandomForest_3.arff' -> 'tree_RandomForest_3'
+    base = os.path.basename(file_path)
+    for prefix in ("weka_experiment_", "python_experiment_"):
+        if base.startswith(prefix):
+            base = base[len(prefix):]
+    return os.path.splitext(base)[0]
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def parse_arff(path):
+    # -> (noms des attributs, types déclarés, lignes) ; les données sont lues
+    # en flux avec les règles de quoting ARFF ('...' et échappement \), donc
+    # une virgule dans Key_Scheme_options ne décale plus les colonnes
+    names, types = [], []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            stripped = line.strip()
+            lower = stripped.lower()
+            if lower.startswith("@attribute"):
+                _, rest = stripped.split(None, 1)
+                if rest.startswith(("'", '"')):
+                    quote = rest[0]
+                    end = rest.index(quote, 1)
+                    name, declared = rest[1:end], rest[end + 1:].strip()
+                else:
+                    name, declared = rest.split(None, 1)
+                names.append(name)
+                types.append("nominal" if declared.startswith("{") else declared.split()[0].lower())
+            elif lower.startswith("@data"):
+                break
+        reader = csv.reader((line for line in f if line.strip() and not line.startswith("%")),
+                            quotechar="'", escapechar="\\", skipinitialspace=True)
+        rows = [row for row in reader]
+    return names, types, rows
+
+def arff_frame(path):
+    names, types, rows = parse_arff(path)
+    df = pd.DataFrame(rows, columns=names, dtype=object).replace("?", np.nan)
+    for name, declared in zip(names, types):
+        if declared in ("numeric", "real", "integer"):
+            df[name] = pd.to_numeric(df[name], errors="coerce")
+        else:
+            # comme pd.read_csv : une colonne nominale entièrement numérique
+            # (Key_Run, Key_Fold...) devient numérique
+            try:
+                df[name] = pd.to_numeric(df[name])
+            except (ValueError, TypeError):
+                pass
+    return df
+
+def load_source(path):
+    if path.endswith(".arff"):
+        df = arff_frame(path)
+    else:
+        df = pd.read_csv(path)
+    if "Algorithm" not in df.columns:
+        df["Algorithm"] = extract_algorithm_name(path)
+    if "Source" not in df.columns:
+        df["Source"] = ARFF_SOURCE if path.endswith(".arff") else CSV_SOURCE
+    return df
+
+def source_files(arff_dir=ARFF_DIR, csv_dir=CSV_DIR):
+    return (sorted(glob.glob(os.path.join(arff_dir, "*.arff"))) +
+            sorted(glob.glob(os.path.join(csv_dir, "python_experiment_*.csv"))))
+
+def cache_name(path):
+    return hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:16] + ".parquet"
+
+def update_store(files=None, cache_dir=CACHE_DIR):
+    # Convertit les fichiers nouveaux / modifiés et reconstruit le store
+    # consolidé si besoin ; renvoie le chemin du store
+    files = source_files() if files is None else files
+    os.makedirs(cache_dir, exist_ok=True)
+    index_path = os.path.join(cache_dir, INDEX_FILE)
+    store_path = os.path.join(cache_dir, RESULTS_STORE)
+    index = {}
+    if os.path.exists(index_path):
+        with open(index_path, encoding="utf-8") as f:
+            index = json.load(f)
+
+    changed = set(index) != {os.path.abspath(path) for path in files}
+    new_index = {}
+    for path in files:
+        key = os.path.abspath(path)
+        stat = os.stat(path)
+        entry = index.get(key)
+        if entry and entry.get("schema") != CACHE_SCHEMA:
+            entry = None
+        part = os.path.join(cache_dir, cache_name(path))
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns \
+                and os.path.exists(part):
+            new_index[key] = entry
+            continue
+        digest = file_hash(path)
+        if entry and entry["sha256"] == digest and os.path.exists(part):
+            # touché mais identique : rien à reconvertir
+            new_index[key] = dict(entry, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            continue
+        load_source(path).to_parquet(part, index=False)
+        print(f"Résultats convertis : {os.path.basename(path)}")
+        new_index[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest,
+                          "schema": CACHE_SCHEMA}
+        changed = True
+
+    if changed or not os.path.exists(store_path):
+        parts = [pd.read_parquet(os.path.join(cache_dir, cache_name(path))) for path in files]
+        df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+        # colonnes de types mixtes entre fichiers (ex. Summary) gardées en texte
+        for column in df.columns[df.dtypes == object]:
+            df[column] = df[column].astype("string")
+        df.to_parquet(store_path, index=False)
+        for key in set(index) - set(new_index):
+            stale = os.path.join(cache_dir, cache_name(key))
+            if os.path.exists(stale):
+                os.remove(stale)
+    with open(index_path, "w", encoding="utf-8") as f:
+        json.dump(new_index, f, indent=1)
+    return store_path
+
+def load_results(files=None, cache_dir=CACHE_DIR, columns=None):
+    # Tous les résultats (une ligne par run / fold / algorithme / dataset)
+    return pd.read_parquet(update_store(files, cache_dir), columns=columns)
+
+if __name__ == "__main__":
+    df = load_results()
+    print(f"{len(df)} résultats, {df.groupby(['Source', 'Algorithm']).ngroups} algorithmes")
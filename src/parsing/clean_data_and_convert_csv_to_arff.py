@@ -1,89 +1,215 @@
+import argparse
 import csv
+import functools
 import glob
+import gzip
+import itertools
 import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
 
-# Pattern for the four split CSV files (adjust the pattern as needed)
-csv_files = glob.glob("merged_dataset_part*.csv")
+# Pattern for the split CSV files (adjust the pattern as needed)
+CSV_PATTERN = "merged_dataset_part*.csv"
 
-# Loop over each CSV file found
-for input_csv in csv_files:
+expected_cols = ["timestamp", "source", "record_type", "metric", "value", "label", "message"]
+
+# Rows read, cleaned and type-checked at a time
+CHUNK_ROWS = 50000
+# Distinct values kept per nominal column; a column with more is written as
+# an ARFF string attribute instead of an unbounded nominal domain
+MAX_NOMINAL_VALUES = 100000
+
+# How the timestamp column is declared: "nominal" (every distinct second is a
+# value), "date" (ARFF DATE attribute) or "epoch" (numeric seconds)
+TIMESTAMP_TYPE = "nominal"
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+ARFF_DATE_FORMAT = "yyyy-MM-dd HH:mm:ss"
+# Write sparse instances ({index value, ...}, zeros and first nominal values
+# omitted) and/or gzip the output (.arff.gz, read natively by Weka)
+SPARSE = False
+GZIP = False
+
+def is_float(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+def clean_rows(rows, source_idx, label_idx, keep):
+    # Replace "1.0.0.4" and "UNKNOWN" in the "source" column with "R1",
+    # replace empty "label" values with "NORMAL" and drop the "message" column
+    cleaned = []
+    for row in rows:
+        row = [value.strip() for value in row]
+        source_val = row[source_idx]
+        if source_val == "1.0.0.4" or source_val.upper() == "UNKNOWN":
+            row[source_idx] = "R1"
+        if row[label_idx] == "":
+            row[label_idx] = "NORMAL"
+        cleaned.append([row[i] for i in keep])
+    return cleaned
+
+def quote(value):
+    return "'" + value.replace("'", "\\'") + "'"
+
+def epoch_converter():
+    # consecutive rows mostly share their timestamp, so only a change is parsed
+    last = [None, None]
+
+    def to_epoch(value):
+        if value != last[0]:
+            last[0] = value
+            last[1] = str(int(time.mktime(time.strptime(value, TIMESTAMP_FORMAT))))
+        return last[1]
+    return to_epoch
+
+def sparse_line(values, defaults):
+    # Missing values are written explicitly, only zeros / first nominal values are omitted
+    return "{" + ",".join(f"{j} {value}" for j, (value, default) in enumerate(zip(values, defaults))
+                          if value != default) + "}"
+
+def convert(input_csv, timestamp_type=TIMESTAMP_TYPE, sparse=SPARSE, compress=GZIP):
     # Get base filename without extension for naming the ARFF file and relation name
     base_name = os.path.splitext(input_csv)[0]
-    output_arff = base_name + ".arff"
-    
-    # Read the CSV file into a list of dictionaries
-    with open(input_csv, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        rows = list(reader)
-        fieldnames = reader.fieldnames
-
-    # Check that the expected fields exist
-    expected_cols = ["timestamp", "source", "record_type", "metric", "value", "label", "message"]
-    for col in expected_cols:
-        if col not in fieldnames:
-            raise ValueError(f"Column '{col}' is missing in the file {input_csv}.")
-
-    # Replace "1.0.0.4" and "UNKNOWN" in the "source" column with "R1"
-    for row in rows:
-        if "source" in row:
-            source_val = row["source"].strip()
-            if source_val == "1.0.0.4" or source_val.upper() == "UNKNOWN":
-                row["source"] = "R1"
-
-    # Remove the "message" column from the header if present
-    if "message" in fieldnames:
-        fieldnames.remove("message")
-
-    # Process each row:
-    # - Replace empty "label" values with "NORMAL"
-    # - Remove the "message" field from each row
-    for row in rows:
-        if "label" in row:
-            if row["label"].strip() == "":
-                row["label"] = "NORMAL"
-        if "message" in row:
-            del row["message"]
-
-    # Function to check if a string can be converted to a float
-    def is_float(value):
-        try:
-            float(value)
-            return True
-        except:
-            return False
-
-    # Determine attribute types for each field:
-    # If all non-empty values in a column can be converted to float, mark it as numeric.
-    # Otherwise, treat it as a nominal attribute listing all distinct values.
-    attr_types = {}
-    for col in fieldnames:
-        values = [row[col] for row in rows if row[col].strip() != ""]
-        if values and all(is_float(val) for val in values):
-            attr_types[col] = "numeric"
-        else:
-            distinct_vals = sorted(set(values))
-            nominal_list = "{" + ",".join("'" + val.replace("'", "\\'") + "'" for val in distinct_vals) + "}"
-            attr_types[col] = nominal_list
-
-    # Write the ARFF file
-    with open(output_arff, 'w', encoding='utf-8') as f_out:
-        # Write the relation header
-        f_out.write(f"@relation {base_name}\n\n")
-        # Write attribute declarations
-        for col in fieldnames:
-            f_out.write(f"@attribute {col} {attr_types[col]}\n")
-        f_out.write("\n@data\n")
-        # Write each data row. Empty fields are replaced by "?".
-        for row in rows:
-            row_values = []
-            for col in fieldnames:
-                value = row[col].strip()
-                if value == "":
-                    row_values.append("?")
+    output_arff = base_name + (".arff.gz" if compress else ".arff")
+
+    with open(input_csv, 'r', newline='', encoding='utf-8') as f, \
+            tempfile.TemporaryFile('w+', newline='', encoding='utf-8') as spool:
+        reader = csv.reader(f)
+        header = next(reader)
+
+        # Check that the expected fields exist
+        for col in expected_cols:
+            if col not in header:
+                raise ValueError(f"Column '{col}' is missing in the file {input_csv}.")
+
+        keep = [i for i, col in enumerate(header) if col != "message"]
+        fieldnames = [header[i] for i in keep]
+        source_idx = header.index("source")
+        label_idx = header.index("label")
+        timestamp_idx = fieldnames.index("timestamp")
+        # a DATE / epoch timestamp needs no domain
+        typed_timestamp = timestamp_type in ("date", "epoch")
+
+        # Single scan: cleaned rows go to a spool file while the attribute
+        # types are inferred. A column is numeric while every non-empty value
+        # converts to float, and its values are not kept. Only nominal
+        # columns keep their distinct values, up to MAX_NOMINAL_VALUES; a
+        # column that turns out nominal after numeric chunks gets its earlier
+        # values from the spool at the end.
+        numeric = [True] * len(fieldnames)
+        has_values = [False] * len(fieldnames)
+        # domain of each nominal column, None once over MAX_NOMINAL_VALUES
+        domains = [set() for _ in fieldnames]
+        rescan = set()
+        spool_writer = csv.writer(spool)
+        while True:
+            chunk = list(itertools.islice(reader, CHUNK_ROWS))
+            if not chunk:
+                break
+            chunk = clean_rows(chunk, source_idx, label_idx, keep)
+            spool_writer.writerows(chunk)
+            for j, column in enumerate(zip(*chunk)):
+                if typed_timestamp and j == timestamp_idx:
+                    continue
+                values = set(column)
+                values.discard("")
+                if not values:
+                    continue
+                has_values[j] = True
+                if numeric[j]:
+                    if all(is_float(val) for val in values):
+                        continue
+                    numeric[j] = False
+                    rescan.add(j)
+                if j in rescan or domains[j] is None:
+                    continue
+                domains[j].update(values)
+                if len(domains[j]) > MAX_NOMINAL_VALUES:
+                    domains[j] = None
+
+        if rescan:
+            spool.seek(0)
+            spool_reader = csv.reader(spool)
+            for chunk in iter(lambda: list(itertools.islice(spool_reader, CHUNK_ROWS)), []):
+                for j in list(rescan):
+                    domains[j].update(row[j] for row in chunk if row[j] != "")
+                    if len(domains[j]) > MAX_NOMINAL_VALUES:
+                        domains[j] = None
+                        rescan.discard(j)
+
+        attr_types = []
+        formatters = []
+        defaults = []
+        for j in range(len(fieldnames)):
+            if typed_timestamp and j == timestamp_idx:
+                if timestamp_type == "date":
+                    attr_types.append(f'DATE "{ARFF_DATE_FORMAT}"')
+                    formatters.append(quote)
                 else:
-                    if attr_types[col] == "numeric":
-                        row_values.append(value)
+                    attr_types.append("numeric")
+                    formatters.append(epoch_converter())
+                defaults.append(None)
+            elif numeric[j] and has_values[j]:
+                attr_types.append("numeric")
+                formatters.append(None)
+                defaults.append("0")
+            elif domains[j] is None:
+                attr_types.append("string")
+                formatters.append(quote)
+                defaults.append(None)
+            else:
+                domain = sorted(domains[j])
+                attr_types.append("{" + ",".join(quote(val) for val in domain) + "}")
+                formatters.append(quote)
+                defaults.append(quote(domain[0]) if domain else None)
+
+        # Write the ARFF file, streaming the @data section back from the spool
+        spool.seek(0)
+        spool_reader = csv.reader(spool)
+        if compress:
+            f_out = gzip.open(output_arff, 'wt', encoding='utf-8', compresslevel=6)
+        else:
+            f_out = open(output_arff, 'w', encoding='utf-8')
+        with f_out:
+            f_out.write(f"@relation {base_name}\n\n")
+            for col, attr_type in zip(fieldnames, attr_types):
+                f_out.write(f"@attribute {col} {attr_type}\n")
+            f_out.write("\n@data\n")
+            # Empty fields are replaced by "?"
+            for chunk in iter(lambda: list(itertools.islice(spool_reader, CHUNK_ROWS)), []):
+                lines = []
+                for row in chunk:
+                    values = ["?" if value == "" else formatter(value) if formatter else value
+                              for value, formatter in zip(row, formatters)]
+                    if sparse:
+                        # "0.0" and friends are zeros too
+                        values = ["0" if default == "0" and value != "?" and float(value) == 0
+                                  else value for value, default in zip(values, defaults)]
+                        lines.append(sparse_line(values, defaults) + "\n")
                     else:
-                        row_values.append("'" + value.replace("'", "\\'") + "'")
-            f_out.write(",".join(row_values) + "\n")
-    print(f"ARFF file created: {output_arff}")
+                        lines.append(",".join(values) + "\n")
+                f_out.writelines(lines)
+    return output_arff
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clean the split CSV files and convert them to ARFF")
+    parser.add_argument("inputs", nargs="*", help=f"CSV files to convert (default: {CSV_PATTERN})")
+    parser.add_argument("--timestamp", choices=["nominal", "date", "epoch"], default=TIMESTAMP_TYPE,
+                        help="how the timestamp attribute is declared")
+    parser.add_argument("--sparse", action="store_true", default=SPARSE,
+                        help="write sparse instances")
+    parser.add_argument("--gzip", action="store_true", default=GZIP,
+                        help="write .arff.gz")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="parallel conversions (default: one per CPU)")
+    args = parser.parse_args()
+
+    csv_files = args.inputs or sorted(glob.glob(CSV_PATTERN))
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        convert_file = functools.partial(convert, timestamp_type=args.timestamp,
+                                         sparse=args.sparse, compress=args.gzip)
+        for output_arff in pool.map(convert_file, csv_files):
+            print(f"ARFF file created: {output_arff}")
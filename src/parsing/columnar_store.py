@@ -0,0 +1,80 @@
+import glob
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+# Reader for the partitioned columnar datasets written by the collectors
+# (src/telemetry/columnar_sink.py): <root>/date=YYYY-MM-DD/part-*.parquet|.arrow
+
+DATE_PARTITIONING = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+
+def dataset_format(root):
+    if glob.glob(os.path.join(root, "date=*", "*.arrow")):
+        return "ipc"
+    return "parquet"
+
+def open_dataset(root):
+    return ds.dataset(root, format=dataset_format(root), partitioning=DATE_PARTITIONING)
+
+def time_filter(start=None, end=None):
+    # start inclusive, end exclusive; the date partition filter lets the scan
+    # skip whole directories before any file is opened
+    expr = None
+    if start is not None:
+        start = pd.Timestamp(start)
+        expr = ((ds.field("date") >= start.strftime("%Y-%m-%d")) &
+                (ds.field("timestamp") >= pa.scalar(start.to_pydatetime(), pa.timestamp("s"))))
+    if end is not None:
+        end = pd.Timestamp(end)
+        end_expr = ((ds.field("date") <= end.strftime("%Y-%m-%d")) &
+                    (ds.field("timestamp") < pa.scalar(end.to_pydatetime(), pa.timestamp("s"))))
+        expr = end_expr if expr is None else expr & end_expr
+    return expr
+
+def read_table(roots, columns=None, start=None, end=None, sort=False):
+    if isinstance(roots, str):
+        roots = [roots]
+    tables = []
+    for root in roots:
+        dataset = open_dataset(root)
+        names = columns or [name for name in dataset.schema.names if name != "date"]
+        tables.append(dataset.to_table(columns=names, filter=time_filter(start, end)))
+    # trap datasets carry extra typed columns, missing ones become nulls
+    table = pa.concat_tables(tables, promote_options="default") if len(tables) > 1 else tables[0]
+    if sort and "timestamp" in table.column_names:
+        table = table.sort_by("timestamp")
+    return table
+
+def read_telemetry(roots, columns=None, start=None, end=None, sort=False):
+    return read_table(roots, columns, start, end, sort).to_pandas()
+
+def write_table(table, path):
+    if path.endswith(".arrow"):
+        feather.write_feather(table, path, compression="zstd")
+    else:
+        pq.write_table(table, path, compression="zstd")
+
+def read_merged(path, columns=None):
+    # single-file merged dataset (.parquet or .arrow) as a DataFrame
+    if path.endswith(".arrow"):
+        return feather.read_table(path, columns=columns).to_pandas()
+    return pq.read_table(path, columns=columns).to_pandas()
+
+def merged_rows(path):
+    # -> total number of rows in a single-file merged dataset
+    if path.endswith(".arrow"):
+        with pa.ipc.open_file(path) as reader:
+            return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+    return pq.ParquetFile(path).metadata.num_rows
+
+def iter_merged_batches(path, batch_rows=65536):
+    # record batches of a single-file merged dataset, without reading it whole
+    if path.endswith(".arrow"):
+        with pa.ipc.open_file(path) as reader:
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i)
+    else:
+        yield from pq.ParquetFile(path).iter_batches(batch_size=batch_rows)
@@ -0,0 +1,246 @@
+import argparse
+import csv
+import io
+import os
+import pickle
+import numpy as np
+import pandas as pd
+
+# Long -> wide feature table: one row per (time bucket, source) with one
+# column per polled metric, trap / flow counts, and rolling features over the
+# previous buckets of the same source. State (read offset, open bucket and
+# the last buckets of history) is pickled next to the output, so a rerun on a
+# file that has grown only processes the appended rows. Rows already written
+# are never rewritten: when a metric first seen later adds columns, the
+# following rows go to a new segment, features.csv, features.1.csv, ...
+# (read_features() reads them back as one table).
+
+BUCKET = "10s"
+# Rolling windows, in buckets
+WINDOWS = [6, 30]
+# Bytes of the input parsed at a time (cut on a line boundary)
+CHUNK_BYTES = 64 * 1024 * 1024
+
+INPUT_COLUMNS = ["timestamp", "source", "record_type", "metric", "value", "label"]
+KEY = ["bucket", "source"]
+# Record types counted per bucket instead of pivoted by metric
+COUNTED = {"SNMP_TRAP": "trap_count", "NETFLOW": "flow_count"}
+# A window without spread (a single sample, or a std below
+# Z_EPS * max(|mean|, 1), i.e. rounding noise) gives a z-score of 0, not
+# NaN / inf / noise divided by noise
+Z_EPS = 1e-9
+
+def window_stats(values, window):
+    # mean and std (ddof 1) of the trailing `window` rows of each row, NaNs
+    # skipped. Computed from the window alone, so a row gets the same result
+    # however much history precedes it (pandas' rolling keeps running sums).
+    padded = np.vstack((np.full((window - 1, values.shape[1]), np.nan), values))
+    view = np.lib.stride_tricks.sliding_window_view(padded, window, axis=0)
+    present = ~np.isnan(view)
+    count = present.sum(axis=2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(present, view, 0.0).sum(axis=2) / count
+        deviation = np.where(present, view - mean[..., None], 0.0)
+        std = np.sqrt((deviation ** 2).sum(axis=2) / (count - 1))
+    return mean, std
+
+class FeatureBuilder:
+
+    def __init__(self, bucket=BUCKET, windows=WINDOWS):
+        self.bucket = pd.Timedelta(bucket)
+        self.windows = sorted(windows)
+        # long rows of the last (possibly incomplete) bucket
+        self.pending = None
+        # last max(windows) wide rows per source, for the rolling features
+        self.history = None
+        # output columns in order of first appearance; a metric first seen in
+        # a later batch adds its columns at the end, in a new output segment
+        self.columns = []
+
+    def wide(self, df):
+        df = df.assign(bucket=df["timestamp"].dt.floor(self.bucket))
+        counted = df["record_type"].isin(list(COUNTED))
+
+        polled = df[~counted & df["value"].notna()]
+        table = polled.pivot_table(index=KEY, columns="metric", values="value", aggfunc="mean")
+        table.columns = list(table.columns)
+
+        counts = (df[counted].groupby(KEY + ["record_type"]).size()
+                  .unstack("record_type").rename(columns=COUNTED))
+        flows = df[df["record_type"] == "NETFLOW"].groupby(KEY)["value"].sum().rename("flow_packets")
+        table = table.join([counts, flows], how="outer")
+        for column in list(COUNTED.values()) + ["flow_packets"]:
+            if column not in table:
+                table[column] = 0.0
+            table[column] = table[column].fillna(0)
+
+        # most frequent non-empty label of the bucket, ties broken by name
+        labelled = df[df["label"].notna() & (df["label"] != "")]
+        if len(labelled):
+            labels = (labelled.groupby(KEY + ["label"]).size().reset_index(name="n")
+                      .sort_values(["n", "label"], ascending=[False, True], kind="stable")
+                      .drop_duplicates(KEY).set_index(KEY)["label"])
+            table = table.join(labels, how="left")
+        else:
+            table["label"] = np.nan
+        table["label"] = table["label"].fillna("")
+        return table.reset_index()
+
+    def rolling(self, table):
+        # history rows (_new False) are only context, they are not emitted again
+        if self.history is not None:
+            table = pd.concat([self.history, table], ignore_index=True)
+        table = table.sort_values(KEY[::-1], kind="stable", ignore_index=True)
+        is_new = table["_new"].to_numpy(dtype=bool)
+
+        metrics = [column for column in table.columns
+                   if column not in KEY + ["label", "_new"] and pd.api.types.is_numeric_dtype(table[column])]
+        features = {}
+        delta = table.groupby("source", sort=False)[metrics].diff()
+        for column in metrics:
+            features[f"{column}_delta"] = delta[column]
+        values = table[metrics].to_numpy(dtype=np.float64)
+        sources = table["source"].to_numpy()
+        # rows are sorted by source: one slice per source
+        starts = np.flatnonzero(np.r_[True, sources[1:] != sources[:-1]])[:len(sources)]
+        bounds = np.r_[starts, len(sources)]
+        for window in self.windows:
+            mean, std = np.empty_like(values), np.empty_like(values)
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                mean[start:end], std[start:end] = window_stats(values[start:end], window)
+            flat = ~(std > Z_EPS * np.maximum(np.abs(mean), 1.0))
+            with np.errstate(invalid="ignore", divide="ignore"):
+                z = np.where(flat, 0.0, (values - mean) / std)
+            z[np.isnan(values)] = np.nan
+            for i, column in enumerate(metrics):
+                features[f"{column}_mean{window}"] = mean[:, i]
+                features[f"{column}_z{window}"] = z[:, i]
+        table = pd.concat([table, pd.DataFrame(features, index=table.index)], axis=1)
+
+        depth = self.windows[-1]
+        base = table.drop(columns=list(features)).assign(_new=False)
+        self.history = base.groupby("source", sort=False).tail(depth).reset_index(drop=True)
+        return table[is_new].drop(columns="_new").sort_values(KEY, kind="stable")
+
+    def update(self, df, final=False):
+        # df: long rows in time order. Returns the wide rows of every bucket
+        # that is complete, i.e. older than the newest bucket seen so far.
+        frames = [frame for frame in (self.pending, df) if frame is not None and len(frame)]
+        if not frames:
+            return None
+        df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        buckets = df["timestamp"].dt.floor(self.bucket)
+        if final:
+            closed, self.pending = df, None
+        else:
+            last = buckets.max()
+            closed, self.pending = df[buckets < last], df[buckets >= last]
+        if closed.empty:
+            return None
+        table = self.wide(closed).assign(_new=True)
+        table = self.rolling(table)
+        self.columns += [column for column in table.columns if column not in self.columns]
+        return table.reindex(columns=self.columns)
+
+def parse_chunk(data, header):
+    df = pd.read_csv(io.BytesIO(data), names=header, usecols=INPUT_COLUMNS,
+                     dtype={"source": str, "record_type": str, "metric": str, "label": str})
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    df["value"] = pd.to_numeric(df["value"], errors="coerce")
+    return df
+
+def build_features(input_csv, output_csv, state_path, bucket=BUCKET, windows=WINDOWS, final=False):
+    state = {"offset": 0, "header": None, "segment": 0, "builder": FeatureBuilder(bucket, windows)}
+    if os.path.exists(state_path) and os.path.exists(output_csv):
+        with open(state_path, "rb") as f:
+            state = pickle.load(f)
+        state.setdefault("segment", 0)
+    builder = state["builder"]
+    written = 0
+
+    with open(input_csv, "rb") as f:
+        if state["header"] is None:
+            first = f.readline()
+            state["header"] = next(csv.reader([first.decode("utf-8")]))
+            state["offset"] = len(first)
+        f.seek(state["offset"])
+        leftover = b""
+        while True:
+            block = f.read(CHUNK_BYTES)
+            if not block:
+                break
+            block = leftover + block
+            # a line still being appended is kept for the next run
+            cut = block.rfind(b"\n") + 1
+            data, leftover = block[:cut], block[cut:]
+            state["offset"] += len(data)
+            if not data:
+                continue
+            written += write_rows(builder.update(parse_chunk(data, state["header"])), output_csv,
+                                  state)
+
+    if final:
+        written += write_rows(builder.update(None, final=True), output_csv, state)
+    with open(state_path, "wb") as f:
+        pickle.dump(state, f)
+    return written
+
+def segment_path(output_csv, segment):
+    if not segment:
+        return output_csv
+    base, ext = os.path.splitext(output_csv)
+    return f"{base}.{segment}{ext}"
+
+def output_header(path):
+    # -> columns of an output segment, None when missing or empty
+    try:
+        with open(path, newline="", encoding="utf-8") as f:
+            return next(csv.reader(f), None)
+    except FileNotFoundError:
+        return None
+
+def write_rows(table, output_csv, state):
+    if table is None or table.empty:
+        return 0
+    table = table.assign(bucket=table["bucket"].dt.strftime("%Y-%m-%d %H:%M:%S"))
+    path = segment_path(output_csv, state["segment"])
+    columns = output_header(path)
+    while columns is not None and columns != list(table.columns):
+        # new columns: the written rows stay as they are, these start a segment
+        state["segment"] += 1
+        path = segment_path(output_csv, state["segment"])
+        columns = output_header(path)
+    table.to_csv(path, mode="a", header=columns is None, index=False, float_format="%.6g")
+    return len(table)
+
+def output_segments(output_csv):
+    paths = []
+    while os.path.exists(segment_path(output_csv, len(paths))):
+        paths.append(segment_path(output_csv, len(paths)))
+    return paths
+
+def read_features(output_csv):
+    # every segment as one table of strings, "" in the columns a segment lacks
+    frames = [pd.read_csv(path, dtype=str, keep_default_na=False)
+              for path in output_segments(output_csv)]
+    if not frames:
+        return pd.DataFrame()
+    # columns are only ever added, the last segment has them all
+    return pd.concat(frames, ignore_index=True)[frames[-1].columns].fillna("")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a wide per-source feature table from the merged dataset")
+    parser.add_argument("input", nargs="?", default="merged_dataset.csv")
+    parser.add_argument("-o", "--output", default="features.csv")
+    parser.add_argument("--state", default=None, help="state file (default: <output>.state)")
+    parser.add_argument("--bucket", default=BUCKET, help="time bucket, e.g. 10s, 1min")
+    parser.add_argument("--windows", type=lambda text: [int(w) for w in text.split(",")],
+                        default=WINDOWS, help="rolling windows in buckets, e.g. 6,30")
+    parser.add_argument("--final", action="store_true",
+                        help="also emit the last bucket (input is complete)")
+    args = parser.parse_args()
+
+    state_path = args.state or args.output + ".state"
+    rows = build_features(args.input, args.output, state_path, args.bucket, args.windows, args.final)
+    print(f"{rows} feature rows appended to '{args.output}' "
+          f"({len(output_segments(args.output))} segments).")
@@ -1,21 +1,95 @@
+import argparse
 import pandas as pd
 
-# List of CSV files generated by your scripts
-csv_files = ["snmp_traps.csv", "netflow_flows.csv", "snmp_poll.csv"]
+# Storage format written by the collectors: "csv", or "parquet" / "arrow" for
+# their partitioned columnar datasets (snmp_traps/, netflow_flows/, snmp_poll/)
+STORAGE = "csv"
 
-# Read each CSV into a DataFrame
-dfs = [pd.read_csv(file) for file in csv_files]
+def main():
+    parser = argparse.ArgumentParser(description="Merge the collector outputs in time order")
+    parser.add_argument("inputs", nargs="*",
+                        help="CSV files (or rotated segments with --stream), or columnar "
+                             "dataset directories, to merge; default: the snmp_traps, "
+                             "netflow_flows and snmp_poll outputs")
+    parser.add_argument("--stream", action="store_true",
+                        help="k-way merge the already sorted inputs in constant memory")
+    parser.add_argument("--reorder-rows", type=int, default=None,
+                        help="rows buffered per input to fix small out-of-order windows")
+    parser.add_argument("--archive", default=None,
+                        help="snmp_poll archive (.tsz segments of poll_archive.py: files, "
+                             "directory or pattern) read instead of snmp_poll.csv")
+    parser.add_argument("--start", default=None, help='keep rows from "YYYY-mm-dd HH:MM:SS"')
+    parser.add_argument("--end", default=None, help='keep rows before "YYYY-mm-dd HH:MM:SS"')
+    parser.add_argument("--storage", choices=["csv", "parquet", "arrow"], default=STORAGE,
+                        help="format written by the collectors (default: %(default)s)")
+    parser.add_argument("-o", "--output", default="last/merged_dataset.csv")
+    args = parser.parse_args()
+    if args.storage != "csv" and (args.stream or args.archive):
+        # the columnar datasets are read whole (snmp_poll/ included), in Arrow
+        parser.error("--stream and --archive only apply to CSV storage")
 
-# Convert the 'timestamp' column to datetime format in each DataFrame
-for df in dfs:
-    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    # Same text form as the collectors' timestamps, so rows compare as strings
+    start = pd.Timestamp(args.start).strftime("%Y-%m-%d %H:%M:%S") if args.start else None
+    end = pd.Timestamp(args.end).strftime("%Y-%m-%d %H:%M:%S") if args.end else None
 
-# Concatenate all DataFrames into a single one
-merged_df = pd.concat(dfs, ignore_index=True)
+    if args.stream:
+        from stream_merge import merge_files, default_inputs, REORDER_ROWS
 
-# Sort the merged DataFrame in chronological order
-merged_df = merged_df.sort_values("timestamp")
+        if args.archive:
+            from poll_archive import segment_paths
 
-# Save the unified dataset into a new CSV file
-merged_df.to_csv("last/merged_dataset.csv", index=False)
-print("Unified dataset saved as 'merged_dataset.csv'.")
+            inputs = args.inputs or default_inputs(["snmp_traps", "netflow_flows"])
+            inputs += [segment.path for segment in segment_paths(args.archive)]
+        else:
+            inputs = args.inputs or default_inputs(["snmp_traps", "netflow_flows", "snmp_poll"])
+        stats = merge_files(inputs, args.output, args.reorder_rows or REORDER_ROWS, start, end)
+        print(f"Unified dataset saved as '{args.output}' ({stats['rows']} rows from "
+              f"{len(inputs)} files, {stats['late']} rows beyond the reorder window).")
+    elif args.storage == "csv":
+        # List of CSV files generated by your scripts
+        csv_files = args.inputs or ["snmp_traps.csv", "netflow_flows.csv", "snmp_poll.csv"]
+
+        # Read each CSV into a DataFrame
+        if args.archive:
+            from poll_archive import read_archive
+
+            # only the archive blocks inside --start/--end are decoded
+            csv_files = [file for file in csv_files if file != "snmp_poll.csv"]
+            dfs = [pd.read_csv(file) for file in csv_files]
+            dfs.append(read_archive(args.archive, start, end))
+        else:
+            dfs = [pd.read_csv(file) for file in csv_files]
+
+        # Convert the 'timestamp' column to datetime format in each DataFrame
+        for df in dfs:
+            df["timestamp"] = pd.to_datetime(df["timestamp"])
+
+        # Concatenate all DataFrames into a single one
+        merged_df = pd.concat(dfs, ignore_index=True)
+
+        if start is not None:
+            merged_df = merged_df[merged_df["timestamp"] >= pd.Timestamp(start)]
+        if end is not None:
+            merged_df = merged_df[merged_df["timestamp"] < pd.Timestamp(end)]
+
+        # Sort the merged DataFrame in chronological order
+        merged_df = merged_df.sort_values("timestamp")
+
+        # Save the unified dataset into a new CSV file
+        merged_df.to_csv(args.output, index=False)
+        print(f"Unified dataset saved as '{args.output}'.")
+    else:
+        from columnar_store import read_table, write_table
+
+        # Scan the three datasets (timestamps are already typed, no CSV parsing)
+        # and sort them in Arrow before writing a single columnar file
+        datasets = args.inputs or ["snmp_traps", "netflow_flows", "snmp_poll"]
+        merged_table = read_table(datasets, start=start, end=end, sort=True)
+
+        extension = ".arrow" if args.storage == "arrow" else ".parquet"
+        output = args.output.rsplit(".", 1)[0] + extension
+        write_table(merged_table, output)
+        print(f"Unified dataset saved as '{output}'.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# Ground-truth labels for the merged dataset: every row whose source is the
+# target of an injected event (anomaly_events.csv from the scenario engine)
+# and whose timestamp falls inside the event interval gets the event's label.
+# The join is one searchsorted over a (source, time) key for all events at
+# once; a row covered by several overlapping events gets their labels joined
+# with "+" (e.g. "CPU_STRESS+LINK_DOWN").
+
+EVENTS_FILE = "anomaly_events.csv"
+LABELS = {
+    "CPU": "CPU_STRESS",
+    "MEM": "MEM_STRESS",
+    "IPERF": "TRAFFIC_BURST",
+    "PING": "PING_FLOOD",
+    "LINK_FLAP": "LINK_DOWN",
+    "CMD": "INJECTED",
+}
+# Seconds added before the start and after the end of every event: samples
+# are timestamped when polled, so effects show up to one poll interval late
+MARGIN_BEFORE = 0.0
+MARGIN_AFTER = 5.0
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Bits of the combined key holding the time in ms (2^40 ms ~ 34 years)
+TIME_BITS = 40
+
+def load_events(path, margin_before=MARGIN_BEFORE, margin_after=MARGIN_AFTER):
+    # -> DataFrame[event_id, label, target, interface, start, end]; events
+    # that never started (failed injections) are skipped. An event that
+    # started but failed before logging its end (status not OK) ends at start
+    # + its planned length, or is skipped when the log has no length; only an
+    # event still running when the log was read ends now
+    events = pd.read_csv(path, dtype=str, keep_default_na=False)
+    kind = events["type"] if "type" in events.columns else events["kind"]
+    status = events.get("status", pd.Series("", index=events.index))
+    events = pd.DataFrame({
+        "event_id": events.get("event_id", pd.Series(range(1, len(events) + 1))).astype(str),
+        "label": kind.map(LABELS).fillna(kind),
+        "target": events["target"],
+        "interface": events.get("interface", ""),
+        "start": pd.to_datetime(events["start"].replace("", None)),
+        "end": pd.to_datetime(events["end"].replace("", None)),
+        "failed": ~status.isin(["", "OK"]),
+        "length": pd.to_numeric(events.get("length", pd.Series("", index=events.index)),
+                                errors="coerce"),
+    })
+    events = events[events["start"].notna()].copy()
+    planned = events["start"] + pd.to_timedelta(events["length"], unit="s")
+    events["end"] = events["end"].fillna(planned.where(events["failed"]))
+    events = events[events["end"].notna() | ~events["failed"]].copy()
+    events["end"] = events["end"].fillna(pd.Timestamp.now())
+    events = events.drop(columns=["failed", "length"])
+    events["start"] -= pd.Timedelta(seconds=margin_before)
+    events["end"] += pd.Timedelta(seconds=margin_after)
+    return events.reset_index(drop=True)
+
+def scenario_sources(path):
+    # Telemetry sources of each scenario device: its name (poller rows) and
+    # its addresses (trap agents, flow exporters)
+    with open(path, encoding="utf-8") as f:
+        devices = json.load(f)["devices"]
+    return {name: [name] + [device[key] for key in ("host", "vm_ip") if device.get(key)]
+            for name, device in devices.items()}
+
+def expand_sources(events, sources):
+    # one row per (event, telemetry source); targets missing from `sources`
+    # match a source of the same name
+    if not sources:
+        events = events.copy()
+        events["source"] = events["target"]
+        return events
+    events = events.copy()
+    events["source"] = events["target"].map(lambda target: sources.get(target, [target]))
+    return events.explode("source", ignore_index=True)
+
+def interval_join(row_sources, row_times, events):
+    # -> (row indices, event indices) of every (row, event) pair with the same
+    # source and start <= time <= end; times are datetime64[ms] arrays
+    codes, names = pd.factorize(row_sources)
+    event_codes = pd.Index(names).get_indexer(events["source"])
+    known = event_codes >= 0
+    if not known.any() or len(codes) == 0:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    event_index = np.flatnonzero(known)
+    event_codes = event_codes[known].astype(np.int64)
+
+    origin = min(row_times.min(), events["start"].min().to_datetime64())
+    limit = (1 << TIME_BITS) - 1
+    times = (row_times - origin).astype("timedelta64[ms]").astype(np.int64)
+    keys = (codes.astype(np.int64) << TIME_BITS) | times
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+
+    starts = (events["start"].values[known].astype("datetime64[ms]") - origin).astype(np.int64)
+    ends = (events["end"].values[known].astype("datetime64[ms]") - origin).astype(np.int64)
+    lo = np.searchsorted(keys, (event_codes << TIME_BITS) | np.clip(starts, 0, limit), "left")
+    hi = np.searchsorted(keys, (event_codes << TIME_BITS) | np.clip(ends, 0, limit), "right")
+
+    # contiguous run of sorted rows per event -> flat (row, event) pairs
+    lengths = np.maximum(hi - lo, 0)
+    total = int(lengths.sum())
+    pair_events = np.repeat(event_index, lengths)
+    offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    pair_rows = order[np.repeat(lo, lengths) + offsets]
+    return pair_rows, pair_events
+
+def ground_truth(df, events, sources=None):
+    # -> (label per row, "" outside events; first event id per row)
+    times = df["timestamp"]
+    if not pd.api.types.is_datetime64_any_dtype(times):
+        times = pd.to_datetime(times, format=TIMESTAMP_FORMAT)
+    times = times.values.astype("datetime64[ms]")
+    events = expand_sources(events, sources)
+    rows, event_index = interval_join(df["source"].astype(str).values, times, events)
+
+    if "if_name" in df.columns and len(rows):
+        # interface events do not claim rows about another interface
+        row_if = df["if_name"].fillna("").astype(str).values[rows]
+        event_if = events["interface"].fillna("").astype(str).values[event_index]
+        keep = (row_if == "") | (event_if == "") | (row_if == event_if)
+        rows, event_index = rows[keep], event_index[keep]
+
+    labels = np.full(len(df), "", dtype=object)
+    event_ids = np.full(len(df), "", dtype=object)
+    if not len(rows):
+        return labels, event_ids
+    # bit per distinct label, then one string per distinct combination
+    label_codes, label_names = pd.factorize(events["label"].values[event_index])
+    masks = np.zeros(len(df), dtype=np.int64)
+    np.bitwise_or.at(masks, rows, np.left_shift(1, label_codes.astype(np.int64)))
+    combos, inverse = np.unique(masks, return_inverse=True)
+    names = np.array(["+".join(sorted(label_names[bit] for bit in range(len(label_names))
+                                      if combo >> bit & 1)) for combo in combos], dtype=object)
+    labels = names[inverse.ravel()]
+
+    first = pd.Series(events["event_id"].values[event_index]).groupby(rows).first()
+    event_ids[first.index.values] = first.values
+    return labels, event_ids
+
+def label_frame(df, events, sources=None, outside="keep", audit=False):
+    # label := ground truth inside events; outside them the collectors'
+    # threshold label is kept ("keep") or cleared ("normal"). With audit the
+    # original label is kept in collector_label and the matching event in
+    # event_id (drop both before the ARFF conversion, they give the label away)
+    truth, event_ids = ground_truth(df, events, sources)
+    inside = truth != ""
+    if audit:
+        df["collector_label"] = df["label"]
+        df["event_id"] = event_ids
+    if outside == "normal":
+        df["label"] = np.where(inside, truth, "")
+    else:
+        df["label"] = np.where(inside, truth, df["label"].fillna("").astype(str))
+    return int(inside.sum())
+
+def read_dataset(path):
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    if path.endswith(".arrow"):
+        return pd.read_feather(path)
+    # as text, so values are written back unchanged
+    return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+def write_dataset(df, path):
+    if path.endswith(".parquet"):
+        df.to_parquet(path, index=False)
+    elif path.endswith(".arrow"):
+        df.to_feather(path)
+    else:
+        df.to_csv(path, index=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="Label the merged dataset with the injected events")
+    parser.add_argument("input", nargs="?", default="last/merged_dataset.csv")
+    parser.add_argument("-o", "--output", default=None,
+                        help="default: <input>_labeled.<ext>")
+    parser.add_argument("--events", default=EVENTS_FILE,
+                        help="event intervals (anomaly_events.csv from scenario_engine.py)")
+    parser.add_argument("--scenario", default=None,
+                        help="scenario JSON: map each device to its names and addresses")
+    parser.add_argument("--sources", default=None,
+                        help='JSON file {"target": ["source", ...]}, overrides --scenario')
+    parser.add_argument("--margin-before", type=float, default=MARGIN_BEFORE)
+    parser.add_argument("--margin-after", type=float, default=MARGIN_AFTER)
+    parser.add_argument("--outside", choices=["keep", "normal"], default="keep",
+                        help="outside events keep the collectors' labels or clear them")
+    parser.add_argument("--audit", action="store_true",
+                        help="add collector_label and event_id columns")
+    args = parser.parse_args()
+
+    sources = None
+    if args.scenario:
+        sources = scenario_sources(args.scenario)
+    if args.sources:
+        with open(args.sources, encoding="utf-8") as f:
+            sources = json.load(f)
+    events = load_events(args.events, args.margin_before, args.margin_after)
+    df = read_dataset(args.input)
+    labeled = label_frame(df, events, sources, args.outside, args.audit)
+    base, ext = os.path.splitext(args.input)
+    output = args.output or f"{base}_labeled{ext}"
+    write_dataset(df, output)
+    print(f"{labeled} of {len(df)} rows inside {len(events)} injected events, saved as '{output}'.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,494 @@
+import argparse
+import glob
+import json
+import os
+import struct
+import zlib
+import numpy as np
+import pandas as pd
+
+# Compressed archive format for snmp_poll output (Gorilla-style segments).
+# Samples are grouped per (source, record_type, metric) series and cut into
+# blocks of at most BLOCK_POINTS samples. In each block:
+#   - timestamps are stored as delta-of-delta, zero for a regular poll;
+#   - values are XORed with the previous value (Gorilla), or, when every value
+#     is an integer, stored as delta-of-delta like the timestamps: monotonic
+#     counters (sysUpTime) and constants (memTotal) then cost ~1 bit each;
+#   - labels, messages and the text of values that do not read back as
+#     written ("up", "1e3", ...) go to a small zlib'ed side list.
+# Flags, widths and payload bits are kept in separate bit streams, so whole
+# blocks are encoded and decoded with NumPy instead of bit by bit.
+#
+# Segment file: MAGIC, blocks, series table (JSON), block index, footer.
+# The index holds (series, first time, last time, rows, offset, length) per
+# block, so a time range query reads and decodes only the blocks it touches.
+# Values are read back as their original text (iter_rows, read) or as floats,
+# NaN where empty or not numeric (read_archive); timestamps as
+# "YYYY-mm-dd HH:MM:SS".
+
+MAGIC = b"TSZ1"
+EXTENSION = ".tsz"
+BLOCK_POINTS = 1024
+FIELDS = ["timestamp", "source", "record_type", "metric", "value", "label", "message"]
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Payload widths of non-zero delta-of-deltas, selected with 2 bits
+INT_WIDTHS = np.array([7, 14, 28, 64], dtype=np.int64)
+VALUE_XOR = 0
+VALUE_DOD = 1
+# Codec flag: the block's values are written as integers ("1"), not repr ("1.0")
+TEXT_INT = 0x10
+# Integer values beyond this are not exact as floats, they use XOR
+MAX_EXACT_INT = 2 ** 53
+
+INDEX_DTYPE = np.dtype([("series", "<u4"), ("start", "<i8"), ("end", "<i8"),
+                        ("rows", "<u4"), ("offset", "<u8"), ("length", "<u4")])
+# series table length, index offset, block count, magic
+FOOTER = struct.Struct("<IQI4s")
+BLOCK_HEADER = struct.Struct("<IqBIII")
+
+# Bit streams
+
+def pack_fields(values, widths):
+    # values (uint64) written MSB first on widths bits each, one bit stream
+    widths = np.asarray(widths, dtype=np.int64)
+    total = int(widths.sum())
+    if total == 0:
+        return b""
+    field = np.repeat(np.arange(len(widths)), widths)
+    offset = np.arange(total) - np.repeat(np.cumsum(widths) - widths, widths)
+    shifts = (widths[field] - 1 - offset).astype(np.uint64)
+    bits = (values.astype(np.uint64)[field] >> shifts) & np.uint64(1)
+    return np.packbits(bits.astype(np.uint8)).tobytes()
+
+def unpack_fields(data, widths):
+    widths = np.asarray(widths, dtype=np.int64)
+    values = np.zeros(len(widths), dtype=np.uint64)
+    total = int(widths.sum())
+    if total == 0:
+        return values
+    bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8), count=total).astype(np.uint64)
+    field = np.repeat(np.arange(len(widths)), widths)
+    offset = np.arange(total) - np.repeat(np.cumsum(widths) - widths, widths)
+    shifted = bits << (widths[field] - 1 - offset).astype(np.uint64)
+    present = widths > 0
+    starts = (np.cumsum(widths) - widths)[present]
+    values[present] = np.bitwise_or.reduceat(shifted, starts)
+    return values
+
+def pack_flags(flags):
+    return np.packbits(flags.astype(np.uint8)).tobytes()
+
+def unpack_flags(data, count):
+    return np.unpackbits(np.frombuffer(data, dtype=np.uint8), count=count).astype(bool)
+
+def bit_length(x):
+    # bit length of every uint64 (0 for 0)
+    x = x.astype(np.uint64)
+    length = np.zeros(len(x), dtype=np.int64)
+    for step in (32, 16, 8, 4, 2, 1):
+        high = x >= (np.uint64(1) << np.uint64(step))
+        length[high] += step
+        x = np.where(high, x >> np.uint64(step), x)
+    return length + (x > 0)
+
+def trailing_zeros(x):
+    # trailing zero bits of every non-zero uint64
+    x = x.astype(np.uint64)
+    lowest = x & (~x + np.uint64(1))
+    return bit_length(lowest) - 1
+
+def sections(*parts):
+    return b"".join(struct.pack("<I", len(part)) + part for part in parts)
+
+def split_sections(data, count):
+    parts = []
+    offset = 0
+    for _ in range(count):
+        (length,) = struct.unpack_from("<I", data, offset)
+        offset += 4
+        parts.append(data[offset:offset + length])
+        offset += length
+    return parts
+
+# Integer stream: delta-of-delta, zigzag, zero flag then 2-bit width selector
+
+def encode_ints(x):
+    x = x.astype(np.int64)
+    zigzag = ((x << 1) ^ (x >> 63)).astype(np.uint64)
+    nonzero = zigzag != 0
+    payload = zigzag[nonzero]
+    selector = np.searchsorted(INT_WIDTHS, bit_length(payload))
+    return sections(pack_flags(nonzero), pack_fields(selector, np.full(len(payload), 2)),
+                    pack_fields(payload, INT_WIDTHS[selector]))
+
+def decode_ints(data, count):
+    flags, selectors, payload = split_sections(data, 3)
+    nonzero = unpack_flags(flags, count)
+    selector = unpack_fields(selectors, np.full(int(nonzero.sum()), 2)).astype(np.int64)
+    zigzag = np.zeros(count, dtype=np.uint64)
+    zigzag[nonzero] = unpack_fields(payload, INT_WIDTHS[selector])
+    return ((zigzag >> np.uint64(1)).astype(np.int64)
+            ^ -(zigzag & np.uint64(1)).astype(np.int64))
+
+def delta_of_delta(x):
+    # [x0, d0, d1 - d0, d2 - d1, ...]
+    deltas = np.diff(x)
+    return np.concatenate((x[:1], deltas[:1], np.diff(deltas)))
+
+def undo_delta_of_delta(dod):
+    if len(dod) < 2:
+        return dod.copy()
+    deltas = np.cumsum(dod[1:])
+    return np.concatenate((dod[:1], dod[0] + np.cumsum(deltas)))
+
+# Float stream: XOR with the previous value; a non-zero XOR keeps its
+# meaningful bits either inside the block-wide window (1 flag bit) or inside
+# its own window (5 bits of leading zeros + 6 bits of length), as in Gorilla
+
+def encode_floats(values):
+    bits = values.astype(np.float64).view(np.uint64)
+    xor = bits[1:] ^ bits[:-1]
+    nonzero = xor != 0
+    x = xor[nonzero]
+    lead = np.minimum(64 - bit_length(x), 31)
+    trail = trailing_zeros(x) if len(x) else np.zeros(0, dtype=np.int64)
+    block_lead = int(lead.min()) if len(x) else 0
+    block_trail = int(trail.min()) if len(x) else 0
+    # the shared window is worth it unless it costs more than an own header
+    reuse = 64 - block_lead - block_trail <= 64 - lead - trail + 11
+    lead = np.where(reuse, block_lead, lead)
+    trail = np.where(reuse, block_trail, trail)
+    own_windows = np.column_stack((lead[~reuse], 63 - trail[~reuse] - lead[~reuse])).ravel()
+    header = struct.pack("<QBB", int(bits[0]), block_lead, block_trail)
+    return sections(header, pack_flags(nonzero), pack_flags(reuse),
+                    pack_fields(own_windows.astype(np.uint64),
+                                np.tile([5, 6], int((~reuse).sum()))),
+                    pack_fields(x >> trail.astype(np.uint64), 64 - lead - trail))
+
+def decode_floats(data, count):
+    header, flags, reuse_flags, windows, payload = split_sections(data, 5)
+    first, block_lead, block_trail = struct.unpack("<QBB", header)
+    nonzero = unpack_flags(flags, count - 1)
+    reuse = unpack_flags(reuse_flags, int(nonzero.sum()))
+    own = unpack_fields(windows, np.tile([5, 6], int((~reuse).sum()))).astype(np.int64)
+    lead = np.full(len(reuse), block_lead, dtype=np.int64)
+    length = np.full(len(reuse), 64 - block_lead - block_trail, dtype=np.int64)
+    lead[~reuse] = own[0::2]
+    length[~reuse] = own[1::2] + 1
+    trail = 64 - lead - length
+    xor = np.zeros(count, dtype=np.uint64)
+    xor[0] = first
+    xor[1:][nonzero] = unpack_fields(payload, length) << trail.astype(np.uint64)
+    return np.bitwise_xor.accumulate(xor).view(np.float64)
+
+def integer_values(values):
+    # -> int64 array when every value is a finite integer exact as a float
+    if not np.isfinite(values).all() or (np.abs(values) >= MAX_EXACT_INT).any():
+        return None
+    if (values != np.floor(values)).any() or np.signbit(values[values == 0]).any():
+        return None
+    return values.astype(np.int64)
+
+# Blocks
+
+def render_values(values, integer):
+    # float64 -> value texts, "" for NaN
+    if integer:
+        return ["" if value != value else str(int(value)) for value in values.tolist()]
+    return ["" if value != value else repr(value) for value in values.tolist()]
+
+def text_style(values, texts):
+    # -> (integer, rendered): the text style matching most of the original texts
+    rendered = render_values(values, False)
+    if integer_values(values[~np.isnan(values)]) is None:
+        return False, rendered
+    as_integers = render_values(values, True)
+    if sum(map(str.__eq__, as_integers, texts)) > sum(map(str.__eq__, rendered, texts)):
+        return True, as_integers
+    return False, rendered
+
+def encode_block(times, values, extras, integer_text=False):
+    # times: int64 epoch seconds (naive), values: float64 (NaN = empty),
+    # extras: {row offset: [label, message] or [label, message, value text]}
+    # for the rows with a label, a message or a value text not rendered back
+    times_data = encode_ints(delta_of_delta(times))
+    codec, values_data = VALUE_XOR, encode_floats(values)
+    integers = integer_values(values)
+    if integers is not None:
+        dod_data = encode_ints(delta_of_delta(integers))
+        if len(dod_data) < len(values_data):
+            codec, values_data = VALUE_DOD, dod_data
+    extras_data = zlib.compress(json.dumps(extras, separators=(",", ":")).encode("utf-8")) \
+        if extras else b""
+    if integer_text:
+        codec |= TEXT_INT
+    return BLOCK_HEADER.pack(len(times), int(times[0]), codec, len(times_data),
+                             len(values_data), len(extras_data)) \
+        + times_data + values_data + extras_data
+
+def decode_block(data):
+    # -> times, values, extras, integer text style
+    count, _, codec, times_length, values_length, extras_length = \
+        BLOCK_HEADER.unpack_from(data)
+    offset = BLOCK_HEADER.size
+    times = undo_delta_of_delta(decode_ints(data[offset:offset + times_length], count))
+    offset += times_length
+    values_data = data[offset:offset + values_length]
+    if codec & 0x0F == VALUE_DOD:
+        values = undo_delta_of_delta(decode_ints(values_data, count)).astype(np.float64)
+    else:
+        values = decode_floats(values_data, count)
+    offset += values_length
+    extras = {}
+    if extras_length:
+        extras = json.loads(zlib.decompress(data[offset:offset + extras_length]))
+    return times, values, extras, bool(codec & TEXT_INT)
+
+# Writing
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def to_seconds(timestamps):
+    # naive timestamps -> seconds, no time zone involved so text round-trips
+    return (pd.to_datetime(timestamps, format=TIMESTAMP_FORMAT)
+            .values.astype("datetime64[s]").astype(np.int64))
+
+def write_segment(df, path, block_points=BLOCK_POINTS):
+    # df: snmp_poll rows (as read with dtype=str) -> one segment file
+    df = df.reset_index(drop=True)
+    seconds = to_seconds(df["timestamp"])
+    # float() rather than pd.to_numeric, which is not exact to the last bit
+    texts = df["value"].fillna("").astype(str).to_numpy()
+    values = np.array([to_float(value) for value in texts.tolist()], dtype=np.float64)
+    label = df["label"].fillna("").astype(str).to_numpy() if "label" in df else None
+    message = df["message"].fillna("").astype(str).to_numpy() if "message" in df else None
+    keys = df[["source", "record_type", "metric"]].fillna("").astype(str)
+    codes, series = pd.MultiIndex.from_frame(keys).factorize()
+    # per series, in time order (stable: same-second rows keep file order)
+    order = np.lexsort((seconds, codes))
+    codes, seconds, values = codes[order], seconds[order], values[order]
+    bounds = np.flatnonzero(np.diff(codes)) + 1
+    starts = np.concatenate(([0], bounds))
+    ends = np.concatenate((bounds, [len(codes)]))
+
+    index = []
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        for start, end in zip(starts, ends):
+            for block_start in range(start, end, block_points):
+                block_end = min(block_start + block_points, end)
+                rows = order[block_start:block_end]
+                integer, rendered = text_style(values[block_start:block_end],
+                                               texts[rows].tolist())
+                extras = {}
+                for offset, row in enumerate(rows):
+                    extra = [label[row] if label is not None else "",
+                             message[row] if message is not None else ""]
+                    if texts[row] != rendered[offset]:
+                        extra.append(texts[row])
+                    if extra[0] or extra[1] or len(extra) > 2:
+                        extras[offset] = extra
+                block = encode_block(seconds[block_start:block_end],
+                                     values[block_start:block_end], extras, integer)
+                index.append((codes[block_start], seconds[block_start],
+                              seconds[block_end - 1], block_end - block_start, f.tell(),
+                              len(block)))
+                f.write(block)
+        table = json.dumps([list(key) for key in series]).encode("utf-8")
+        index_offset = f.tell()
+        f.write(table)
+        f.write(np.array(index, dtype=INDEX_DTYPE).tobytes())
+        f.write(FOOTER.pack(len(table), index_offset, len(index), MAGIC))
+    return len(df)
+
+# Reading
+
+class Segment:
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            f.seek(-FOOTER.size, os.SEEK_END)
+            table_length, index_offset, blocks, magic = FOOTER.unpack(f.read(FOOTER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a poll archive segment")
+            f.seek(index_offset)
+            self.series = [tuple(key) for key in json.loads(f.read(table_length))]
+            self.index = np.frombuffer(f.read(blocks * INDEX_DTYPE.itemsize), dtype=INDEX_DTYPE)
+
+    def rows(self):
+        return int(self.index["rows"].sum())
+
+    def time_range(self):
+        # -> (first, last) epoch seconds of the segment, None when empty
+        if not len(self.index):
+            return None
+        return int(self.index["start"].min()), int(self.index["end"].max())
+
+    def blocks(self, start=None, end=None, sources=None, metrics=None):
+        # index entries of the blocks overlapping [start, end) for the series asked
+        keep = np.ones(len(self.index), dtype=bool)
+        if start is not None:
+            keep &= self.index["end"] >= start
+        if end is not None:
+            keep &= self.index["start"] < end
+        if sources is not None or metrics is not None:
+            wanted = np.array([(sources is None or source in sources) and
+                               (metrics is None or metric in metrics)
+                               for source, _, metric in self.series], dtype=bool)
+            keep &= wanted[self.index["series"]] if len(wanted) else False
+        return self.index[keep]
+
+    def read(self, start=None, end=None, sources=None, metrics=None, text=False):
+        # -> DataFrame of the rows in [start, end) (epoch seconds), in time order;
+        # values as floats, or as their original text with text=True
+        times, values, series, labels, messages = [], [], [], [], []
+        with open(self.path, "rb") as f:
+            for entry in self.blocks(start, end, sources, metrics):
+                f.seek(int(entry["offset"]))
+                block_times, block_values, extras, integer = \
+                    decode_block(f.read(int(entry["length"])))
+                block_labels = np.full(len(block_times), "", dtype=object)
+                block_messages = np.full(len(block_times), "", dtype=object)
+                if text:
+                    block_values = np.array(render_values(block_values, integer), dtype=object)
+                for offset, extra in extras.items():
+                    block_labels[int(offset)] = extra[0]
+                    block_messages[int(offset)] = extra[1]
+                    if text and len(extra) > 2:
+                        block_values[int(offset)] = extra[2]
+                keep = np.ones(len(block_times), dtype=bool)
+                if start is not None:
+                    keep &= block_times >= start
+                if end is not None:
+                    keep &= block_times < end
+                times.append(block_times[keep])
+                values.append(block_values[keep])
+                series.append(np.full(int(keep.sum()), entry["series"], dtype=np.int64))
+                labels.append(block_labels[keep])
+                messages.append(block_messages[keep])
+        if not times:
+            return pd.DataFrame(columns=FIELDS)
+        times = np.concatenate(times)
+        order = np.argsort(times, kind="stable")
+        times, codes = times[order], np.concatenate(series)[order]
+        # every distinct second and series is formatted once
+        seconds, inverse = np.unique(times, return_inverse=True)
+        names = pd.to_datetime(seconds, unit="s").strftime(TIMESTAMP_FORMAT).to_numpy(object)
+        keys = np.array(self.series + [("", "", "")], dtype=object)
+        return pd.DataFrame({
+            "timestamp": names[inverse.ravel()],
+            "source": keys[codes, 0], "record_type": keys[codes, 1], "metric": keys[codes, 2],
+            "value": np.concatenate(values)[order],
+            "label": np.concatenate(labels)[order],
+            "message": np.concatenate(messages)[order]})
+
+def to_epoch(value):
+    # None, epoch seconds or a timestamp string -> naive epoch seconds
+    if value is None:
+        return None
+    if isinstance(value, (int, float, np.integer)):
+        return int(value)
+    return int(pd.Timestamp(value).value // 10 ** 9)
+
+def segment_paths(paths):
+    # files, directories and glob patterns -> segment files in time order
+    found = []
+    for path in ([paths] if isinstance(paths, str) else paths):
+        if os.path.isdir(path):
+            found.extend(glob.glob(os.path.join(path, f"*{EXTENSION}")))
+        elif glob.has_magic(path):
+            found.extend(glob.glob(path))
+        else:
+            found.append(path)
+    segments = [Segment(path) for path in sorted(set(found))]
+    return sorted((segment for segment in segments if segment.time_range() is not None),
+                  key=lambda segment: segment.time_range())
+
+def read_archive(paths, start=None, end=None, sources=None, metrics=None, text=False):
+    # -> DataFrame[FIELDS] of every segment overlapping [start, end), values as
+    # floats (NaN where the poll returned nothing or text), or as their
+    # original text with text=True
+    start, end = to_epoch(start), to_epoch(end)
+    frames = []
+    for segment in segment_paths(paths):
+        first, last = segment.time_range()
+        if (start is not None and last < start) or (end is not None and first >= end):
+            continue
+        frames.append(segment.read(start, end, sources, metrics, text))
+    if not frames:
+        return pd.DataFrame(columns=FIELDS)
+    df = pd.concat(frames, ignore_index=True)
+    return df.sort_values("timestamp", kind="stable").reset_index(drop=True)
+
+def iter_rows(paths, start=None, end=None):
+    # CSV-like dict rows (strings) in time order, one segment decoded at a
+    # time; for stream_merge.py and split_file.py
+    start, end = to_epoch(start), to_epoch(end)
+    for segment in segment_paths(paths):
+        first, last = segment.time_range()
+        if (start is not None and last < start) or (end is not None and first >= end):
+            continue
+        df = segment.read(start, end, text=True)
+        columns = [df[name].tolist() for name in FIELDS]
+        for values in zip(*columns):
+            yield dict(zip(FIELDS, values))
+
+def archive_rows(paths):
+    return sum(segment.rows() for segment in segment_paths(paths))
+
+# Command line
+
+def same_rows(a, b):
+    # same rows, in any order
+    a = a.reindex(columns=FIELDS, fill_value="").sort_values(FIELDS).reset_index(drop=True)
+    b = b.reindex(columns=FIELDS, fill_value="").sort_values(FIELDS).reset_index(drop=True)
+    return a.equals(b)
+
+def pack(inputs, output_dir=None, block_points=BLOCK_POINTS, remove=False):
+    for path in inputs:
+        base = os.path.splitext(os.path.basename(path))[0]
+        output = os.path.join(output_dir or os.path.dirname(path), base + EXTENSION)
+        df = pd.read_csv(path, dtype=str, keep_default_na=False)
+        rows = write_segment(df, output, block_points)
+        before, after = os.path.getsize(path), os.path.getsize(output)
+        if remove:
+            # only once the segment reads back as the CSV, row for row
+            if not same_rows(df, Segment(output).read(text=True)):
+                raise RuntimeError(f"{output} does not read back as {path}, {path} kept")
+            os.remove(path)
+        print(f"{path} -> {output}: {rows} rows, {before} -> {after} bytes "
+              f"({before / max(after, 1):.1f}x)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compressed archive of snmp_poll output")
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack_parser = commands.add_parser("pack", help="convert snmp_poll CSV files to segments")
+    pack_parser.add_argument("inputs", nargs="+")
+    pack_parser.add_argument("-o", "--output-dir", default=None,
+                             help="default: next to each input")
+    pack_parser.add_argument("--block-points", type=int, default=BLOCK_POINTS)
+    pack_parser.add_argument("--remove", action="store_true",
+                             help="delete each CSV once its segment is written")
+    read_parser = commands.add_parser("read", help="decode segments back to CSV")
+    read_parser.add_argument("inputs", nargs="+", help="segments, directories or patterns")
+    read_parser.add_argument("-o", "--output", default="snmp_poll_archive.csv")
+    read_parser.add_argument("--start", default=None, help='"YYYY-mm-dd HH:MM:SS", inclusive')
+    read_parser.add_argument("--end", default=None, help='"YYYY-mm-dd HH:MM:SS", exclusive')
+    read_parser.add_argument("--source", action="append", default=None)
+    read_parser.add_argument("--metric", action="append", default=None)
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        pack(args.inputs, args.output_dir, args.block_points, args.remove)
+        return
+    df = read_archive(args.inputs, args.start, args.end, args.source, args.metric, text=True)
+    df.to_csv(args.output, index=False)
+    print(f"{len(df)} rows saved as '{args.output}'.")
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,196 @@
-import pandas as pd
-import math
+import argparse
+import csv
+import itertools
+import os
+import queue
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 
 # Chemin du fichier CSV merged d'entrée
 input_csv = "merged_dataset.csv"
 # Préfixe pour les fichiers de sortie
 output_prefix = "merged_dataset_part"
 
-# Charger le fichier CSV dans un DataFrame
-df = pd.read_csv(input_csv)
+# Nombre de parties par défaut (l'ancien découpage fixe en 4)
+DEFAULT_PARTS = 4
+# Fichiers écrits en parallèle, et lignes envoyées à la fois à un écrivain
+WRITERS = 4
+CHUNK_ROWS = 10000
+# Paquets de lignes en attente par partie avant de bloquer la lecture
+MAX_PENDING_CHUNKS = 8
 
-# Nombre total de lignes dans le fichier
-total_rows = len(df)
-print(f"Nombre total de lignes : {total_rows}")
+# Fenêtres calendaires : longueur du préfixe de "YYYY-mm-dd HH:MM:SS"
+WINDOW_PREFIXES = {"daily": 10, "hourly": 13, "minutely": 16}
+
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+def parse_size(text):
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([KMG]?)i?B?", text.strip().upper())
+    if match is None:
+        raise argparse.ArgumentTypeError(f"taille invalide : {text}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+def window_key_function(window):
+    # timestamp -> identifiant de la fenêtre, ordonné comme le temps
+    if window in WINDOW_PREFIXES:
+        length = WINDOW_PREFIXES[window]
+        return lambda timestamp: timestamp[:length]
+    seconds = int(window)
+    return lambda timestamp: str(int(datetime.fromisoformat(timestamp).timestamp()) // seconds * seconds)
+
+def window_label(key):
+    if key.isdigit():
+        return datetime.fromtimestamp(int(key)).strftime("%Y-%m-%dT%H%M%S")
+    return key.replace(" ", "T").replace(":", "")
+
+def csv_source(path):
+    # (en-tête, lignes, poids d'une ligne, poids total) : le poids est la
+    # taille approximative de la ligne en octets
+    f = open(path, newline="", encoding="utf-8")
+    reader = csv.reader(f)
+    header = next(reader)
+
+    def rows():
+        with f:
+            yield from reader
+
+    return header, rows(), row_bytes, os.path.getsize(path)
+
+def columnar_source(path):
+    # .parquet / .arrow écrit par fusion_collected_files.py : lu par batches,
+    # le poids d'une ligne est 1 et le poids total le nombre de lignes
+    from columnar_store import iter_merged_batches, merged_rows
+
+    batches = iter_merged_batches(path)
+    first = next(batches)
+    header = [name for name in first.schema.names if name != "date"]
+
+    def rows():
+        for batch in itertools.chain([first], batches):
+            columns = [batch.column(name).to_pylist() for name in header]
+            for values in zip(*columns):
+                yield ["" if value is None else str(value) for value in values]
+
+    return header, rows(), lambda row: 1, merged_rows(path)
+
+def archive_source(path):
+    # segments .tsz de poll_archive.py : décodés un à la fois, le poids d'une
+    # ligne est 1 et le poids total le nombre de lignes donné par leurs index
+    from poll_archive import iter_rows, archive_rows, FIELDS
 
-# Calculer la taille de chaque segment (nombre de lignes par fichier)
-chunk_size = math.ceil(total_rows / 4)
-print(f"Taille de chaque segment : environ {chunk_size} lignes")
-
-# Découper le DataFrame en 4 segments et sauvegarder chacun dans un fichier CSV séparé
-for i in range(4):
-    start_idx = i * chunk_size
-    end_idx = min((i + 1) * chunk_size, total_rows)
-    chunk = df.iloc[start_idx:end_idx]
-    output_file = f"{output_prefix}{i+1}.csv"
-    chunk.to_csv(output_file, index=False)
-    print(f"Segment {i+1} sauvegardé : lignes {start_idx} à {end_idx-1} dans {output_file}")
+    def rows():
+        for row in iter_rows([path]):
+            yield [row[name] for name in FIELDS]
+
+    return list(FIELDS), rows(), lambda row: 1, archive_rows([path])
+
+def row_bytes(row):
+    return sum(len(field) for field in row) + len(row)
+
+def write_part(path, header, chunks):
+    rows = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                break
+            writer.writerows(chunk)
+            rows += len(chunk)
+    return path, rows
+
+def put_chunk(part, chunk):
+    # bloque si l'écrivain est en retard, mais remonte son erreur s'il est mort
+    future, chunks = part
+    while True:
+        try:
+            chunks.put(chunk, timeout=1)
+            return
+        except queue.Full:
+            if future.done():
+                future.result()
+                raise RuntimeError("écrivain de partie arrêté")
+
+def split(path, prefix, parts=None, max_bytes=None, window=None, writers=WRITERS):
+    if path.endswith((".parquet", ".arrow")):
+        header, rows, weigh, total = columnar_source(path)
+    elif path.endswith(".tsz"):
+        header, rows, weigh, total = archive_source(path)
+    else:
+        header, rows, weigh, total = csv_source(path)
+    if window is not None:
+        window_key = window_key_function(window)
+    parts = parts or DEFAULT_PARTS
+
+    results = []
+    part = None
+    pending = []
+    index = 0
+    key = None
+    part_bytes = 0
+    consumed = 0
+    last_timestamp = None
+
+    with ThreadPoolExecutor(max_workers=writers) as pool:
+
+        def close_part():
+            if part is not None:
+                if pending:
+                    put_chunk(part, list(pending))
+                put_chunk(part, None)
+                pending.clear()
+
+        for row in rows:
+            timestamp = row[0]
+            # On ne coupe qu'à un changement de timestamp : un cycle de
+            # collecte n'est jamais réparti sur deux fichiers
+            if timestamp != last_timestamp:
+                last_timestamp = timestamp
+                if window is not None:
+                    new_key = window_key(timestamp)
+                    # une ligne en retard reste dans la fenêtre courante
+                    cut = part is None or new_key > key
+                elif max_bytes is not None:
+                    cut = part is None or part_bytes >= max_bytes
+                else:
+                    cut = part is None or consumed >= total * index / parts
+                if cut:
+                    close_part()
+                    index += 1
+                    if window is not None:
+                        key = new_key
+                        output = f"{prefix}_{window_label(key)}.csv"
+                    else:
+                        output = f"{prefix}{index}.csv"
+                    chunks = queue.Queue(maxsize=MAX_PENDING_CHUNKS)
+                    part = (pool.submit(write_part, output, header, chunks), chunks)
+                    results.append(part[0])
+                    part_bytes = 0
+            pending.append(row)
+            weight = weigh(row)
+            part_bytes += row_bytes(row) if max_bytes is not None else weight
+            consumed += weight
+            if len(pending) >= CHUNK_ROWS:
+                put_chunk(part, list(pending))
+                pending.clear()
+        close_part()
+
+    return [future.result() for future in results]
+
+parser = argparse.ArgumentParser(description="Découpe le dataset fusionné sur des frontières de timestamp")
+parser.add_argument("input", nargs="?", default=input_csv)
+parser.add_argument("--prefix", default=output_prefix)
+mode = parser.add_mutually_exclusive_group()
+mode.add_argument("--parts", type=int, help=f"nombre de parties (défaut {DEFAULT_PARTS})")
+mode.add_argument("--size", type=parse_size, help="taille cible d'une partie, ex. 64M")
+mode.add_argument("--window", help="hourly, daily, minutely ou une durée en secondes")
+parser.add_argument("--writers", type=int, default=WRITERS)
+args = parser.parse_args()
+
+written = split(args.input, args.prefix, args.parts, args.size, args.window, args.writers)
+total_rows = sum(rows for _, rows in written)
+print(f"Nombre total de lignes : {total_rows}")
+for i, (output_file, rows) in enumerate(written, 1):
+    print(f"Segment {i} sauvegardé : {rows} lignes dans {output_file}")
@@ -0,0 +1,124 @@
+import csv
+import glob
+import heapq
+import itertools
+import os
+import re
+from operator import itemgetter
+
+# Streaming k-way merge of collector CSV files. Each collector appends in
+# time order, so every input is (almost) sorted already: rows go through a
+# bounded reorder heap per input, then heapq.merge interleaves the inputs.
+# Memory is REORDER_ROWS rows per input whatever the size of the files.
+
+REORDER_ROWS = 10000
+# Compressed poll segments (poll_archive.EXTENSION), decoded one at a time
+ARCHIVE_EXTENSION = ".tsz"
+
+BASE_FIELDS = ["timestamp", "source", "record_type", "metric", "value", "label", "message"]
+
+# <base>.csv is the active file, <base>.<YYYYmmdd-HHMMSS>[.<n>].csv are the
+# segments rotated out of it by csv_sink.CsvSink; rotated segments packed by
+# poll_archive.py keep their name with a .tsz extension
+SEGMENT_RE = re.compile(r"^(?P<base>.+?)(?:\.(?P<stamp>\d{8}-\d{6})(?:\.(?P<seq>\d+))?)?"
+                        r"\.(?:csv|tsz)$")
+
+def segment_key(path):
+    match = SEGMENT_RE.match(os.path.basename(path))
+    if match is None or match.group("stamp") is None:
+        return (1, "", 0)
+    return (0, match.group("stamp"), int(match.group("seq") or 0))
+
+def group_segments(paths):
+    # {stream: [segments in write order]}; the segments of one stream are
+    # read one after the other, so only one file per stream is open at a time
+    groups = {}
+    for path in paths:
+        match = SEGMENT_RE.match(os.path.basename(path))
+        base = match.group("base") if match else path
+        groups.setdefault(os.path.join(os.path.dirname(path), base), []).append(path)
+    return {stream: sorted(segments, key=segment_key) for stream, segments in groups.items()}
+
+def default_inputs(names):
+    paths = []
+    for name in names:
+        paths.extend(glob.glob(f"{name}*.csv"))
+        paths.extend(glob.glob(f"{name}*{ARCHIVE_EXTENSION}"))
+    return sorted(paths)
+
+def read_header(path):
+    if path.endswith(ARCHIVE_EXTENSION):
+        return BASE_FIELDS
+    with open(path, newline="", encoding="utf-8") as f:
+        return next(csv.reader(f), [])
+
+def merged_fieldnames(paths):
+    fieldnames = list(BASE_FIELDS)
+    for path in paths:
+        for name in read_header(path):
+            if name not in fieldnames:
+                fieldnames.append(name)
+    return fieldnames
+
+def read_segments(segments, start=None, end=None):
+    # rows with start <= timestamp < end ("YYYY-mm-dd HH:MM:SS" strings); the
+    # archive segments only decode the blocks inside the range
+    for path in segments:
+        if path.endswith(ARCHIVE_EXTENSION):
+            from poll_archive import iter_rows
+            yield from iter_rows([path], start, end)
+            continue
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = csv.DictReader(f)
+            if start is None and end is None:
+                yield from rows
+                continue
+            for row in rows:
+                if (start is None or row["timestamp"] >= start) and \
+                        (end is None or row["timestamp"] < end):
+                    yield row
+
+def reorder(rows, buffer_rows, stats):
+    # Emits rows in timestamp order as long as no row arrives more than
+    # buffer_rows positions late; later ones are passed through and counted
+    heap = []
+    last = ""
+    for seq, row in enumerate(rows):
+        heapq.heappush(heap, (row["timestamp"], seq, row))
+        if len(heap) > buffer_rows:
+            timestamp, _, out = heapq.heappop(heap)
+            if timestamp < last:
+                stats["late"] += 1
+            else:
+                last = timestamp
+            yield out
+    while heap:
+        timestamp, _, out = heapq.heappop(heap)
+        if timestamp < last:
+            stats["late"] += 1
+        else:
+            last = timestamp
+        yield out
+
+def merge_files(paths, output, buffer_rows=REORDER_ROWS, start=None, end=None):
+    # -> {"rows": rows written, "late": rows that were still out of order}
+    groups = group_segments(paths)
+    stats = {"rows": 0, "late": 0}
+    streams = [reorder(read_segments(segments, start, end), buffer_rows, stats)
+               for segments in groups.values()]
+    fieldnames = merged_fieldnames(paths)
+
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, restval="")
+        writer.writeheader()
+        merged = heapq.merge(*streams, key=itemgetter("timestamp"))
+        while True:
+            chunk = list(itertools.islice(merged, 10000))
+            if not chunk:
+                break
+            writer.writerows(chunk)
+            stats["rows"] += len(chunk)
+    return stats
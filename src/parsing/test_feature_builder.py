@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import feature_builder
+from feature_builder import build_features, output_segments, read_features
+
+def long_rows():
+    # 20 minutes of 5 s polls of two sources: a noisy metric, a flat one, a
+    # metric that only appears after 10 minutes, traps, flows and tied labels
+    rng = np.random.default_rng(7)
+    start = pd.Timestamp("2025-03-01 10:00:00")
+    rows = []
+    for step in range(240):
+        timestamp = (start + pd.Timedelta(seconds=5 * step)).strftime("%Y-%m-%d %H:%M:%S")
+        for source in ("R1", "VM1"):
+            label = "CPU_STRESS" if step % 7 == 0 else ""
+            rows.append((timestamp, source, "SNMP_POLL", "load1", rng.normal(20, 5), label))
+            rows.append((timestamp, source, "SNMP_POLL", "memTotal", 4046844, ""))
+            if step >= 120:
+                rows.append((timestamp, source, "SNMP_POLL", "rx_rate", rng.normal(1e6, 10), ""))
+            if step % 7 == 0:
+                rows.append((timestamp, source, "SNMP_TRAP", "linkDown", "", "LINK_DOWN"))
+            if step % 3 == 0:
+                rows.append((timestamp, source, "NETFLOW", "flow", rng.integers(1, 50), ""))
+    return pd.DataFrame(rows, columns=["timestamp", "source", "record_type", "metric",
+                                       "value", "label"]).assign(message="")
+
+def test_incremental_matches_full_rebuild(tmp_path, monkeypatch):
+    lines = long_rows().to_csv(index=False).encode("utf-8").splitlines(keepends=True)
+    full_input = tmp_path / "merged.csv"
+    full_input.write_bytes(b"".join(lines))
+    build_features(str(full_input), str(tmp_path / "full.csv"), str(tmp_path / "full.state"),
+                   final=True)
+
+    # the input grows between runs, and each run parses small chunks
+    monkeypatch.setattr(feature_builder, "CHUNK_BYTES", 4096)
+    grown = tmp_path / "grown.csv"
+    cuts = [1, 700, 1500, 1501, 2600, len(lines)]
+    for previous, cut in zip([0] + cuts, cuts):
+        with open(grown, "ab") as f:
+            f.write(b"".join(lines[previous:cut]))
+        build_features(str(grown), str(tmp_path / "inc.csv"), str(tmp_path / "inc.state"),
+                       final=cut == len(lines))
+
+    full = read_features(str(tmp_path / "full.csv"))
+    incremental = read_features(str(tmp_path / "inc.csv"))
+    assert "rx_rate_z30" in incremental.columns
+    # a flat metric scores 0, not NaN
+    assert set(incremental["memTotal_z6"]) == {"0"}
+    assert sorted(incremental.columns) == sorted(full.columns)
+    pd.testing.assert_frame_equal(incremental[full.columns], full)
+
+def test_new_columns_start_a_segment(tmp_path):
+    # rx_rate shows up after 10 minutes: the rows written before are left
+    # untouched and the wider rows go to features.1.csv
+    lines = long_rows().to_csv(index=False).encode("utf-8").splitlines(keepends=True)
+    grown = tmp_path / "merged.csv"
+    output = str(tmp_path / "features.csv")
+    grown.write_bytes(b"".join(lines[:500]))
+    build_features(str(grown), output, output + ".state")
+    first = (tmp_path / "features.csv").read_bytes()
+    with open(grown, "ab") as f:
+        f.write(b"".join(lines[500:]))
+    build_features(str(grown), output, output + ".state", final=True)
+
+    assert output_segments(output) == [output, str(tmp_path / "features.1.csv")]
+    assert (tmp_path / "features.csv").read_bytes() == first
+    old = pd.read_csv(output, dtype=str, keep_default_na=False)
+    new = pd.read_csv(tmp_path / "features.1.csv", dtype=str, keep_default_na=False)
+    assert "rx_rate" not in old.columns and "rx_rate" in new.columns
+    assert len(read_features(output)) == len(old) + len(new)
+
+def test_quoted_header(tmp_path):
+    # a metric name with a comma is a quoted column name, in the input
+    # header and in the output header alike
+    df = long_rows()
+    df = df[df["metric"].isin(["load1", "memTotal"])].replace({"metric": {"load1": "load,1"}})
+    lines = df.to_csv(index=False, quoting=1).encode("utf-8").splitlines(keepends=True)
+    grown = tmp_path / "merged.csv"
+    output = str(tmp_path / "features.csv")
+    for part in (lines[:300], lines[300:]):
+        with open(grown, "ab") as f:
+            f.write(b"".join(part))
+        build_features(str(grown), output, output + ".state")
+
+    assert output_segments(output) == [output]
+    assert "load,1_z6" in pd.read_csv(output, dtype=str).columns
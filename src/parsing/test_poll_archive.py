@@ -0,0 +1,123 @@
+import math
+import numpy as np
+import pandas as pd
+import pytest
+import poll_archive
+from poll_archive import FIELDS, Segment, iter_rows, read_archive, same_rows, write_segment
+
+START = pd.Timestamp("2025-03-01 10:00:00")
+
+def poll_rows(series, step=5):
+    # series: {metric: [value text, ...]} -> snmp_poll rows, one poll every step seconds
+    rows = []
+    for metric, values in series.items():
+        for i, value in enumerate(values):
+            timestamp = (START + pd.Timedelta(seconds=step * i)).strftime("%Y-%m-%d %H:%M:%S")
+            rows.append((timestamp, "R1", "SNMP_POLL", metric, value, "", ""))
+    return pd.DataFrame(rows, columns=FIELDS)
+
+def round_trip(df, tmp_path, block_points=poll_archive.BLOCK_POINTS):
+    path = str(tmp_path / "poll.tsz")
+    assert write_segment(df, path, block_points) == len(df)
+    back = Segment(path).read(text=True)
+    assert same_rows(df, back)
+    return path, back
+
+def values(df, metric):
+    return df[df["metric"] == metric]["value"].tolist()
+
+@pytest.mark.parametrize("texts", [
+    ["7"] * 50,                               # constant integer
+    ["1"] * 20 + ["2"] + ["1"] * 20,          # status, one change
+    ["0.25"] * 50,                            # constant float
+    ["1.0", "1", "1.0", "1"] * 10,            # same number, two spellings
+    [str(1000 + 500 * i) for i in range(50)],  # counter
+])
+def test_repeated_values(tmp_path, texts):
+    _, back = round_trip(poll_rows({"m": texts}), tmp_path)
+    assert values(back, "m") == texts
+
+def test_non_numeric_and_empty_values(tmp_path):
+    texts = ["up", "", "nan", "1e3", "0.10", "inf", "down", "", "3", "007"]
+    _, back = round_trip(poll_rows({"ifOperStatus": texts}), tmp_path)
+    assert values(back, "ifOperStatus") == texts
+
+def test_negative_and_nan_floats(tmp_path):
+    texts = ["-1.5", "-0.0", "NaN", "-273.15", "2.5", "-1e-300", "nan", "-4"]
+    path, back = round_trip(poll_rows({"temperature": texts}), tmp_path)
+    assert values(back, "temperature") == texts
+    # as floats: signs kept, NaN for the NaN texts
+    floats = values(read_archive(path), "temperature")
+    assert floats[:2] == [-1.5, -0.0] and math.copysign(1, floats[1]) == -1
+    assert math.isnan(floats[2]) and math.isnan(floats[6])
+    assert floats[3:6] == [-273.15, 2.5, -1e-300] and floats[7] == -4.0
+
+def test_floats_are_nan_where_empty_or_text(tmp_path):
+    path, _ = round_trip(poll_rows({"m": ["1", "", "up", "2.5"]}), tmp_path)
+    floats = values(read_archive(path), "m")
+    assert floats[0] == 1.0 and floats[3] == 2.5
+    assert math.isnan(floats[1]) and math.isnan(floats[2])
+
+def test_labels_and_messages(tmp_path):
+    df = poll_rows({"m": ["1", "2", "3"]})
+    df.loc[1, "label"] = "CPU"
+    df.loc[2, "message"] = "threshold, crossed"
+    _, back = round_trip(df, tmp_path)
+    assert back["label"].tolist() == ["", "CPU", ""]
+    assert back["message"].tolist() == ["", "", "threshold, crossed"]
+
+def test_block_boundaries(tmp_path):
+    # 10 polls per series in blocks of 4: 4 + 4 + 2, per series
+    series = {"ints": [str(i * i) for i in range(10)],
+              "floats": [repr(-0.1 * i) for i in range(10)],
+              "text": ["up", "down"] * 5}
+    df = poll_rows(series)
+    path, back = round_trip(df, tmp_path, block_points=4)
+    segment = Segment(path)
+    assert len(segment.index) == 9
+    assert sorted(segment.index["rows"].tolist()) == [2, 2, 2, 4, 4, 4, 4, 4, 4]
+    for metric, texts in series.items():
+        assert values(back, metric) == texts
+
+    # ranges starting and ending on a block edge, or inside a block
+    first = int(segment.index["start"].min())
+    for lo, hi in ((0, 4), (4, 8), (3, 5), (0, 10), (8, 10), (5, 6)):
+        part = segment.read(first + 5 * lo, first + 5 * hi, text=True)
+        assert len(part) == 3 * (hi - lo)
+        for metric, texts in series.items():
+            assert values(part, metric) == texts[lo:hi]
+        rows = list(iter_rows([path], first + 5 * lo, first + 5 * hi))
+        assert same_rows(part, pd.DataFrame(rows, columns=FIELDS))
+
+def test_block_boundary_on_a_value_change(tmp_path):
+    # the first value of every block is stored whole, not as a delta
+    texts = ["1"] * 4 + ["5"] * 4 + ["-3"] * 4 + ["up"] * 4
+    _, back = round_trip(poll_rows({"m": texts}), tmp_path, block_points=4)
+    assert values(back, "m") == texts
+
+def test_irregular_polls_and_same_second_rows(tmp_path):
+    df = poll_rows({"m": [str(i) for i in range(12)]})
+    df["timestamp"] = ["2025-03-01 10:00:00"] * 3 + [
+        f"2025-03-01 10:{minute:02d}:00" for minute in (1, 1, 2, 7, 8, 30, 31, 59, 59)]
+    _, back = round_trip(df, tmp_path, block_points=5)
+    assert back["timestamp"].tolist() == df["timestamp"].tolist()
+    assert values(back, "m") == values(df, "m")
+
+def test_large_integers(tmp_path):
+    texts = [str(2 ** 63 - 1 - i) for i in range(5)] + [str(2 ** 53 + 1), "0", "-7"]
+    _, back = round_trip(poll_rows({"ifHCInOctets": texts}), tmp_path, block_points=4)
+    assert values(back, "ifHCInOctets") == texts
+
+def test_empty_range(tmp_path):
+    path, _ = round_trip(poll_rows({"m": ["1", "2"]}), tmp_path)
+    assert read_archive(path, start="2030-01-01 00:00:00").empty
+    assert list(iter_rows([path], end="2020-01-01 00:00:00")) == []
+
+def test_bit_streams():
+    widths = np.array([0, 1, 7, 64, 3, 0, 33])
+    fields = np.array([0, 1, 100, 2 ** 64 - 1, 5, 0, 2 ** 32 + 1], dtype=np.uint64)
+    data = poll_archive.pack_fields(fields, widths)
+    assert poll_archive.unpack_fields(data, widths).tolist() == fields.tolist()
+    dod = np.array([0, 5, -5, 2 ** 40, -(2 ** 62), 0, 1], dtype=np.int64)
+    assert poll_archive.decode_ints(poll_archive.encode_ints(dod), len(dod)).tolist() \
+        == dod.tolist()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+import os
+import time
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from csv_sink import CsvSink
+
+# Columnar batches are written as one file each, so they are much larger and
+# less frequent than CSV group commits
+COLUMNAR_FLUSH_ROWS = 50000
+COLUMNAR_FLUSH_INTERVAL = 60.0
+
+CATEGORICAL_COLUMNS = ["source", "record_type", "metric", "label"]
+
+TELEMETRY_SCHEMA = pa.schema([
+    ("timestamp", pa.timestamp("s")),
+    ("source", pa.dictionary(pa.int32(), pa.string())),
+    ("record_type", pa.dictionary(pa.int32(), pa.string())),
+    ("metric", pa.dictionary(pa.int32(), pa.string())),
+    ("value", pa.float64()),
+    ("label", pa.dictionary(pa.int32(), pa.string())),
+    ("message", pa.string())
+])
+
+# Typed columns some collectors add after the common seven (trap listener);
+# any other extra column is stored as a dictionary-encoded string
+EXTRA_COLUMN_TYPES = {
+    "sys_uptime": pa.int64(),
+    "if_index": pa.int64(),
+}
+
+FILE_EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+def to_float(value):
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def sink_schema(fieldnames):
+    fields = list(TELEMETRY_SCHEMA)
+    for name in fieldnames:
+        if name not in TELEMETRY_SCHEMA.names:
+            fields.append(pa.field(name, EXTRA_COLUMN_TYPES.get(
+                name, pa.dictionary(pa.int32(), pa.string()))))
+    return pa.schema(fields)
+
+def rows_to_table(rows, schema=TELEMETRY_SCHEMA):
+    columns = {
+        "timestamp": pc.strptime(pa.array([row["timestamp"] for row in rows]),
+                                 format="%Y-%m-%d %H:%M:%S", unit="s"),
+        "value": pa.array([to_float(row.get("value")) for row in rows], pa.float64()),
+        "message": pa.array([row.get("message") or None for row in rows], pa.string())
+    }
+    for column in CATEGORICAL_COLUMNS:
+        values = pa.array([row.get(column) or "" for row in rows], pa.string())
+        columns[column] = values.dictionary_encode()
+    for field in schema:
+        if field.name in columns:
+            continue
+        values = [row.get(field.name) for row in rows]
+        if pa.types.is_dictionary(field.type):
+            columns[field.name] = pa.array([value or None for value in values],
+                                           pa.string()).dictionary_encode()
+        else:
+            columns[field.name] = pa.array([None if value == "" else value
+                                            for value in values], field.type)
+    return pa.table([columns[name] for name in schema.names], schema=schema)
+
+class ColumnarSink(CsvSink):
+    # Same batching/backpressure as CsvSink, but every flush becomes one
+    # Parquet (or Arrow IPC) file in a hive-style date partition:
+    #   <root>/date=YYYY-MM-DD/part-HHMMSS-<seq>.parquet
+    # Repeated string columns are dictionary-encoded and the timestamp is a
+    # real timestamp[s], so readers can prune by column and time range.
+
+    def __init__(self, root, fieldnames, fmt="parquet",
+                 flush_rows=COLUMNAR_FLUSH_ROWS, flush_interval=COLUMNAR_FLUSH_INTERVAL,
+                 **kwargs):
+        if fmt not in FILE_EXTENSIONS:
+            raise ValueError(f"Unknown columnar format '{fmt}'")
+        self.root = root
+        self.fmt = fmt
+        self.schema = sink_schema(fieldnames)
+        self.seq = 0
+        super().__init__(root, fieldnames, flush_rows=flush_rows,
+                         flush_interval=flush_interval, **kwargs)
+
+    def _open(self):
+        os.makedirs(self.root, exist_ok=True)
+
+    def _close(self):
+        pass
+
+    def _maybe_rotate(self):
+        # every flush already starts a new file
+        pass
+
+    def _part_path(self, date):
+        partition = os.path.join(self.root, f"date={date}")
+        os.makedirs(partition, exist_ok=True)
+        self.seq += 1
+        name = f"part-{time.strftime('%H%M%S')}-{self.seq}{FILE_EXTENSIONS[self.fmt]}"
+        return os.path.join(partition, name)
+
+    def _write_table(self, table, path):
+        if self.fmt == "parquet":
+            pq.write_table(table, path, compression="zstd")
+        else:
+            feather.write_feather(table, path, compression="zstd")
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        by_date = {}
+        for row in batch:
+            by_date.setdefault(row["timestamp"][:10], []).append(row)
+        for date, rows in by_date.items():
+            self._write_table(rows_to_table(rows, self.schema), self._part_path(date))
+        self.written_rows += len(batch)
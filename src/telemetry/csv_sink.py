@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+import csv
+import os
+import queue
+import threading
+import time
+
+FLUSH_ROWS = 1000
+FLUSH_INTERVAL = 1.0
+MAX_PENDING_ROWS = 100000
+
+class CsvSink:
+    # Group-commit CSV writer shared by the collectors. Callers hand rows to
+    # write()/write_rows(), which only enqueue them; a background thread
+    # writes them in batches and flushes once per batch, when FLUSH_ROWS rows
+    # are pending or FLUSH_INTERVAL seconds have passed, whichever is first.
+    #
+    # The queue holds at most max_pending rows (a larger batch is let in when
+    # the queue is empty). When it is full, write blocks the caller
+    # (backpressure) unless block=False was given, in which case the batch is
+    # dropped and counted in `dropped_rows`. If the writer thread fails, its
+    # exception is raised by the next write and by close() instead.
+    #
+    # rotate_bytes / rotate_hourly move the active file aside to
+    # "<name>.<YYYYmmdd-HHMMSS><ext>" and start a fresh file with a header.
+    # An existing file whose header is not `fieldnames` is moved aside the
+    # same way on open.
+    #
+    # live (live_store.LiveStore) also gets every batch as it is accepted,
+    # so recent samples can be queried without reading the files back.
+
+    def __init__(self, path, fieldnames, flush_rows=FLUSH_ROWS,
+                 flush_interval=FLUSH_INTERVAL, max_pending=MAX_PENDING_ROWS,
+                 rotate_bytes=None, rotate_hourly=False, block=True, metrics=None,
+                 live=None):
+        self.path = path
+        self.fieldnames = fieldnames
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.rotate_bytes = rotate_bytes
+        self.rotate_hourly = rotate_hourly
+        self.block = block
+        self.dropped_rows = 0
+        self.written_rows = 0
+        self.live = live
+        self.max_pending = max_pending
+        self.pending_rows = 0
+        self.error = None
+        # signalled when the writer takes rows off the queue, or dies
+        self.space = threading.Condition()
+        # optional self_metrics.Metrics: commit times and sink counters
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.track("sink_pending_rows", self.pending)
+            metrics.track("sink_written_rows_total", lambda: self.written_rows, "counter")
+            metrics.track("sink_dropped_rows_total", lambda: self.dropped_rows, "counter")
+
+        self.queue = queue.Queue()
+        self._open()
+        self.thread = threading.Thread(target=self._run, name=f"CsvSink({path})",
+                                       daemon=True)
+        self.thread.start()
+
+    def write(self, row):
+        self.write_rows([row])
+
+    def write_rows(self, rows):
+        if not rows:
+            return
+        with self.space:
+            while self.error is None and self.pending_rows \
+                    and self.pending_rows + len(rows) > self.max_pending:
+                if not self.block:
+                    self.dropped_rows += len(rows)
+                    return
+                self.space.wait()
+            if self.error is not None:
+                raise self.error
+            self.pending_rows += len(rows)
+        # only accepted rows, so the live store agrees with the files
+        if self.live is not None:
+            self.live.append_rows(rows)
+        self.queue.put(rows)
+
+    def pending(self):
+        return self.pending_rows
+
+    def close(self):
+        if self.error is None:
+            self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def _open(self):
+        # a file written with other columns is moved aside, not appended to
+        header = self._header()
+        if header is not None and header != list(self.fieldnames):
+            rotated = self._rotated_path()
+            os.replace(self.path, rotated)
+            print(f"{self.path} has other columns, moved to {rotated}")
+        self.csvfile = open(self.path, "a", newline="")
+        self.writer = csv.DictWriter(self.csvfile, fieldnames=self.fieldnames)
+        self.csvfile.seek(0, 2)
+        if self.csvfile.tell() == 0:
+            self.writer.writeheader()
+        self.opened_hour = time.strftime("%Y%m%d%H")
+
+    def _close(self):
+        self.csvfile.close()
+
+    def _header(self):
+        # -> column names of the existing file, None when missing or empty
+        try:
+            with open(self.path, newline="") as f:
+                return next(csv.reader(f), None)
+        except FileNotFoundError:
+            return None
+
+    def _rotated_path(self):
+        base, ext = os.path.splitext(self.path)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        rotated = f"{base}.{stamp}{ext}"
+        seq = 1
+        while os.path.exists(rotated):
+            rotated = f"{base}.{stamp}.{seq}{ext}"
+            seq += 1
+        return rotated
+
+    def _maybe_rotate(self):
+        rotate = False
+        if self.rotate_bytes and self.csvfile.tell() >= self.rotate_bytes:
+            rotate = True
+        if self.rotate_hourly and time.strftime("%Y%m%d%H") != self.opened_hour:
+            rotate = True
+        if rotate:
+            self._close()
+            os.replace(self.path, self._rotated_path())
+            self._open()
+
+    def _flush(self, batch):
+        if batch:
+            self.writer.writerows(batch)
+            self.csvfile.flush()
+            self.written_rows += len(batch)
+        self._maybe_rotate()
+
+    def _commit(self, batch):
+        if self.metrics is None:
+            self._flush(batch)
+            return
+        with self.metrics.timer("sink_flush_seconds"):
+            self._flush(batch)
+
+    def _run(self):
+        try:
+            self._drain()
+        except Exception as e:
+            self.error = e
+        finally:
+            try:
+                self._close()
+            finally:
+                with self.space:
+                    self.space.notify_all()
+
+    def _drain(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None
+            if batch:
+                timeout = max(0.0, deadline - time.monotonic())
+            elif self.rotate_hourly:
+                timeout = self.flush_interval
+            try:
+                rows = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                self._commit(batch)
+                batch = []
+                continue
+            if rows is None:
+                break
+            with self.space:
+                self.pending_rows -= len(rows)
+                self.space.notify_all()
+            if not batch:
+                deadline = time.monotonic() + self.flush_interval
+            batch.extend(rows)
+            if len(batch) >= self.flush_rows or time.monotonic() >= deadline:
+                self._commit(batch)
+                batch = []
+        self._commit(batch)
+
+def open_sink(name, fieldnames, storage="csv", **kwargs):
+    # "csv" appends to <name>.csv; "parquet" / "arrow" write a partitioned
+    # columnar dataset under the <name>/ directory (requires pyarrow)
+    if storage == "csv":
+        return CsvSink(f"{name}.csv", fieldnames, **kwargs)
+    from columnar_sink import ColumnarSink
+    return ColumnarSink(name, fieldnames, fmt=storage, **kwargs)
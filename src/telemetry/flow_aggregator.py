@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+import time
+import numpy as np
+from numpy.lib import recfunctions as rfn
+
+# Rolls decoded flows (flow_decoder.FLOW_DTYPE arrays) up per time window
+# and key, and keeps top-K talkers and destination ports per exporter and
+# window in Space-Saving summaries. Output volume and memory depend on the number of
+# distinct keys (capped at MAX_KEYS per window) and on K, not on flow rate.
+
+WINDOW = 60
+TOP_K = 10
+MAX_KEYS = 10000
+
+# Every key includes the exporter, so aggregated rows keep their source
+KEY_COLUMNS = {
+    "5tuple": ("exporter", "src_addr", "dst_addr", "src_port", "dst_port", "proto"),
+    "pair": ("exporter", "src_addr", "dst_addr"),
+    "port": ("exporter", "dst_port", "proto"),
+}
+
+SUSPICIOUS_PORTS = (23, 445)
+
+def ip_str(addr_int):
+    return "{}.{}.{}.{}".format((addr_int >> 24) & 0xFF, (addr_int >> 16) & 0xFF,
+                                (addr_int >> 8) & 0xFF, addr_int & 0xFF)
+
+def group_by(values, weights_list):
+    # values: 1-D (possibly structured) array -> (unique keys, [sums])
+    uniques, inverse = np.unique(values, return_inverse=True)
+    sums = [np.bincount(inverse, weights=weights, minlength=len(uniques))
+            for weights in weights_list]
+    return uniques, inverse, sums
+
+class SpaceSaving:
+    # Metwally et al. Space-Saving heavy hitters: at most `capacity` counters.
+    # An unseen key replaces the smallest counter and inherits its count as
+    # its error bound, so counts are over-estimates by at most `errors[key]`.
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+
+    def update(self, key, weight):
+        if key in self.counts:
+            self.counts[key] += weight
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = weight
+            self.errors[key] = 0
+        else:
+            victim = min(self.counts, key=self.counts.get)
+            floor = self.counts.pop(victim)
+            del self.errors[victim]
+            self.counts[key] = floor + weight
+            self.errors[key] = floor
+
+    def top(self, k):
+        ranked = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+        return [(key, count, self.errors[key]) for key, count in ranked[:k]]
+
+class FlowAggregator:
+
+    def __init__(self, key="pair", window=WINDOW, top_k=TOP_K, max_keys=MAX_KEYS):
+        if key not in KEY_COLUMNS:
+            raise ValueError(f"Unknown aggregation key '{key}'")
+        self.key = key
+        self.columns = list(KEY_COLUMNS[key])
+        self.window = window
+        self.top_k = top_k
+        self.max_keys = max_keys
+        self.window_start = None
+        self.reset()
+
+    def reset(self):
+        # key tuple -> [flows, packets, octets, max octets, suspicious, icmp]
+        self.groups = {}
+        # exporter -> Space-Saving summary, kept a few times larger than K to
+        # tighten error bounds
+        self.talkers = {}
+        self.ports = {}
+
+    def summary(self, summaries, exporter):
+        found = summaries.get(exporter)
+        if found is None:
+            found = summaries[exporter] = SpaceSaving(self.top_k * 4)
+        return found
+
+    def add(self, flows, now=None):
+        # Returns the rows of any window that closed before this batch
+        if now is None:
+            now = time.time()
+        rows = self.flush(now)
+        if self.window_start is None:
+            self.window_start = now - now % self.window
+        if not len(flows):
+            return rows
+
+        octets = flows["octets"].astype(np.float64)
+        suspicious = np.isin(flows["dst_port"], SUSPICIOUS_PORTS).astype(np.float64)
+        icmp = (flows["proto"] == 1).astype(np.float64)
+
+        keys = rfn.repack_fields(flows[self.columns])
+        uniques, inverse, (count, packets, octet_sum, susp, icmp_sum) = group_by(
+            keys, [None, flows["packets"].astype(np.float64), octets, suspicious, icmp])
+        max_octets = np.zeros(len(uniques))
+        np.maximum.at(max_octets, inverse, octets)
+
+        for i, key in enumerate(uniques.tolist()):
+            group = self.groups.get(key)
+            if group is None:
+                if len(self.groups) >= self.max_keys:
+                    key = ("other",)
+                    group = self.groups.get(key)
+                if group is None:
+                    group = self.groups[key] = [0, 0, 0, 0.0, 0, 0]
+            group[0] += int(count[i])
+            group[1] += int(packets[i])
+            group[2] += int(octet_sum[i])
+            group[3] = max(group[3], max_octets[i])
+            group[4] += int(susp[i])
+            group[5] += int(icmp_sum[i])
+
+        talkers, _, (talker_bytes,) = group_by(
+            rfn.repack_fields(flows[["exporter", "src_addr"]]), [octets])
+        for (exporter, addr), weight in zip(talkers.tolist(), talker_bytes.tolist()):
+            self.summary(self.talkers, exporter).update(addr, weight)
+        ports, _, (port_flows,) = group_by(
+            rfn.repack_fields(flows[["exporter", "dst_port"]]), [None])
+        for (exporter, port), weight in zip(ports.tolist(), port_flows.tolist()):
+            self.summary(self.ports, exporter).update(port, weight)
+        return rows
+
+    def flush(self, now=None, force=False):
+        # Emit and reset the current window once it is over (or when forced)
+        if now is None:
+            now = time.time()
+        if self.window_start is None:
+            return []
+        if not force and now < self.window_start + self.window:
+            return []
+        rows = self.window_rows()
+        self.reset()
+        self.window_start = now - now % self.window
+        return rows
+
+    def key_text(self, key):
+        if key == ("other",):
+            return "other"
+        fields = dict(zip(self.columns, key))
+        if self.key == "5tuple":
+            return (f"{ip_str(fields['src_addr'])}:{fields['src_port']} -> "
+                    f"{ip_str(fields['dst_addr'])}:{fields['dst_port']} "
+                    f"proto {fields['proto']}")
+        if self.key == "pair":
+            return f"{ip_str(fields['src_addr'])} -> {ip_str(fields['dst_addr'])}"
+        return f"port {fields['dst_port']} proto {fields['proto']}"
+
+    def window_rows(self):
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.window_start))
+        rows = []
+        for key, (flows, packets, octets, max_octets, susp, icmp) in self.groups.items():
+            # same precedence as the per-flow labels: ICMP, then port, then size
+            label = ""
+            if max_octets > 5e6:
+                label = "HIGH_FLOW"
+            if susp:
+                label = "SUSPICIOUS_PORT"
+            if icmp:
+                label = "ICMP_FLOW"
+            source = "other" if key == ("other",) else ip_str(key[0])
+            rows.append({
+                "timestamp": timestamp,
+                "source": source,
+                "record_type": "NETFLOW_AGG",
+                "metric": "packets",
+                "value": packets,
+                "label": label,
+                "message": (f"{self.key_text(key)} flows={flows} bytes={octets} "
+                            f"window={self.window}s")
+            })
+
+        # source stays the exporter, the talker / port goes in the message
+        for exporter, talkers in self.talkers.items():
+            for rank, (addr, octets, error) in enumerate(talkers.top(self.top_k), 1):
+                rows.append({
+                    "timestamp": timestamp,
+                    "source": ip_str(exporter),
+                    "record_type": "NETFLOW_TOP",
+                    "metric": "top_talker_bytes",
+                    "value": int(octets),
+                    "label": "",
+                    "message": f"{ip_str(addr)} rank={rank} error<={int(error)}"
+                })
+        for exporter, ports in self.ports.items():
+            for rank, (port, flows, error) in enumerate(ports.top(self.top_k), 1):
+                rows.append({
+                    "timestamp": timestamp,
+                    "source": ip_str(exporter),
+                    "record_type": "NETFLOW_TOP",
+                    "metric": "top_port_flows",
+                    "value": int(flows),
+                    "label": "SUSPICIOUS_PORT" if port in SUSPICIOUS_PORTS else "",
+                    "message": f"port {port} rank={rank} error<={int(error)}"
+                })
+        return rows
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+import json
+import os
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+
+# In-process live store of the collectors' recent samples: one fixed-size
+# ring buffer per (source, metric) series, all allocated up front as two
+# (max_series x capacity) arrays, so memory never grows and queries never
+# touch disk. Sinks feed it with the rows they are handed (csv_sink.py,
+# live=...); dashboards and detectors read it through the methods below or
+# the local JSON API served by LiveServer:
+#   /series[?source=S]                         known series
+#   /latest[?source=S][&metric=M]              last sample of each series
+#   /range?source=S&metric=M[&start=T][&end=T] raw samples
+#   /downsample?source=S&metric=M&step=60[&agg=mean][&start=T][&end=T]
+#   /stats                                     store usage
+# T is epoch seconds, "YYYY-mm-dd HH:MM:SS" or negative seconds from now
+# ("-3600"). Rows whose value is not numeric (trap messages) are skipped.
+
+LIVE_HOURS = 6
+LIVE_RESOLUTION = 5
+LIVE_MAX_SERIES = 1024
+LIVE_ADDRESS = "127.0.0.1"
+AGGREGATES = ("mean", "min", "max", "sum", "count", "first", "last")
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Parsed row timestamps kept for reuse (rows of a batch share theirs)
+TIMESTAMP_CACHE = 4096
+
+def live_capacity(hours=LIVE_HOURS, resolution=LIVE_RESOLUTION):
+    # samples per series to hold `hours` at one sample every `resolution` s
+    return max(1, int(hours * 3600 // resolution))
+
+def to_float(value):
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def parse_time(value, now=None):
+    if value is None or value == "":
+        return None
+    value = str(value).strip()
+    if value.startswith("-"):
+        return (time.time() if now is None else now) + float(value)
+    try:
+        return float(value)
+    except ValueError:
+        return time.mktime(time.strptime(value, TIMESTAMP_FORMAT))
+
+def downsample(times, values, start, step, agg="mean"):
+    # -> (bucket start times, aggregated values) of the non-empty buckets of
+    # `step` seconds from `start`
+    if agg not in AGGREGATES:
+        raise ValueError(f"Unknown aggregate '{agg}', expected one of {', '.join(AGGREGATES)}")
+    if not len(times):
+        return np.empty(0), np.empty(0)
+    buckets = ((times - start) // step).astype(np.int64)
+    order = np.argsort(buckets, kind="stable")
+    buckets, values = buckets[order], values[order]
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(buckets)]
+    if agg in ("mean", "sum"):
+        result = np.add.reduceat(values, starts)
+        if agg == "mean":
+            result = result / (ends - starts)
+    elif agg == "min":
+        result = np.minimum.reduceat(values, starts)
+    elif agg == "max":
+        result = np.maximum.reduceat(values, starts)
+    elif agg == "count":
+        result = (ends - starts).astype(np.float64)
+    elif agg == "first":
+        result = values[starts]
+    else:
+        result = values[ends - 1]
+    return start + buckets[starts] * step, result
+
+class LiveStore:
+    # Series get a slot on their first sample, up to max_series; samples of
+    # further series are counted in dropped_rows. Each slot keeps its last
+    # `capacity` samples, times in epoch seconds (rows are second resolution).
+
+    def __init__(self, capacity=None, max_series=LIVE_MAX_SERIES, metrics=None):
+        self.capacity = capacity or live_capacity()
+        self.max_series = max_series
+        self.times = np.zeros((max_series, self.capacity), dtype=np.uint32)
+        # filled now so the whole store is resident from the start
+        self.values = np.full((max_series, self.capacity), np.nan)
+        self.heads = [0] * max_series
+        self.counts = [0] * max_series
+        self.labels = [""] * max_series
+        self.keys = []
+        self.index = {}
+        self.lock = threading.Lock()
+        self.samples = 0
+        self.skipped_rows = 0
+        self.dropped_rows = 0
+        self.parsed = {}
+        if metrics is not None:
+            metrics.track("live_series", lambda: len(self.keys))
+            metrics.track("live_samples_total", lambda: self.samples, "counter")
+            metrics.track("live_dropped_rows_total", lambda: self.dropped_rows, "counter")
+            metrics.set("live_store_bytes", self.nbytes())
+
+    def nbytes(self):
+        return self.times.nbytes + self.values.nbytes
+
+    def row_time(self, timestamp):
+        seconds = self.parsed.get(timestamp)
+        if seconds is None:
+            if len(self.parsed) >= TIMESTAMP_CACHE:
+                self.parsed.clear()
+            seconds = self.parsed[timestamp] = int(time.mktime(
+                time.strptime(timestamp, TIMESTAMP_FORMAT)))
+        return seconds
+
+    def append_rows(self, rows):
+        with self.lock:
+            for row in rows:
+                value = to_float(row.get("value"))
+                if value is None:
+                    self.skipped_rows += 1
+                    continue
+                try:
+                    seconds = self.row_time(row["timestamp"])
+                except (KeyError, TypeError, ValueError):
+                    self.skipped_rows += 1
+                    continue
+                key = (row.get("source") or "", row.get("metric") or "")
+                slot = self.index.get(key)
+                if slot is None:
+                    if len(self.keys) == self.max_series:
+                        self.dropped_rows += 1
+                        continue
+                    slot = self.index[key] = len(self.keys)
+                    self.keys.append(key)
+                head = self.heads[slot]
+                self.times[slot, head] = seconds
+                self.values[slot, head] = value
+                self.heads[slot] = (head + 1) % self.capacity
+                if self.counts[slot] < self.capacity:
+                    self.counts[slot] += 1
+                self.labels[slot] = row.get("label") or ""
+                self.samples += 1
+
+    def _slot(self, source, metric):
+        slot = self.index.get((source, metric))
+        if slot is None:
+            raise KeyError(f"No series {source}/{metric}")
+        return slot
+
+    def _series(self, slot):
+        # chronological copies (times as float64, values) of one slot
+        count, head = self.counts[slot], self.heads[slot]
+        if count < self.capacity:
+            return (self.times[slot, :count].astype(np.float64),
+                    self.values[slot, :count].copy())
+        return (np.concatenate((self.times[slot, head:], self.times[slot, :head]))
+                .astype(np.float64),
+                np.concatenate((self.values[slot, head:], self.values[slot, :head])))
+
+    def series(self, source=None):
+        # -> [{"source", "metric", "count", "first", "last"}]
+        result = []
+        with self.lock:
+            for slot, (key_source, metric) in enumerate(self.keys):
+                if source is not None and key_source != source:
+                    continue
+                count, head = self.counts[slot], self.heads[slot]
+                first = self.times[slot, 0 if count < self.capacity else head]
+                result.append({"source": key_source, "metric": metric, "count": count,
+                               "first": int(first),
+                               "last": int(self.times[slot, head - 1])})
+        return result
+
+    def latest(self, source=None, metric=None):
+        # -> {(source, metric): (time, value, label)} of the matching series
+        result = {}
+        with self.lock:
+            for slot, key in enumerate(self.keys):
+                if (source is not None and key[0] != source) or \
+                        (metric is not None and key[1] != metric):
+                    continue
+                head = self.heads[slot] - 1
+                result[key] = (int(self.times[slot, head]), float(self.values[slot, head]),
+                               self.labels[slot])
+        return result
+
+    def range(self, source, metric, start=None, end=None):
+        # -> (times, values) with start <= time <= end
+        with self.lock:
+            times, values = self._series(self._slot(source, metric))
+        keep = np.ones(len(times), dtype=bool)
+        if start is not None:
+            keep &= times >= start
+        if end is not None:
+            keep &= times <= end
+        return times[keep], values[keep]
+
+    def downsample(self, source, metric, step, agg="mean", start=None, end=None):
+        # buckets aligned on multiples of step, so successive queries agree
+        times, values = self.range(source, metric, start, end)
+        if start is None:
+            start = times[0] if len(times) else 0
+        return downsample(times, values, start // step * step, step, agg)
+
+    def stats(self):
+        return {"series": len(self.keys), "max_series": self.max_series,
+                "capacity": self.capacity, "bytes": self.nbytes(), "samples": self.samples,
+                "skipped_rows": self.skipped_rows, "dropped_rows": self.dropped_rows}
+
+def required(query, name):
+    if name not in query:
+        raise ValueError(f"Missing parameter '{name}'")
+    return query[name]
+
+def points(times, values):
+    return [[int(t), None if np.isnan(v) else float(v)] for t, v in zip(times, values)]
+
+class LiveHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        store = self.server.store
+        try:
+            if url.path == "/series":
+                body = store.series(query.get("source"))
+            elif url.path == "/latest":
+                body = [{"source": source, "metric": metric, "time": t, "value": value,
+                         "label": label}
+                        for (source, metric), (t, value, label)
+                        in store.latest(query.get("source"), query.get("metric")).items()]
+            elif url.path == "/range":
+                source, metric = required(query, "source"), required(query, "metric")
+                times, values = store.range(source, metric, parse_time(query.get("start")),
+                                            parse_time(query.get("end")))
+                body = {"source": source, "metric": metric, "points": points(times, values)}
+            elif url.path == "/downsample":
+                source, metric = required(query, "source"), required(query, "metric")
+                step = float(required(query, "step"))
+                if step <= 0:
+                    raise ValueError("step must be positive")
+                agg = query.get("agg", "mean")
+                times, values = store.downsample(source, metric, step, agg,
+                                                 parse_time(query.get("start")),
+                                                 parse_time(query.get("end")))
+                body = {"source": source, "metric": metric, "step": step, "agg": agg,
+                        "points": points(times, values)}
+            elif url.path == "/stats":
+                body = store.stats()
+            else:
+                self.reply(404, {"error": f"Unknown path {url.path}"})
+                return
+        except KeyError as e:
+            self.reply(404, {"error": e.args[0]})
+            return
+        except ValueError as e:
+            self.reply(400, {"error": str(e)})
+            return
+        self.reply(200, body)
+
+    def reply(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def address_string(self):
+        return str(self.client_address[0]) if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        pass
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class LiveServer:
+    # Serves a LiveStore on 127.0.0.1:port and/or a Unix socket path
+
+    def __init__(self, store, port=None, socket_path=None, address=LIVE_ADDRESS):
+        self.servers = []
+        self.socket_path = socket_path
+        if port is not None:
+            server = ThreadingHTTPServer((address, port), LiveHandler)
+            server.daemon_threads = True
+            self.servers.append(server)
+            print(f"Live store on http://{address}:{port}/")
+        if socket_path is not None:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            self.servers.append(UnixHTTPServer(socket_path, LiveHandler))
+            print(f"Live store on unix:{socket_path}")
+        for server in self.servers:
+            server.store = store
+        self.threads = [threading.Thread(target=server.serve_forever, name="live-http",
+                                         daemon=True) for server in self.servers]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        if self.socket_path is not None and os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+def open_live(metrics=None, port=None, socket_path=None, hours=LIVE_HOURS,
+              resolution=LIVE_RESOLUTION, max_series=LIVE_MAX_SERIES):
+    # -> (store, server), both None unless a port or socket was requested
+    if port is None and socket_path is None:
+        return None, None
+    store = LiveStore(live_capacity(hours, resolution), max_series, metrics)
+    return store, LiveServer(store, port, socket_path).start()
@@ -1,11 +1,66 @@
 #!/usr/bin/env python3
+import argparse
+import multiprocessing
+import os
+import queue
 import socket
+import threading
 import time
-import csv
+import numpy as np
 import netflow
+from csv_sink import open_sink
+from flow_decoder import FlowDecoder
+from flow_aggregator import FlowAggregator, WINDOW
+from self_metrics import Metrics, SelfTelemetry
+from live_store import open_live, LIVE_MAX_SERIES
 
 TEMPLATES = {}
 
+# "csv", or "parquet" / "arrow" for a columnar dataset (see columnar_sink.py)
+STORAGE = "csv"
+
+# "builtin" decodes whole batches into NumPy arrays (flow_decoder.py),
+# "netflow" parses packet by packet with the netflow library
+DECODER = "builtin"
+
+# None writes one row per flow; "pair", "5tuple" or "port" writes per-window
+# aggregates and top-K talkers/ports instead (flow_aggregator.py, builtin
+# decoder only)
+AGGREGATE = None
+
+# Ingest tuning: worker processes sharing the port via SO_REUSEPORT, kernel
+# receive buffer per socket, packets handed to the decoder per batch, and how
+# many batches may wait between the receive thread and the decoder
+WORKERS = 1
+RCVBUF_BYTES = 8 * 1024 * 1024
+RECV_BATCH = 64
+MAX_PENDING_BATCHES = 1024
+STATS_INTERVAL = 10
+
+# Self-telemetry (self_metrics.py): Prometheus endpoint port (None disables;
+# worker N listens on METRICS_PORT + N), JSON lines stats file written every
+# STATS_INTERVAL seconds and folded-stacks profile file (None disables each)
+METRICS_PORT = None
+STATS_FILE = None
+PROFILE_FILE = None
+
+# Live store (live_store.py): recent rows kept in memory and served as JSON
+# on 127.0.0.1:LIVE_PORT (worker N on LIVE_PORT + N) and/or the Unix socket
+# LIVE_SOCKET; None disables each. Per-flow rows share one series per
+# exporter, so the store is most useful with AGGREGATE (one sample per
+# window and key); LIVE_RESOLUTION is the sample spacing used to size it
+# without aggregation
+LIVE_PORT = None
+LIVE_SOCKET = None
+LIVE_HOURS = 1
+LIVE_RESOLUTION = 1
+
+# Per-process registry; run_worker() replaces it with one labelled by worker
+metrics = Metrics("netflow")
+
+fieldnames = ["timestamp", "source", "record_type", "metric", "value",
+              "label", "message"]
+
 def decode_ipv4(addr_int):
     if addr_int is None:
         return None
@@ -16,83 +71,333 @@ def decode_ipv4(addr_int):
         addr_int & 0xFF
     )
 
-def start_collector(listen_ip="0.0.0.0", listen_port=9999):
+def open_socket(listen_ip, listen_port, rcvbuf=RCVBUF_BYTES, reuseport=False):
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if reuseport:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    granted = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+    if granted < rcvbuf:
+        # Linux caps SO_RCVBUF at net.core.rmem_max (and reports it doubled)
+        print(f"Receive buffer limited to {granted} bytes, "
+              f"raise net.core.rmem_max for {rcvbuf}")
     sock.bind((listen_ip, listen_port))
-    print(f"Listening on {listen_ip}:{listen_port} for NetFlow/IPFIX packets...")
+    return sock
 
-    fieldnames = ["timestamp", "source", "record_type", "metric", "value",
-                  "label", "message"]
+def socket_drops(sock):
+    # Kernel drop counter of this socket, from the "drops" column of
+    # /proc/net/udp (matched by inode); None where it is not available
+    inode = str(os.fstat(sock.fileno()).st_ino)
+    try:
+        with open("/proc/net/udp") as f:
+            next(f)
+            for line in f:
+                fields = line.split()
+                if fields[9] == inode:
+                    return int(fields[-1])
+    except (OSError, IndexError, ValueError):
+        pass
+    return None
 
-    with open("netflow_flows.csv", "a", newline="") as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        csvfile.seek(0, 2)
-        if csvfile.tell() == 0:
-            writer.writeheader()
+def receive_batches(sock, packet_queue, batch_size=RECV_BATCH):
+    # Blocks for the first packet, then drains whatever else is already in
+    # the socket buffer without blocking, so the decoder gets one queue item
+    # per burst instead of one per packet. All packets of a batch share the
+    # receive timestamp of the first one.
+    while True:
+        data, addr = sock.recvfrom(65535)
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        batch = [(data, addr[0], timestamp)]
+        started = time.perf_counter()
+        size = len(data)
+        while len(batch) < batch_size:
+            try:
+                data, addr = sock.recvfrom(65535, socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                break
+            batch.append((data, addr[0], timestamp))
+            size += len(data)
+        metrics.observe("stage_seconds", time.perf_counter() - started, stage="receive")
+        metrics.inc("packets_received_total", len(batch))
+        metrics.inc("bytes_received_total", size)
+        packet_queue.put(batch)
 
-        while True:
-            data, addr = sock.recvfrom(8192)
-            exporter_ip = addr[0]
-            timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+def decode_packet(data, exporter_ip, timestamp):
+    packet = netflow.parse_packet(data, templates=TEMPLATES)
+    if hasattr(packet, "templates") and packet.templates:
+        TEMPLATES.update(packet.templates)
+
+    flows = getattr(packet, "flows", [])
+    version = getattr(packet.header, "version", "?")
+    flow_count = len(flows)
+
+    record_type = "NETFLOW"
+    rows = []
+
+    for idx, flow in enumerate(flows, 1):
+        src_ip_int = getattr(flow, "IPV4_SRC_ADDR", None)
+        dst_ip_int = getattr(flow, "IPV4_DST_ADDR", None)
+        src_ip = decode_ipv4(src_ip_int)
+        dst_ip = decode_ipv4(dst_ip_int)
+
+        src_port = getattr(flow, "SRC_PORT", None)
+        dst_port = getattr(flow, "DST_PORT", None)
+        pkts     = getattr(flow, "IN_PACKETS", None)
+        octets   = getattr(flow, "IN_OCTETS", None)
+        proto    = getattr(flow, "PROTO", None)
+
+        label = ""
+        message = (f"Flow {idx}/{flow_count}, Ver:{version}, "
+                   f"Src:{src_ip}:{src_port} -> {dst_ip}:{dst_port}, "
+                   f"Pkts:{pkts}, Bytes:{octets}, Proto:{proto}")
+
+        if octets is not None and octets > 5e6:
+            label = "HIGH_FLOW"
+            message += " | Large flow detected"
+
+        if (dst_port == 23 or dst_port == 445):
+            label = "SUSPICIOUS_PORT"
+            message += f" | Suspicious DST port {dst_port}"
+
+        if proto == 1:
+            label = "ICMP_FLOW"
+            message += " | ICMP flow flagged"
+
+        row = {
+            "timestamp": timestamp,
+            "source": exporter_ip,
+            "record_type": record_type,
+            "metric": "flow",
+            "value": pkts,
+            "label": label,
+            "message": message
+        }
+        rows.append(row)
+
+    return rows
 
+def flow_rows(flows, timestamp):
+    # Same rows, labels and messages as decode_packet(), built from a decoded
+    # FLOW_DTYPE array; the label rules are evaluated on whole columns
+    octets = flows["octets"]
+    dst_port = flows["dst_port"]
+    proto = flows["proto"]
+    high_flow = octets > 5e6
+    suspicious = (dst_port == 23) | (dst_port == 445)
+    icmp = proto == 1
+    labels = np.where(icmp, "ICMP_FLOW",
+                      np.where(suspicious, "SUSPICIOUS_PORT",
+                               np.where(high_flow, "HIGH_FLOW", "")))
+
+    ip_names = {}
+    def ip_name(addr_int):
+        name = ip_names.get(addr_int)
+        if name is None:
+            name = ip_names[addr_int] = decode_ipv4(addr_int)
+        return name
+
+    rows = []
+    for (exporter, version, idx, flow_count, src, dst, src_port, dst_port_val,
+         proto_val, pkts, octets_val, label, is_high, is_suspicious, is_icmp) in zip(
+            flows["exporter"].tolist(), flows["version"].tolist(),
+            flows["flow_index"].tolist(), flows["flow_count"].tolist(),
+            flows["src_addr"].tolist(), flows["dst_addr"].tolist(),
+            flows["src_port"].tolist(), dst_port.tolist(), proto.tolist(),
+            flows["packets"].tolist(), octets.tolist(), labels.tolist(),
+            high_flow.tolist(), suspicious.tolist(), icmp.tolist()):
+        message = (f"Flow {idx}/{flow_count}, Ver:{version}, "
+                   f"Src:{ip_name(src)}:{src_port} -> {ip_name(dst)}:{dst_port_val}, "
+                   f"Pkts:{pkts}, Bytes:{octets_val}, Proto:{proto_val}")
+        if is_high:
+            message += " | Large flow detected"
+        if is_suspicious:
+            message += f" | Suspicious DST port {dst_port_val}"
+        if is_icmp:
+            message += " | ICMP flow flagged"
+        rows.append({
+            "timestamp": timestamp,
+            "source": ip_name(exporter),
+            "record_type": "NETFLOW",
+            "metric": "flow",
+            "value": pkts,
+            "label": label,
+            "message": message
+        })
+    return rows
+
+def decode_batch(decoder, batch):
+    # batch: [(data, exporter ip, timestamp)] from receive_batches()
+    if decoder is None:
+        rows = []
+        with metrics.timer("stage_seconds", stage="decode"):
+            for data, exporter_ip, timestamp in batch:
+                try:
+                    rows.extend(decode_packet(data, exporter_ip, timestamp))
+                except Exception as e:
+                    metrics.inc("decode_errors_total", exporter=exporter_ip)
+                    print(f"{timestamp} - Failed {exporter_ip}: {e}")
+        metrics.inc("flows_decoded_total", len(rows))
+        return rows
+
+    flows = decode_flows(decoder, batch)
+    with metrics.timer("stage_seconds", stage="label"):
+        return flow_rows(flows, batch[0][2])
+
+def decode_flows(decoder, batch):
+    timestamp = batch[0][2]
+    with metrics.timer("stage_seconds", stage="decode"):
+        flows, errors = decoder.decode_batch([(data, exporter_ip)
+                                              for data, exporter_ip, _ in batch])
+    metrics.inc("flows_decoded_total", len(flows))
+    for exporter_ip, e in errors:
+        metrics.inc("decode_errors_total", exporter=exporter_ip)
+        print(f"{timestamp} - Failed {exporter_ip}: {e}")
+    return flows
+
+def run_worker(listen_ip, listen_port, worker_id=None, rcvbuf=RCVBUF_BYTES,
+               batch_size=RECV_BATCH, decoder_name=DECODER, aggregate=AGGREGATE,
+               window=WINDOW, max_pending=MAX_PENDING_BATCHES, metrics_port=METRICS_PORT,
+               stats_file=STATS_FILE, profile_file=PROFILE_FILE, live_port=LIVE_PORT,
+               live_socket=LIVE_SOCKET):
+    global metrics
+    sock = open_socket(listen_ip, listen_port, rcvbuf, reuseport=worker_id is not None)
+    name = "netflow_flows" if worker_id is None else f"netflow_flows-w{worker_id}"
+    tag = "" if worker_id is None else f"[worker {worker_id}] "
+    print(f"{tag}Listening on {listen_ip}:{listen_port} for NetFlow/IPFIX packets...")
+
+    if worker_id is not None:
+        metrics = Metrics("netflow", {"worker": worker_id})
+        metrics_port = metrics_port + worker_id if metrics_port is not None else None
+        stats_file = worker_file(stats_file, worker_id)
+        profile_file = worker_file(profile_file, worker_id)
+        live_port = live_port + worker_id if live_port is not None else None
+        live_socket = worker_file(live_socket, worker_id)
+    telemetry = SelfTelemetry(metrics, metrics_port, stats_file, STATS_INTERVAL,
+                              profile_file).start()
+    live, live_server = open_live(metrics, live_port, live_socket, LIVE_HOURS,
+                                  window if aggregate else LIVE_RESOLUTION, LIVE_MAX_SERIES)
+
+    packet_queue = queue.Queue(maxsize=max_pending)
+    metrics.track("packet_queue_batches", packet_queue.qsize)
+    metrics.track("kernel_drops_total", lambda: socket_drops(sock), "counter")
+    receiver = threading.Thread(target=receive_batches, args=(sock, packet_queue, batch_size),
+                                name="netflow-recv", daemon=True)
+    receiver.start()
+
+    sink = open_sink(name, fieldnames, STORAGE, metrics=metrics, live=live)
+    decoder = FlowDecoder() if decoder_name == "builtin" else None
+    aggregator = FlowAggregator(aggregate, window) if aggregate else None
+    last_drops = socket_drops(sock) or 0
+    next_stats = time.monotonic() + STATS_INTERVAL
+
+    try:
+        while True:
             try:
-                packet = netflow.parse_packet(data, templates=TEMPLATES)
-                if hasattr(packet, "templates") and packet.templates:
-                    TEMPLATES.update(packet.templates)
-
-                flows = getattr(packet, "flows", [])
-                version = getattr(packet.header, "version", "?")
-                flow_count = len(flows)
-
-                record_type = "NETFLOW"
-
-                for idx, flow in enumerate(flows, 1):
-                    src_ip_int = getattr(flow, "IPV4_SRC_ADDR", None)
-                    dst_ip_int = getattr(flow, "IPV4_DST_ADDR", None)
-                    src_ip = decode_ipv4(src_ip_int)
-                    dst_ip = decode_ipv4(dst_ip_int)
-
-                    src_port = getattr(flow, "SRC_PORT", None)
-                    dst_port = getattr(flow, "DST_PORT", None)
-                    pkts     = getattr(flow, "IN_PACKETS", None)
-                    octets   = getattr(flow, "IN_OCTETS", None)
-                    proto    = getattr(flow, "PROTO", None)
-
-                    label = ""
-                    message = (f"Flow {idx}/{flow_count}, Ver:{version}, "
-                               f"Src:{src_ip}:{src_port} -> {dst_ip}:{dst_port}, "
-                               f"Pkts:{pkts}, Bytes:{octets}, Proto:{proto}")
-
-                    if octets is not None and octets > 5e6:
-                        label = "HIGH_FLOW"
-                        message += " | Large flow detected"
-
-                    if (dst_port == 23 or dst_port == 445):
-                        label = "SUSPICIOUS_PORT"
-                        message += f" | Suspicious DST port {dst_port}"
-
-                    if proto == 1:
-                        label = "ICMP_FLOW"
-                        message += " | ICMP flow flagged"
-
-                    row = {
-                        "timestamp": timestamp,
-                        "source": exporter_ip,
-                        "record_type": record_type,
-                        "metric": "flow",
-                        "value": pkts,
-                        "label": label,
-                        "message": message
-                    }
-                    writer.writerow(row)
-                    csvfile.flush()
-
-            except Exception as e:
-                print(f"{timestamp} - Failed {exporter_ip}: {e}")
+                batch = packet_queue.get(timeout=STATS_INTERVAL)
+            except queue.Empty:
+                batch = []
+
+            if aggregator is not None:
+                if batch:
+                    flows = decode_flows(decoder, batch)
+                    with metrics.timer("stage_seconds", stage="aggregate"):
+                        rows = aggregator.add(flows)
+                else:
+                    rows = aggregator.flush()
+            else:
+                rows = decode_batch(decoder, batch) if batch else []
+            if rows:
+                with metrics.timer("stage_seconds", stage="write"):
+                    sink.write_rows(rows)
+                metrics.inc("rows_written_total", len(rows))
+
+            if time.monotonic() >= next_stats:
+                next_stats = time.monotonic() + STATS_INTERVAL
+                drops = socket_drops(sock)
+                if drops is not None and drops > last_drops:
+                    print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - {tag}Kernel dropped "
+                          f"{drops - last_drops} packets (total {drops}), "
+                          f"{packet_queue.qsize()} batches queued")
+                    last_drops = drops
+    finally:
+        if aggregator is not None:
+            sink.write_rows(aggregator.flush(force=True))
+        sink.close()
+        if live_server is not None:
+            live_server.stop()
+        telemetry.stop()
+
+def worker_file(path, worker_id):
+    # stats.jsonl -> stats-w2.jsonl
+    if path is None:
+        return None
+    base, ext = os.path.splitext(path)
+    return f"{base}-w{worker_id}{ext}"
+
+def start_collector(listen_ip="0.0.0.0", listen_port=9999, workers=WORKERS,
+                    rcvbuf=RCVBUF_BYTES, batch_size=RECV_BATCH, decoder_name=DECODER,
+                    aggregate=AGGREGATE, window=WINDOW, metrics_port=METRICS_PORT,
+                    stats_file=STATS_FILE, profile_file=PROFILE_FILE, live_port=LIVE_PORT,
+                    live_socket=LIVE_SOCKET):
+    if aggregate and decoder_name != "builtin":
+        raise ValueError("Flow aggregation needs the builtin decoder")
+    options = {"rcvbuf": rcvbuf, "batch_size": batch_size, "decoder_name": decoder_name,
+               "aggregate": aggregate, "window": window, "metrics_port": metrics_port,
+               "stats_file": stats_file, "profile_file": profile_file,
+               "live_port": live_port, "live_socket": live_socket}
+    if workers <= 1:
+        run_worker(listen_ip, listen_port, None, **options)
+        return
+
+    # The kernel hashes each exporter's 4-tuple to one socket, so every
+    # worker keeps seeing the same exporters and their v9/IPFIX templates
+    processes = [
+        multiprocessing.Process(target=run_worker,
+                                args=(listen_ip, listen_port, worker_id), kwargs=options,
+                                name=f"netflow-worker-{worker_id}")
+        for worker_id in range(1, workers + 1)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
 
 def main():
-    start_collector("0.0.0.0", 9999)
+    parser = argparse.ArgumentParser(description="NetFlow/IPFIX collector (netflow_flows.csv)")
+    parser.add_argument("--listen-ip", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="processes sharing the port with SO_REUSEPORT; each "
+                             "writes its own netflow_flows-w<N> output")
+    parser.add_argument("--rcvbuf", type=int, default=RCVBUF_BYTES,
+                        help="socket receive buffer in bytes")
+    parser.add_argument("--batch", type=int, default=RECV_BATCH,
+                        help="maximum packets handed to the decoder at once")
+    parser.add_argument("--decoder", choices=["builtin", "netflow"], default=DECODER,
+                        help="batch NumPy decoder or the netflow library")
+    parser.add_argument("--aggregate", choices=["pair", "5tuple", "port"], default=AGGREGATE,
+                        help="write per-window aggregates instead of one row per flow")
+    parser.add_argument("--window", type=int, default=WINDOW,
+                        help="aggregation window in seconds")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="serve self-telemetry in Prometheus format on 127.0.0.1:PORT")
+    parser.add_argument("--stats-file", default=STATS_FILE,
+                        help=f"append self-telemetry as JSON lines every {STATS_INTERVAL}s")
+    parser.add_argument("--profile", dest="profile_file", default=PROFILE_FILE,
+                        help="sample all thread stacks and write folded stacks to this file")
+    parser.add_argument("--live-port", type=int, default=LIVE_PORT,
+                        help="keep recent rows in memory and serve them on 127.0.0.1:PORT")
+    parser.add_argument("--live-socket", default=LIVE_SOCKET,
+                        help="serve the live store on this Unix socket")
+    args = parser.parse_args()
+
+    start_collector(args.listen_ip, args.port, args.workers, args.rcvbuf, args.batch,
+                    args.decoder, args.aggregate, args.window, args.metrics_port,
+                    args.stats_file, args.profile_file, args.live_port, args.live_socket)
 
 if __name__ == "__main__":
     main()
-
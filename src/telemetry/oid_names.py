@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+# OID -> name resolution for the trap listener, compiled once at import into
+# a prefix trie over integer arcs. lookup() returns the longest known prefix
+# and the remaining arcs (the instance index, e.g. the ifIndex of an
+# ifTable column), so no OID text is parsed per trap.
+
+SYS_UPTIME = "1.3.6.1.2.1.1.3.0"
+SNMP_TRAP_OID = "1.3.6.1.6.3.1.1.4.1.0"
+SNMP_TRAP_ADDRESS = "1.3.6.1.6.3.18.1.3.0"
+SNMP_TRAP_COMMUNITY = "1.3.6.1.6.3.18.1.4.0"
+SNMP_TRAP_ENTERPRISE = "1.3.6.1.6.3.1.1.4.3.0"
+
+OID_NAMES = {
+    # SNMPv2-MIB notification header
+    SYS_UPTIME: "sysUpTime",
+    SNMP_TRAP_OID: "snmpTrapOID",
+    SNMP_TRAP_ADDRESS: "snmpTrapAddress",
+    SNMP_TRAP_COMMUNITY: "snmpTrapCommunity",
+    SNMP_TRAP_ENTERPRISE: "snmpTrapEnterprise",
+    # generic traps (SNMPv2-MIB / IF-MIB)
+    "1.3.6.1.6.3.1.1.5.1": "coldStart",
+    "1.3.6.1.6.3.1.1.5.2": "warmStart",
+    "1.3.6.1.6.3.1.1.5.3": "linkDown",
+    "1.3.6.1.6.3.1.1.5.4": "linkUp",
+    "1.3.6.1.6.3.1.1.5.5": "authenticationFailure",
+    "1.3.6.1.6.3.1.1.5.6": "egpNeighborLoss",
+    # IF-MIB columns carried by linkUp/linkDown
+    "1.3.6.1.2.1.2.2.1.1": "ifIndex",
+    "1.3.6.1.2.1.2.2.1.2": "ifDescr",
+    "1.3.6.1.2.1.2.2.1.3": "ifType",
+    "1.3.6.1.2.1.2.2.1.7": "ifAdminStatus",
+    "1.3.6.1.2.1.2.2.1.8": "ifOperStatus",
+    "1.3.6.1.2.1.31.1.1.1.1": "ifName",
+    # ENTITY-MIB
+    "1.3.6.1.2.1.47.2.0.1": "entConfigChange",
+    "1.3.6.1.2.1.47.1.4.1.0": "entLastChangeTime",
+    # Cisco
+    "1.3.6.1.4.1.9.2.1.2.0": "whyReload",
+    "1.3.6.1.4.1.9.2.2.1.1.20": "locIfReason",
+    "1.3.6.1.4.1.9.9.41.2.0.1": "clogMessageGenerated",
+    "1.3.6.1.4.1.9.9.43.2.0.1": "ciscoConfigManEvent",
+}
+
+def oid_arcs(oid):
+    if isinstance(oid, str):
+        return tuple(int(arc) for arc in oid.strip(".").split("."))
+    return tuple(oid)
+
+class OidTrie:
+
+    def __init__(self, names):
+        self.root = {}
+        for oid, name in names.items():
+            node = self.root
+            for arc in oid_arcs(oid):
+                node = node.setdefault(arc, {})
+            node[None] = name
+
+    def lookup(self, arcs):
+        # -> (name, index arcs) for the longest known prefix, or (None, arcs)
+        node = self.root
+        best, best_len = None, 0
+        for depth, arc in enumerate(arcs, 1):
+            node = node.get(arc)
+            if node is None:
+                break
+            if None in node:
+                best, best_len = node[None], depth
+        return best, tuple(arcs[best_len:])
+
+OID_TRIE = OidTrie(OID_NAMES)
+
+def oid_name(oid):
+    name, index = OID_TRIE.lookup(oid_arcs(oid))
+    if name is None:
+        return None
+    if index:
+        return name + "." + ".".join(str(arc) for arc in index)
+    return name
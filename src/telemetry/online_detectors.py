@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+import math
+from array import array
+
+# Online anomaly detectors for the poller. Each (source, metric) stream gets
+# its own detector; update(value) is O(1) and returns a score, the sample is
+# anomalous when score > threshold. Scores are in standard deviations for
+# EWMA / z-score / Holt-Winters and a cumulative sum of them for the
+# change-point detector, hence its own threshold. No score is reported during
+# the warm-up.
+
+WARMUP = 10
+THRESHOLD = 3.0
+# Holt-Winters season, in samples of the stream (60 x 5s = 5 minutes)
+SEASON = 60
+# Metrics that are never scored (monotonic or static values)
+SKIP_METRICS = {"sysUpTime", "memTotal", "swapTotal"}
+# Floor of the deviation a sample is scored against, so that a stream that
+# has been flat (stuck counter, constant value) still scores a jump:
+# max(MIN_SCALE_FRACTION * |mean|, MIN_SCALE)
+MIN_SCALE_FRACTION = 1e-3
+MIN_SCALE = 1e-3
+
+def min_scale(mean):
+    return max(MIN_SCALE_FRACTION * abs(mean), MIN_SCALE)
+
+class EwmaDetector:
+    # exponentially weighted mean and variance; the score uses the state
+    # before the sample is folded in
+    __slots__ = ("alpha", "mean", "var", "n")
+    threshold = THRESHOLD
+
+    def __init__(self, alpha=0.1):
+        self.alpha = alpha
+        self.mean = 0.0
+        self.var = 0.0
+        self.n = 0
+
+    def update(self, x):
+        self.n += 1
+        if self.n == 1:
+            self.mean = x
+            return 0.0
+        diff = x - self.mean
+        score = abs(diff) / max(math.sqrt(self.var), min_scale(self.mean))
+        incr = self.alpha * diff
+        self.mean += incr
+        self.var = (1 - self.alpha) * (self.var + diff * incr)
+        return score if self.n > WARMUP else 0.0
+
+class ZScoreDetector:
+    # z-score against the previous `window` samples, running sums over a
+    # fixed ring buffer
+    __slots__ = ("window", "values", "pos", "n", "total", "total_sq")
+    threshold = THRESHOLD
+
+    def __init__(self, window=30):
+        self.window = window
+        self.values = array("d", bytes(8 * window))
+        self.pos = 0
+        self.n = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def update(self, x):
+        count = min(self.n, self.window)
+        score = 0.0
+        if count >= 2:
+            mean = self.total / count
+            var = max(self.total_sq / count - mean * mean, 0.0)
+            score = abs(x - mean) / max(math.sqrt(var), min_scale(mean))
+        old = self.values[self.pos]
+        if self.n >= self.window:
+            self.total -= old
+            self.total_sq -= old * old
+        self.values[self.pos] = x
+        self.total += x
+        self.total_sq += x * x
+        self.pos = (self.pos + 1) % self.window
+        self.n += 1
+        return score if self.n > WARMUP else 0.0
+
+class HoltWintersDetector:
+    # additive Holt-Winters (level, trend, season of `season` samples); the
+    # score is the one-step forecast error over its EWMA deviation
+    __slots__ = ("alpha", "beta", "gamma", "season", "seasonal", "level", "trend",
+                 "dev", "n")
+    threshold = THRESHOLD
+
+    def __init__(self, season=SEASON, alpha=0.2, beta=0.01, gamma=0.1):
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.season = season
+        self.seasonal = array("d", bytes(8 * season))
+        self.level = 0.0
+        self.trend = 0.0
+        self.dev = 0.0
+        self.n = 0
+
+    def update(self, x):
+        i = self.n % self.season
+        self.n += 1
+        if self.n == 1:
+            self.level = x
+            return 0.0
+        forecast = self.level + self.trend + self.seasonal[i]
+        error = x - forecast
+        score = abs(error) / max(self.dev, min_scale(self.level))
+        level = self.alpha * (x - self.seasonal[i]) + (1 - self.alpha) * (self.level + self.trend)
+        self.trend = self.beta * (level - self.level) + (1 - self.beta) * self.trend
+        self.seasonal[i] = self.gamma * (x - level) + (1 - self.gamma) * self.seasonal[i]
+        self.level = level
+        self.dev = 0.1 * abs(error) + 0.9 * self.dev
+        return score if self.n > max(WARMUP, self.season) else 0.0
+
+class ChangePointDetector:
+    # two-sided Page-Hinkley test on the deviation from a slow EWMA mean,
+    # alarm at `level`; after an alarm the sums and the mean restart
+    __slots__ = ("delta", "level", "alpha", "mean", "scale", "up", "up_min",
+                 "down", "down_max", "n")
+    threshold = 8.0
+
+    def __init__(self, delta=0.5, level=8.0, alpha=0.01):
+        self.delta = delta
+        self.level = level
+        self.alpha = alpha
+        self.mean = 0.0
+        self.scale = 0.0
+        self.up = self.up_min = 0.0
+        self.down = self.down_max = 0.0
+        self.n = 0
+
+    def update(self, x):
+        self.n += 1
+        if self.n == 1:
+            self.mean = x
+            return 0.0
+        diff = x - self.mean
+        self.scale = self.alpha * abs(diff) + (1 - self.alpha) * self.scale if self.n > 2 else abs(diff)
+        self.mean += self.alpha * diff
+        z = diff / self.scale if self.scale > 0 else 0.0
+        self.up += z - self.delta
+        self.up_min = min(self.up_min, self.up)
+        self.down += z + self.delta
+        self.down_max = max(self.down_max, self.down)
+        score = max(self.up - self.up_min, self.down_max - self.down)
+        if score > self.level:
+            # new regime: restart from the current value
+            self.up = self.up_min = self.down = self.down_max = 0.0
+            self.mean = x
+        return score if self.n > WARMUP else 0.0
+
+DETECTORS = {
+    "ewma": EwmaDetector,
+    "zscore": ZScoreDetector,
+    "holtwinters": HoltWintersDetector,
+    "changepoint": ChangePointDetector,
+}
+
+class DetectorBank:
+    # detectors created on first sample of each (source, metric) stream
+
+    def __init__(self, kind="ewma", threshold=None, skip=SKIP_METRICS, **params):
+        if kind not in DETECTORS:
+            raise ValueError(f"Unknown detector '{kind}'")
+        self.kind = kind
+        self.factory = DETECTORS[kind]
+        self.params = params
+        self.threshold = threshold if threshold is not None else self.factory.threshold
+        self.skip = skip
+        self.streams = {}
+
+    def score(self, source, metric, value):
+        # -> score, or None when the metric is not scored
+        if metric in self.skip:
+            return None
+        detector = self.streams.get((source, metric))
+        if detector is None:
+            detector = self.streams[(source, metric)] = self.factory(**self.params)
+        return detector.update(value)
+
+    def label_rows(self, rows):
+        # Rows without a threshold label get "ANOMALY" when their detector fires
+        for row in rows:
+            value = row["value"]
+            if value == "" or value is None:
+                continue
+            score = self.score(row["source"], row["metric"], float(value))
+            if score is None or score <= self.threshold:
+                continue
+            detail = f"{self.kind} score {score:.1f} > {self.threshold}"
+            if row["label"]:
+                row["message"] = f"{row['message']} | {detail}" if row["message"] else detail
+            else:
+                row["label"] = "ANOMALY"
+                row["message"] = detail
+        return rows
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+import heapq
+import random
+import time
+
+# Fraction of its interval over which each job's first deadline is spread,
+# so thousands of jobs with the same interval do not fire in one burst
+DEFAULT_JITTER = 1.0
+
+class PollScheduler:
+    # Deadline scheduler for poll jobs. Each job is a dict with at least an
+    # "interval" key (seconds). Deadlines advance by exactly one interval from
+    # the previous deadline, never from the time the poll finished, so the
+    # period does not drift with polling latency.
+    #
+    # Catch-up/skip rules: a job that is late by less than one interval runs
+    # immediately and keeps its phase; a job that missed whole slots runs
+    # once and the missed slots are dropped (counted in `skipped`) instead of
+    # being replayed in a burst.
+
+    def __init__(self, jobs, jitter=DEFAULT_JITTER, seed=None, start=None):
+        self.heap = []
+        self.skipped = 0
+        rng = random.Random(seed)
+        if start is None:
+            start = time.monotonic()
+        for seq, job in enumerate(jobs):
+            offset = rng.uniform(0, job["interval"] * jitter)
+            heapq.heappush(self.heap, (start + offset, seq, job))
+
+    def next_deadline(self):
+        if not self.heap:
+            return None
+        return self.heap[0][0]
+
+    def pop_due(self, now=None):
+        # Returns [(deadline, job)] for every job whose deadline has passed,
+        # and reschedules each of them.
+        if now is None:
+            now = time.monotonic()
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            deadline, seq, job = heapq.heappop(self.heap)
+            interval = job["interval"]
+            next_deadline = deadline + interval
+            if next_deadline <= now:
+                missed = int((now - deadline) // interval)
+                self.skipped += missed
+                next_deadline = deadline + (missed + 1) * interval
+            heapq.heappush(self.heap, (next_deadline, seq, job))
+            due.append((deadline, job))
+        return due
+
+    def sleep_time(self, now=None):
+        deadline = self.next_deadline()
+        if deadline is None:
+            return None
+        if now is None:
+            now = time.monotonic()
+        return max(0.0, deadline - now)
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+import json
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Self-telemetry of the collectors: counters, gauges and latency histograms
+# kept in process (one lock, a dict update per call, no allocation once a
+# series exists), exposed in Prometheus text format on a local HTTP endpoint
+# and/or appended as JSON lines to a stats file. The sampling profiler, when
+# enabled, records the stack of every thread at a fixed interval and writes
+# them as folded stacks (flamegraph.pl / speedscope input).
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_ADDRESS = "127.0.0.1"
+STATS_INTERVAL = 10
+PROFILE_INTERVAL = 0.005
+PROFILE_MAX_DEPTH = 64
+# Threads of this module, left out of the profiles
+TELEMETRY_THREADS = {"metrics-http", "stats-writer", "sampling-profiler", "live-http"}
+
+def series_key(name, labels):
+    return name, tuple(sorted(labels.items())) if labels else ()
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(labels, extra=()):
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in pairs) + "}"
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class StageTimer:
+    # with metrics.timer("stage_seconds", stage="decode"): ...
+    __slots__ = ("metrics", "name", "labels", "started")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
+
+class Metrics:
+    # Registry of one collector process. Names are prefixed with `prefix`;
+    # `labels` (e.g. the worker id) are added to every series.
+
+    def __init__(self, prefix, labels=None):
+        self.prefix = prefix
+        self.labels = tuple(sorted((labels or {}).items()))
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        # (name, labels) -> (kind, function), evaluated at collection
+        self.functions = {}
+        # (name, labels) -> [bucket counts, sum, count]
+        self.histograms = {}
+        self.started = time.time()
+
+    def inc(self, name, value=1, **labels):
+        key = series_key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        self.gauges[series_key(name, labels)] = value
+
+    def track(self, name, function, kind="gauge", **labels):
+        # value read from function() at every collection: queue depths,
+        # counters kept elsewhere (sink rows, kernel drops...)
+        self.functions[series_key(name, labels)] = (kind, function)
+
+    def observe(self, name, seconds, **labels):
+        key = series_key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0, 0]
+            histogram[0][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def timer(self, name, **labels):
+        return StageTimer(self, name, labels)
+
+    def collect(self):
+        # -> {(name, labels): (kind, value)}, histograms as (bucket counts, sum, count)
+        with self.lock:
+            series = {key: ("counter", value) for key, value in self.counters.items()}
+            series.update((key, ("histogram", (list(histogram[0]), histogram[1], histogram[2])))
+                          for key, histogram in self.histograms.items())
+        series.update((key, ("gauge", value)) for key, value in list(self.gauges.items()))
+        for key, (kind, function) in list(self.functions.items()):
+            try:
+                value = function()
+            except Exception:
+                continue
+            if value is not None:
+                series[key] = (kind, value)
+        series[("uptime_seconds", ())] = ("gauge", round(time.time() - self.started, 3))
+        return series
+
+    def render(self):
+        # Prometheus text exposition format 0.0.4
+        lines = []
+        typed = set()
+        for (name, labels), (kind, value) in sorted(self.collect().items(),
+                                                    key=lambda item: item[0]):
+            full_name = f"{self.prefix}_{name}"
+            if full_name not in typed:
+                typed.add(full_name)
+                lines.append(f"# TYPE {full_name} {kind}")
+            labels = self.labels + labels
+            if kind != "histogram":
+                lines.append(f"{full_name}{format_labels(labels)} {format_value(value)}")
+                continue
+            buckets, total, count = value
+            cumulative = 0
+            for bound, bucket in zip(LATENCY_BUCKETS + (float("inf"),), buckets):
+                cumulative += bucket
+                lines.append(f"{full_name}_bucket"
+                             f"{format_labels(labels, (('le', format_value(bound)),))} {cumulative}")
+            lines.append(f"{full_name}_sum{format_labels(labels)} {format_value(total)}")
+            lines.append(f"{full_name}_count{format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        # JSON-friendly view: series "name{labels}" -> value, histograms
+        # summarised as count, mean and bucket-bound quantiles
+        result = {"timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                  "labels": dict(self.labels)}
+        for (name, labels), (kind, value) in sorted(self.collect().items(),
+                                                    key=lambda item: item[0]):
+            series = name + format_labels(labels)
+            section = result.setdefault(kind + "s", {})
+            if kind != "histogram":
+                section[series] = value
+                continue
+            buckets, total, count = value
+            summary = {"count": count, "mean": total / count if count else None}
+            for q in (0.5, 0.95, 0.99):
+                summary[f"p{int(q * 100)}"] = bucket_quantile(buckets, count, q)
+            section[series] = summary
+        return result
+
+def bucket_quantile(buckets, count, q):
+    # upper bound of the bucket holding the q-quantile (None past the last bound)
+    if not count:
+        return None
+    rank = q * count
+    cumulative = 0
+    for bound, bucket in zip(LATENCY_BUCKETS, buckets):
+        cumulative += bucket
+        if cumulative >= rank:
+            return bound
+    return None
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class SamplingProfiler:
+    # Samples the stack of every other thread each `interval` seconds;
+    # stacks are counted as "thread;file:function;..." folded lines
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if names.get(ident) in TELEMETRY_THREADS:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def dump(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+class SelfTelemetry:
+    # Starts the HTTP endpoint (port), the stats file writer (stats_path,
+    # one JSON line every stats_interval seconds, with per-second rates of
+    # the counters) and the profiler (profile_path) as requested
+
+    def __init__(self, metrics, port=None, stats_path=None, stats_interval=STATS_INTERVAL,
+                 profile_path=None, address=METRICS_ADDRESS):
+        self.metrics = metrics
+        self.stats_path = stats_path
+        self.stats_interval = stats_interval
+        self.profile_path = profile_path
+        self.server = None
+        self.profiler = None
+        self.previous = None
+        self.stopped = threading.Event()
+        self.threads = []
+        if port is not None:
+            self.server = ThreadingHTTPServer((address, port), MetricsHandler)
+            self.server.daemon_threads = True
+            self.server.metrics = metrics
+            self.threads.append(threading.Thread(target=self.server.serve_forever,
+                                                 name="metrics-http", daemon=True))
+            print(f"Self-telemetry on http://{address}:{port}/metrics")
+        if profile_path is not None:
+            self.profiler = SamplingProfiler()
+        if stats_path is not None or profile_path is not None:
+            self.threads.append(threading.Thread(target=self.run, name="stats-writer",
+                                                 daemon=True))
+
+    def start(self):
+        if self.profiler is not None:
+            self.profiler.start()
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def write_stats(self):
+        snapshot = self.metrics.snapshot()
+        now = time.monotonic()
+        counters = snapshot.get("counters", {})
+        if self.previous is not None:
+            elapsed = now - self.previous[0]
+            snapshot["rates"] = {name: round((value - self.previous[1].get(name, 0)) / elapsed, 3)
+                                 for name, value in counters.items() if elapsed > 0}
+        self.previous = (now, counters)
+        with open(self.stats_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(snapshot) + "\n")
+
+    def run(self):
+        while not self.stopped.wait(self.stats_interval):
+            self.flush()
+
+    def flush(self):
+        if self.stats_path is not None:
+            self.write_stats()
+        if self.profiler is not None:
+            self.profiler.dump(self.profile_path)
+
+    def stop(self):
+        self.stopped.set()
+        for thread in self.threads:
+            if thread.name == "stats-writer" and thread.is_alive():
+                thread.join()
+        if self.profiler is not None:
+            self.profiler.stop()
+        self.flush()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
@@ -1,37 +1,566 @@
 #!/usr/bin/env python3
+import argparse
+import asyncio
+import json
 import time
-import csv
 import paramiko
 from pysnmp.hlapi import *
+from pysnmp.proto.rfc1905 import NoSuchObject, NoSuchInstance, EndOfMibView
+from poll_scheduler import PollScheduler, DEFAULT_JITTER
+from csv_sink import open_sink
+from online_detectors import DetectorBank, DETECTORS
+from self_metrics import Metrics, SelfTelemetry, STATS_INTERVAL
+from live_store import open_live, LIVE_HOURS, LIVE_MAX_SERIES
 
 previous_snmp_values = {}
+last_values = {}
 
-def snmp_poll(target, community, oid):
+# One engine for the whole process; transport targets are cached per device IP
+snmpEngine = SnmpEngine()
+transport_targets = {}
+async_transport_targets = {}
+# pysnmp.hlapi.asyncio, imported by load_async_hlapi() for --async only: the
+# one of pysnmp 4.4 does not import on Python >= 3.11 (see requirements.txt)
+async_hlapi = None
+
+# Optional per-device keys: "interval" (seconds, defaults to POLLING_INTERVAL)
+# and "oid_intervals" ({metric: seconds}) to poll slow-changing OIDs such as
+# memTotal or swapTotal less often than the rest of the device;
+# "if_table" (defaults to IF_TABLE_WALK) to walk the interface tables and
+# "interfaces" (list of ifName) to read only those interfaces, with a GET of
+# their counter columns instead of a walk of the whole table. The interface
+# "snmp_if_index" also keeps its device-level rx_rate / tx_rate rows.
+DEVICES = {
+    "VM1": {
+        "type": "linux",
+        "ip": "1.0.0.2",
+        "community": "public",
+        "snmp_if_index": 3,
+        "oids": {
+            "sysUpTime": ".1.3.6.1.2.1.1.3.0",
+            "load1": ".1.3.6.1.4.1.2021.10.1.3.1",
+            "load5": ".1.3.6.1.4.1.2021.10.1.3.2",
+            "load15": ".1.3.6.1.4.1.2021.10.1.3.3",
+            "cpuUser": ".1.3.6.1.4.1.2021.11.9.0",
+            "cpuSystem": ".1.3.6.1.4.1.2021.11.10.0",
+            "cpuIdle": ".1.3.6.1.4.1.2021.11.11.0",
+            "memTotal": ".1.3.6.1.4.1.2021.4.5.0",
+            "memUsed": ".1.3.6.1.4.1.2021.4.6.0",
+            "memFree": ".1.3.6.1.4.1.2021.4.11.0",
+            "swapTotal": ".1.3.6.1.4.1.2021.4.3.0",
+            "swapAvail": ".1.3.6.1.4.1.2021.4.4.0"
+        }
+    },
+    "VM2": {
+        "type": "linux",
+        "ip": "1.0.0.3",
+        "community": "public",
+        "snmp_if_index": 3,
+        "oids": {
+            "sysUpTime": ".1.3.6.1.2.1.1.3.0",
+            "load1": ".1.3.6.1.4.1.2021.10.1.3.1",
+            "load5": ".1.3.6.1.4.1.2021.10.1.3.2",
+            "load15": ".1.3.6.1.4.1.2021.10.1.3.3",
+            "cpuUser": ".1.3.6.1.4.1.2021.11.9.0",
+            "cpuSystem": ".1.3.6.1.4.1.2021.11.10.0",
+            "cpuIdle": ".1.3.6.1.4.1.2021.11.11.0",
+            "memTotal": ".1.3.6.1.4.1.2021.4.5.0",
+            "memUsed": ".1.3.6.1.4.1.2021.4.6.0",
+            "memFree": ".1.3.6.1.4.1.2021.4.11.0",
+            "swapTotal": ".1.3.6.1.4.1.2021.4.3.0",
+            "swapAvail": ".1.3.6.1.4.1.2021.4.4.0"
+        }
+    },
+    "R1": {
+        "type": "cisco",
+        "ip": "1.0.0.4",
+        "community": "public",
+        "oids": {
+            "sysUpTime": ".1.3.6.1.2.1.1.3.0",
+            "load1": ".1.3.6.1.4.1.9.9.109.1.1.1.1.6.1",
+            "load5": ".1.3.6.1.4.1.9.9.109.1.1.1.1.7.1",
+            "load15": ".1.3.6.1.4.1.9.9.109.1.1.1.1.8.1",
+            "memPoolUsed": ".1.3.6.1.4.1.9.9.48.1.1.1.5.1",
+            "memPoolFree": ".1.3.6.1.4.1.9.9.48.1.1.1.6.1"
+        }
+    }
+}
+
+POLLING_INTERVAL = 5
+SNMP_PORT = 161
+COUNTER64_MODULO = 2 ** 64
+COUNTER32_MODULO = 2 ** 32
+SNMP_TIMEOUT = 2
+SNMP_RETRIES = 1
+# Varbinds per GET PDU; chunks that still come back tooBig are split in half
+MAX_OIDS_PER_PDU = 24
+
+# Interface tables: ifIndex -> ifName is discovered once per device and
+# refreshed every IF_DISCOVERY_INTERVAL seconds (or after a reboot / an
+# unknown ifIndex); the counter columns of every interface are then read
+# with GETBULK walks of at most MAX_BULK_VARBINDS varbinds per response
+IF_TABLE_WALK = True
+IF_DISCOVERY_INTERVAL = 3600
+MAX_BULK_VARBINDS = 120
+# Safety stop for a walk against a misbehaving agent
+MAX_WALK_PDUS = 200
+IF_NAME_COLUMNS = {
+    "ifName": "1.3.6.1.2.1.31.1.1.1.1",
+    "ifDescr": "1.3.6.1.2.1.2.2.1.2",
+}
+IF_COUNTER_COLUMNS = {
+    "ifHCInOctets": "1.3.6.1.2.1.31.1.1.1.6",
+    "ifHCOutOctets": "1.3.6.1.2.1.31.1.1.1.10",
+    "ifInErrors": "1.3.6.1.2.1.2.2.1.14",
+    "ifOutErrors": "1.3.6.1.2.1.2.2.1.20",
+    "ifInDiscards": "1.3.6.1.2.1.2.2.1.13",
+    "ifOutDiscards": "1.3.6.1.2.1.2.2.1.19",
+    "ifAdminStatus": "1.3.6.1.2.1.2.2.1.7",
+    "ifOperStatus": "1.3.6.1.2.1.2.2.1.8",
+}
+# Counter32 columns -> per-interface metric (per-second rates)
+IF_ERROR_METRICS = {
+    "ifInErrors": "in_errors",
+    "ifOutErrors": "out_errors",
+    "ifInDiscards": "in_discards",
+    "ifOutDiscards": "out_discards",
+}
+IF_OPER_UP = "1"
+# Key of the receive time (time.monotonic()) in the rows of interface tables
+RECEIVED = "_received"
+# device name -> {"names": {ifIndex: ifName} (after the "interfaces" filter),
+#                 "indexes": every discovered ifIndex, "discovered": monotonic
+#                 time, "seen_up": set of ifIndex}
+interface_cache = {}
+
+# asyncio mode: how many devices may be in flight at once, and how long a
+# single device may take before its whole poll is abandoned for this cycle
+MAX_CONCURRENCY = 200
+DEVICE_TIMEOUT = 8
+
+# "csv", or "parquet" / "arrow" for a columnar dataset (see columnar_sink.py)
+STORAGE = "csv"
+
+# Online detector scoring every polled sample ("ewma", "zscore",
+# "holtwinters", "changepoint", see online_detectors.py), on top of the fixed
+# thresholds; None keeps the thresholds only
+DETECTOR = None
+detectors = None
+
+# Self-telemetry (self_metrics.py): Prometheus endpoint port, JSON lines
+# stats file and folded-stacks profile file; None disables each
+METRICS_PORT = None
+STATS_FILE = None
+PROFILE_FILE = None
+poller_metrics = Metrics("snmp_poller")
+
+# Live store (live_store.py): recent samples kept in memory and served as
+# JSON on 127.0.0.1:LIVE_PORT and/or the Unix socket LIVE_SOCKET; None
+# disables each
+LIVE_PORT = None
+LIVE_SOCKET = None
+
+fieldnames = ["timestamp", "source", "record_type", "metric", "value", "label",
+              "message"]
+
+def get_transport_target(target):
+    transport = transport_targets.get(target)
+    if transport is None:
+        transport = UdpTransportTarget((target, SNMP_PORT), timeout=SNMP_TIMEOUT,
+                                       retries=SNMP_RETRIES)
+        transport_targets[target] = transport
+    return transport
+
+def load_async_hlapi():
+    global async_hlapi
+    if async_hlapi is None:
+        try:
+            import pysnmp.hlapi.asyncio as hlapi_asyncio
+        except (ImportError, AttributeError) as e:
+            raise RuntimeError("--async needs a pysnmp whose asyncio API runs on this "
+                               f"Python (pysnmp-lextudio, see requirements.txt): {e}")
+        async_hlapi = hlapi_asyncio
+    return async_hlapi
+
+def get_async_transport_target(target):
+    transport = async_transport_targets.get(target)
+    if transport is None:
+        transport = async_hlapi.UdpTransportTarget((target, SNMP_PORT),
+                                                   timeout=SNMP_TIMEOUT, retries=SNMP_RETRIES)
+        async_transport_targets[target] = transport
+    return transport
+
+def count_snmp_error(target, errorIndication, errorStatus):
+    if errorIndication:
+        kind = "timeout" if "timeout" in str(errorIndication).lower() else "transport"
+        poller_metrics.inc("snmp_errors_total", device=target, error=kind)
+    elif errorStatus:
+        poller_metrics.inc("snmp_errors_total", device=target, error=errorStatus.prettyPrint())
+
+def decode_var_binds(oids, errorIndication, errorStatus, varBinds):
+    if errorIndication or errorStatus:
+        return [None] * len(oids)
+    values = []
+    for name, val in varBinds:
+        if isinstance(val, (NoSuchObject, NoSuchInstance, EndOfMibView)):
+            values.append(None)
+        else:
+            values.append(val.prettyPrint())
+    return values
+
+def is_too_big(errorStatus):
+    return errorStatus and errorStatus.prettyPrint() == "tooBig"
+
+def snmp_get_chunk(target, community, oids):
     errorIndication, errorStatus, errorIndex, varBinds = next(
         getCmd(
-            SnmpEngine(),
+            snmpEngine,
             CommunityData(community, mpModel=1),  # SNMPv2c
-            UdpTransportTarget((target, 161), timeout=2, retries=1),
+            get_transport_target(target),
             ContextData(),
-            ObjectType(ObjectIdentity(oid))
+            *[ObjectType(ObjectIdentity(oid)) for oid in oids],
+            lookupMib=False
         )
     )
-    if errorIndication or errorStatus:
-        return None
-    for varBind in varBinds:
-        return varBind[1].prettyPrint()
-    return None
+    if is_too_big(errorStatus) and len(oids) > 1:
+        half = len(oids) // 2
+        poller_metrics.inc("pdu_splits_total")
+        return (snmp_get_chunk(target, community, oids[:half]) +
+                snmp_get_chunk(target, community, oids[half:]))
+    count_snmp_error(target, errorIndication, errorStatus)
+    return decode_var_binds(oids, errorIndication, errorStatus, varBinds)
+
+async def async_snmp_get_chunk(target, community, oids):
+    errorIndication, errorStatus, errorIndex, varBinds = await async_hlapi.getCmd(
+        snmpEngine,
+        CommunityData(community, mpModel=1),  # SNMPv2c
+        get_async_transport_target(target),
+        ContextData(),
+        *[ObjectType(ObjectIdentity(oid)) for oid in oids],
+        lookupMib=False
+    )
+    if is_too_big(errorStatus) and len(oids) > 1:
+        half = len(oids) // 2
+        poller_metrics.inc("pdu_splits_total")
+        first, second = await asyncio.gather(
+            async_snmp_get_chunk(target, community, oids[:half]),
+            async_snmp_get_chunk(target, community, oids[half:])
+        )
+        return first + second
+    count_snmp_error(target, errorIndication, errorStatus)
+    return decode_var_binds(oids, errorIndication, errorStatus, varBinds)
+
+def oid_chunks(oids):
+    oids = list(oids)
+    for start in range(0, len(oids), MAX_OIDS_PER_PDU):
+        yield oids[start:start + MAX_OIDS_PER_PDU]
+
+def snmp_get_many(target, community, oids, times=None):
+    # {oid: value string or None}, one multi-varbind GET per chunk of OIDs;
+    # times, if given, gets the monotonic receive time of each OID
+    values = {}
+    for chunk in oid_chunks(oids):
+        values.update(zip(chunk, snmp_get_chunk(target, community, chunk)))
+        if times is not None:
+            times.update(dict.fromkeys(chunk, time.monotonic()))
+    return values
+
+async def async_snmp_get_many(target, community, oids, times=None):
+    async def timed_chunk(chunk):
+        chunk_values = await async_snmp_get_chunk(target, community, chunk)
+        return chunk_values, time.monotonic()
+
+    chunks = list(oid_chunks(oids))
+    results = await asyncio.gather(*(timed_chunk(chunk) for chunk in chunks))
+    values = {}
+    for chunk, (chunk_values, received) in zip(chunks, results):
+        values.update(zip(chunk, chunk_values))
+        if times is not None:
+            times.update(dict.fromkeys(chunk, received))
+    return values
+
+def snmp_poll(target, community, oid):
+    return snmp_get_many(target, community, [oid])[oid]
+
+class TableWalk:
+    # State of a GETBULK walk over several columns of one table: request()
+    # gives the OIDs to ask next, absorb() files the rows of a response by
+    # instance index and drops the columns that walked past their end. Each
+    # row also keeps the monotonic time its first response was received
+    # (RECEIVED), the sample time of its counters.
+
+    def __init__(self, columns, max_repetitions):
+        # columns: {name: column OID}
+        self.columns = {name: oid.strip(".") for name, oid in columns.items()}
+        self.next_oids = dict(self.columns)
+        self.table = {}
+        self.max_repetitions = max_repetitions
+        self.pdus = 0
+
+    def request(self):
+        return list(self.next_oids.values())
+
+    def done(self):
+        return not self.next_oids or self.pdus >= MAX_WALK_PDUS
+
+    def absorb(self, rows, received=None):
+        self.pdus += 1
+        if received is None:
+            received = time.monotonic()
+        names = list(self.next_oids)
+        progressed = set()
+        for row in rows:
+            for name, (oid, val) in zip(names, row):
+                if name not in self.next_oids:
+                    continue
+                oid = str(oid)
+                prefix = self.columns[name] + "."
+                if isinstance(val, (EndOfMibView, NoSuchObject, NoSuchInstance)) \
+                        or not oid.startswith(prefix) or oid == self.next_oids[name]:
+                    del self.next_oids[name]
+                    continue
+                index = oid[len(prefix):]
+                self.table.setdefault(int(index) if index.isdigit() else index,
+                                      {RECEIVED: received})[name] = val.prettyPrint()
+                self.next_oids[name] = oid
+                progressed.add(name)
+        for name in list(self.next_oids):
+            # no row for this column at all: nothing more to expect from it
+            if name not in progressed:
+                del self.next_oids[name]
+
+    def too_big(self):
+        # -> False when the request cannot be made any smaller
+        if self.max_repetitions <= 1:
+            return False
+        self.max_repetitions //= 2
+        poller_metrics.inc("pdu_splits_total")
+        return True
+
+def bulk_repetitions(columns, rows):
+    # enough repetitions to cover the expected rows in few PDUs, within the
+    # response size budget
+    per_pdu = max(1, MAX_BULK_VARBINDS // max(len(columns), 1))
+    return max(1, min(per_pdu, rows + 1))
+
+def snmp_walk(target, community, columns, expected_rows=32):
+    # {index: {column name: value string}} of the given table columns
+    walk = TableWalk(columns, bulk_repetitions(columns, expected_rows))
+    while not walk.done():
+        rows = []
+        error = None
+        for errorIndication, errorStatus, errorIndex, varBinds in bulkCmd(
+                snmpEngine,
+                CommunityData(community, mpModel=1),  # SNMPv2c
+                get_transport_target(target),
+                ContextData(),
+                0, walk.max_repetitions,
+                *[ObjectType(ObjectIdentity(oid)) for oid in walk.request()],
+                lookupMib=False, lexicographicMode=True, maxCalls=1):
+            received = time.monotonic()
+            if errorIndication or errorStatus:
+                error = (errorIndication, errorStatus)
+                break
+            rows.append(varBinds)
+        if error is not None:
+            if is_too_big(error[1]) and walk.too_big():
+                continue
+            count_snmp_error(target, *error)
+            break
+        walk.absorb(rows, received)
+    return walk.table
+
+async def async_snmp_walk(target, community, columns, expected_rows=32):
+    walk = TableWalk(columns, bulk_repetitions(columns, expected_rows))
+    while not walk.done():
+        errorIndication, errorStatus, errorIndex, varBindTable = await async_hlapi.bulkCmd(
+            snmpEngine,
+            CommunityData(community, mpModel=1),  # SNMPv2c
+            get_async_transport_target(target),
+            ContextData(),
+            0, walk.max_repetitions,
+            *[ObjectType(ObjectIdentity(oid)) for oid in walk.request()],
+            lookupMib=False
+        )
+        received = time.monotonic()
+        if errorIndication or errorStatus:
+            if is_too_big(errorStatus) and walk.too_big():
+                continue
+            count_snmp_error(target, errorIndication, errorStatus)
+            break
+        walk.absorb(varBindTable, received)
+    return walk.table
+
+def has_interface_counters(device):
+    return device.get("if_table", IF_TABLE_WALK)
+
+def job_request_oids(device, job):
+    oids = [device["oids"][metric] for metric in job["metrics"]]
+    if job["counters"]:
+        # sysUpTime travels with the counters so reboots can be detected
+        if "sysUpTime" in device.get("oids", {}):
+            oids.append(device["oids"]["sysUpTime"])
+    # the same OID may be listed under several metrics, request it once
+    return list(dict.fromkeys(oids))
+
+def interface_names(table):
+    # {ifIndex: ifName} from a discovery walk, ifDescr when ifName is empty
+    return {index: row.get("ifName") or row.get("ifDescr") or str(index)
+            for index, row in table.items()}
+
+def needs_discovery(device_name, uptime=None):
+    cache = interface_cache.get(device_name)
+    if cache is None or time.monotonic() - cache["discovered"] >= IF_DISCOVERY_INTERVAL:
+        return True
+    # a reboot may renumber the interfaces
+    return uptime is not None and cache.get("uptime") is not None and uptime < cache["uptime"]
 
-def get_interface_counters_snmp(ip, community, if_index):
+def store_discovery(device_name, device, table):
+    names = interface_names(table)
+    wanted = device.get("interfaces")
+    if wanted:
+        names = {index: name for index, name in names.items() if name in wanted}
+    previous = interface_cache.get(device_name, {})
+    # an empty walk (agent down) is retried at the next cycle
+    discovered = time.monotonic() if table else float("-inf")
+    interface_cache[device_name] = {"names": names, "indexes": set(table),
+                                    "discovered": discovered,
+                                    "seen_up": previous.get("seen_up", set()) & set(names),
+                                    "uptime": previous.get("uptime")}
+    poller_metrics.inc("interface_discoveries_total")
+
+def discover_interfaces(device_name, device, uptime=None):
+    if needs_discovery(device_name, uptime):
+        store_discovery(device_name, device,
+                        snmp_walk(device["ip"], device["community"], IF_NAME_COLUMNS))
+    return interface_cache[device_name]["names"]
+
+async def async_discover_interfaces(device_name, device, uptime=None):
+    if needs_discovery(device_name, uptime):
+        store_discovery(device_name, device,
+                        await async_snmp_walk(device["ip"], device["community"], IF_NAME_COLUMNS))
+    return interface_cache[device_name]["names"]
+
+def device_uptime(device, oid_values):
+    uptime_str = oid_values.get(device.get("oids", {}).get("sysUpTime"))
     try:
-        in_oid = f"1.3.6.1.2.1.31.1.1.1.6.{if_index}"
-        out_oid = f"1.3.6.1.2.1.31.1.1.1.10.{if_index}"
-        rx_bytes = int(snmp_poll(ip, community, in_oid))
-        tx_bytes = int(snmp_poll(ip, community, out_oid))
-        return rx_bytes, tx_bytes
-    except Exception as e:
-        print(f"SNMP error on {ip}: {e}")
-        return None, None
+        return int(uptime_str) if uptime_str is not None else None
+    except ValueError:
+        return None
+
+def interface_counter_oids(names):
+    # {instance OID: (ifIndex, column)} of the counter columns of some interfaces
+    return {f"{oid.strip('.')}.{index}": (index, column)
+            for index in names for column, oid in IF_COUNTER_COLUMNS.items()}
+
+def counter_table(oids, values, times):
+    # GET results in the {ifIndex: {column: value}} shape of a walk
+    table = {}
+    for oid, (index, column) in oids.items():
+        if values.get(oid) is not None:
+            table.setdefault(index, {RECEIVED: times[oid]})[column] = values[oid]
+    return table
+
+def check_new_interfaces(device_name, table):
+    cache = interface_cache[device_name]
+    if set(table) - cache["indexes"]:
+        # interfaces added since the last discovery
+        cache["discovered"] = float("-inf")
+
+def poll_interfaces(device_name, device, uptime):
+    names = discover_interfaces(device_name, device, uptime)
+    if device.get("interfaces"):
+        # only the wanted interfaces: a GET of their columns instead of a walk
+        oids = interface_counter_oids(names)
+        times = {}
+        values = snmp_get_many(device["ip"], device["community"], oids, times)
+        return counter_table(oids, values, times)
+    table = snmp_walk(device["ip"], device["community"], IF_COUNTER_COLUMNS, len(names))
+    check_new_interfaces(device_name, table)
+    return table
+
+async def async_poll_interfaces(device_name, device, uptime):
+    names = await async_discover_interfaces(device_name, device, uptime)
+    if device.get("interfaces"):
+        oids = interface_counter_oids(names)
+        times = {}
+        values = await async_snmp_get_many(device["ip"], device["community"], oids, times)
+        return counter_table(oids, values, times)
+    table = await async_snmp_walk(device["ip"], device["community"], IF_COUNTER_COLUMNS,
+                                  len(names))
+    check_new_interfaces(device_name, table)
+    return table
+
+def interface_rows(device_name, device, table, sample_time, uptime, timestamp):
+    # Per-interface rows ("<metric>:<ifName>") and, for snmp_if_index, the
+    # device-level rx_rate / tx_rate. Rates use the time each row's response
+    # was received, sample_time only for rows without one.
+    cache = interface_cache.get(device_name)
+    if cache is None:
+        return [], None
+    rows = []
+    rates = None
+
+    def row(metric, value, label="", message=""):
+        rows.append({"timestamp": timestamp, "source": device_name,
+                     "record_type": "SNMP_POLL", "metric": metric, "value": value,
+                     "label": label, "message": message})
+
+    for index, name in cache["names"].items():
+        values = table.get(index)
+        if not values:
+            continue
+        received = values.get(RECEIVED, sample_time)
+        try:
+            rx = int(values["ifHCInOctets"])
+            tx = int(values["ifHCOutOctets"])
+        except (KeyError, ValueError):
+            rx = tx = None
+        if rx is not None:
+            rate_rx = counter_rate((device_name, name, "rx"), rx, received, uptime)
+            rate_tx = counter_rate((device_name, name, "tx"), tx, received, uptime)
+            row(f"in_rate:{name}", rate_rx, "HIGH_RX" if rate_rx > 1e6 else "")
+            row(f"out_rate:{name}", rate_tx, "HIGH_TX" if rate_tx > 1e6 else "")
+            if index == device.get("snmp_if_index"):
+                rates = (rate_rx, rate_tx)
+        for column, metric in IF_ERROR_METRICS.items():
+            if values.get(column, "").isdigit():
+                row(f"{metric}:{name}",
+                    counter_rate((device_name, name, column), int(values[column]),
+                                 received, uptime, COUNTER32_MODULO))
+        oper = values.get("ifOperStatus")
+        if oper is not None:
+            label = message = ""
+            if oper == IF_OPER_UP:
+                cache["seen_up"].add(index)
+            elif index in cache["seen_up"]:
+                # only interfaces that have been up count as down, not unused ports
+                label = "LINK_DOWN"
+                message = (f"{name} oper status {oper}, "
+                           f"admin status {values.get('ifAdminStatus', '?')}")
+            row(f"oper_status:{name}", oper, label, message)
+    cache["uptime"] = uptime
+    return rows, rates
+
+def counter_rate(key, value, sample_time, uptime=None, modulo=COUNTER64_MODULO):
+    # Per-second rate of a counter between two measured sample times.
+    # A counter that went backwards wrapped at `modulo`, unless sysUpTime went
+    # backwards too, in which case the device rebooted and the counter
+    # restarted from zero; both the first sample and a reboot report 0.
+    previous = previous_snmp_values.get(key)
+    previous_snmp_values[key] = (value, sample_time, uptime)
+    if previous is None:
+        return 0.0
+    prev_value, prev_time, prev_uptime = previous
+    if uptime is not None and prev_uptime is not None and uptime < prev_uptime:
+        return 0.0
+    elapsed = sample_time - prev_time
+    if elapsed <= 0:
+        return 0.0
+    delta = value - prev_value
+    if delta < 0:
+        delta += modulo
+    return delta / elapsed
 
 def safe_float(val_str, default=0.0):
     if not val_str:
@@ -43,210 +572,351 @@ def safe_float(val_str, default=0.0):
         print(f"Could not convert '{val_str}' to float, defaulting to {default}")
         return default
 
-def poll_metrics():
-    devices = {
-        "VM1": {
-            "type": "linux",
-            "ip": "1.0.0.2",
-            "community": "public",
-            "snmp_if_index": 3,
-            "oids": {
-                "sysUpTime": ".1.3.6.1.2.1.1.3.0",
-                "load1": ".1.3.6.1.4.1.2021.10.1.3.1",
-                "load5": ".1.3.6.1.4.1.2021.10.1.3.2",
-                "load15": ".1.3.6.1.4.1.2021.10.1.3.3",
-                "cpuUser": ".1.3.6.1.4.1.2021.11.9.0",
-                "cpuSystem": ".1.3.6.1.4.1.2021.11.10.0",
-                "cpuIdle": ".1.3.6.1.4.1.2021.11.11.0",
-                "memTotal": ".1.3.6.1.4.1.2021.4.5.0",
-                "memUsed": ".1.3.6.1.4.1.2021.4.6.0",
-                "memFree": ".1.3.6.1.4.1.2021.4.11.0",
-                "swapTotal": ".1.3.6.1.4.1.2021.4.3.0",
-                "swapAvail": ".1.3.6.1.4.1.2021.4.4.0"
-            }
-        },
-        "VM2": {
-            "type": "linux",
-            "ip": "1.0.0.3",
-            "community": "public",
-            "snmp_if_index": 3,
-            "oids": {
-                "sysUpTime": ".1.3.6.1.2.1.1.3.0",
-                "load1": ".1.3.6.1.4.1.2021.10.1.3.1",
-                "load5": ".1.3.6.1.4.1.2021.10.1.3.2",
-                "load15": ".1.3.6.1.4.1.2021.10.1.3.3",
-                "cpuUser": ".1.3.6.1.4.1.2021.11.9.0",
-                "cpuSystem": ".1.3.6.1.4.1.2021.11.10.0",
-                "cpuIdle": ".1.3.6.1.4.1.2021.11.11.0",
-                "memTotal": ".1.3.6.1.4.1.2021.4.5.0",
-                "memUsed": ".1.3.6.1.4.1.2021.4.6.0",
-                "memFree": ".1.3.6.1.4.1.2021.4.11.0",
-                "swapTotal": ".1.3.6.1.4.1.2021.4.3.0",
-                "swapAvail": ".1.3.6.1.4.1.2021.4.4.0"
-            }
-        },
-        "R1": {
-            "type": "cisco",
-            "ip": "1.0.0.4",
-            "community": "public",
-            "oids": {
-                "sysUpTime": ".1.3.6.1.2.1.1.3.0",
-                "load1": ".1.3.6.1.4.1.9.9.109.1.1.1.1.6.1",
-                "load5": ".1.3.6.1.4.1.9.9.109.1.1.1.1.7.1",
-                "load15": ".1.3.6.1.4.1.9.9.109.1.1.1.1.8.1",
-                "memPoolUsed": ".1.3.6.1.4.1.9.9.48.1.1.1.5.1",
-                "memPoolFree": ".1.3.6.1.4.1.9.9.48.1.1.1.6.1"
-            }
-        }
-    }
+def build_device_rows(device_name, device, values, rates, timestamp, metrics=None):
+    # values: {metric: raw value string or None}, rates: (rx, tx) or None
+    rows = []
+    record_type = "SNMP_POLL"
+    oids = device.get("oids", {})
+    if metrics is None:
+        metrics = list(oids)
 
-    polling_interval = 5
-    fieldnames = ["timestamp", "source", "record_type", "metric", "value", "label",
-                  "message"]
+    for metric in metrics:
+        oid = oids[metric]
+        label = ""
+        message = ""
+        raw_value_str = values.get(metric)
 
-    with open("snmp_poll.csv", "a", newline="") as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        csvfile.seek(0, 2)
-        if csvfile.tell() == 0:
-            writer.writeheader()
+        if raw_value_str is None:
+            rows.append({
+                "timestamp": timestamp,
+                "source": device_name,
+                "record_type": record_type,
+                "metric": metric,
+                "value": "",
+                "label": "",
+                "message": f"SNMP polling returned None for {oid}"
+            })
+            continue
 
-        print("Starting SNMP polling (snmp_poll.csv)...")
-        while True:
-            timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-            for device_name, device in devices.items():
-                record_type = "SNMP_POLL"
-                ip = device["ip"]
-                community = device["community"]
-
-                for metric, oid in device.get("oids", {}).items():
-                    label = ""
-                    message = ""
-                    raw_value_str = snmp_poll(ip, community, oid)
-
-                    if raw_value_str is None:
-                        row = {
-                            "timestamp": timestamp,
-                            "source": device_name,
-                            "record_type": record_type,
-                            "metric": metric,
-                            "value": "",
-                            "label": "",
-                            "message": f"SNMP polling returned None for {oid}"
-                        }
-                        writer.writerow(row)
-                        csvfile.flush()
-                        continue
-
-                    float_val = float(raw_value_str)
-
-                    if metric in ["load1", "load5", "load15"]:
-                        if float_val > 80:
-                            label = "CPU_OVERLOAD"
-                            message = f"{metric} usage > 80% (value={float_val})"
-
-                    if device["type"] == "linux":
-                        if metric == "cpuIdle":
-                            cpu_usage = 100 - safe_float(raw_value_str, 0.0)
-                            if cpu_usage > 80:
-                                label = "CPU_OVERLOAD"
-                                message = "CPU usage > 80%"
-                            writer.writerow({
-                                "timestamp": timestamp,
-                                "source": device_name,
-                                "record_type": record_type,
-                                "metric": "cpuUsage",
-                                "value": cpu_usage,
-                                "label": label,
-                                "message": message
-                            })
-                            csvfile.flush()
-                        if metric == "cpuUser":
-                            cpu_usage = safe_float(raw_value_str, 0.0)
-                            if cpu_usage > 80:
-                                label = "CPU_OVERLOAD"
-                                message = "CPU usage > 80%"
-                            writer.writerow({
-                                "timestamp": timestamp,
-                                "source": device_name,
-                                "record_type": record_type,
-                                "metric": "cpuUsage",
-                                "value": cpu_usage,
-                                "label": label,
-                                "message": message
-                            })
-                            csvfile.flush()
-                        if metric == "memUsed":
-                            memTotal_val_str = snmp_poll(ip, community,
-                                                         device["oids"].get("memTotal"))
-                            memTotal_float = safe_float(memTotal_val_str, 0.0)
-                            if memTotal_float > 0:
-                                mem_usage = (float_val / memTotal_float) * 100
-                                if mem_usage > 90:
-                                    label = "MEM_OVERLOAD"
-                                    message = f"Memory usage > 90% ({mem_usage:.1f}%)"
-                                writer.writerow({
-                                    "timestamp": timestamp,
-                                    "source": device_name,
-                                    "record_type": record_type,
-                                    "metric": "memUsage",
-                                    "value": mem_usage,
-                                    "label": label,
-                                    "message": message
-                                })
-                                csvfile.flush()
-
-                    elif device["type"] == "cisco" and metric == "cpu5sec":
-                        if float_val > 80:
-                            label = "CPU_OVERLOAD"
-                            message = f"CPU > 80% (5sec avg: {float_val})"
-
-                    writer.writerow({
+        float_val = float(raw_value_str)
+
+        if metric in ["load1", "load5", "load15"]:
+            if float_val > 80:
+                label = "CPU_OVERLOAD"
+                message = f"{metric} usage > 80% (value={float_val})"
+
+        if device["type"] == "linux":
+            if metric == "cpuIdle":
+                cpu_usage = 100 - safe_float(raw_value_str, 0.0)
+                if cpu_usage > 80:
+                    label = "CPU_OVERLOAD"
+                    message = "CPU usage > 80%"
+                rows.append({
+                    "timestamp": timestamp,
+                    "source": device_name,
+                    "record_type": record_type,
+                    "metric": "cpuUsage",
+                    "value": cpu_usage,
+                    "label": label,
+                    "message": message
+                })
+            if metric == "cpuUser":
+                # not "cpuUsage": that one is 100 - cpuIdle, and both would
+                # feed the same detector stream
+                cpu_usage = safe_float(raw_value_str, 0.0)
+                if cpu_usage > 80:
+                    label = "CPU_OVERLOAD"
+                    message = "CPU usage > 80%"
+                rows.append({
+                    "timestamp": timestamp,
+                    "source": device_name,
+                    "record_type": record_type,
+                    "metric": "cpuUserUsage",
+                    "value": cpu_usage,
+                    "label": label,
+                    "message": message
+                })
+            if metric == "memUsed":
+                memTotal_float = safe_float(values.get("memTotal"), 0.0)
+                if memTotal_float > 0:
+                    mem_usage = (float_val / memTotal_float) * 100
+                    if mem_usage > 90:
+                        label = "MEM_OVERLOAD"
+                        message = f"Memory usage > 90% ({mem_usage:.1f}%)"
+                    rows.append({
                         "timestamp": timestamp,
                         "source": device_name,
                         "record_type": record_type,
-                        "metric": metric,
-                        "value": str(float_val),
+                        "metric": "memUsage",
+                        "value": mem_usage,
                         "label": label,
                         "message": message
                     })
-                    csvfile.flush()
-
-                if device["type"] == "linux" and "snmp_if_index" in device:
-                    rx, tx = get_interface_counters_snmp(ip, community, device["snmp_if_index"])
-                    if rx is not None and tx is not None:
-                        rx_key = (device_name, "rx")
-                        tx_key = (device_name, "tx")
-
-                        rate_rx = (rx - 
-                                    previous_snmp_values.get(rx_key, rx)) / polling_interval
-                        rate_tx = (tx -
-                                    previous_snmp_values.get(tx_key, tx)) / polling_interval
-
-                        previous_snmp_values[rx_key] = rx
-                        previous_snmp_values[tx_key] = tx
-
-                        writer.writerow({
-                            "timestamp": timestamp,
-                            "source": device_name,
-                            "record_type": record_type,
-                            "metric": "rx_rate",
-                            "value": rate_rx,
-                            "label": "HIGH_RX" if rate_rx > 1e6 else "",
-                            "message": ""
-                        })
-                        writer.writerow({
-                            "timestamp": timestamp,
-                            "source": device_name,
-                            "record_type": record_type,
-                            "metric": "tx_rate",
-                            "value": rate_tx,
-                            "label": "HIGH_TX" if rate_tx > 1e6 else "",
-                            "message": ""
-                        })
-                        csvfile.flush()
-
-            time.sleep(polling_interval)
 
-if __name__ == "__main__":
-    poll_metrics()
+        elif device["type"] == "cisco" and metric == "cpu5sec":
+            if float_val > 80:
+                label = "CPU_OVERLOAD"
+                message = f"CPU > 80% (5sec avg: {float_val})"
+
+        rows.append({
+            "timestamp": timestamp,
+            "source": device_name,
+            "record_type": record_type,
+            "metric": metric,
+            "value": str(float_val),
+            "label": label,
+            "message": message
+        })
+
+    if rates is not None:
+        rate_rx, rate_tx = rates
+        rows.append({
+            "timestamp": timestamp,
+            "source": device_name,
+            "record_type": record_type,
+            "metric": "rx_rate",
+            "value": rate_rx,
+            "label": "HIGH_RX" if rate_rx > 1e6 else "",
+            "message": ""
+        })
+        rows.append({
+            "timestamp": timestamp,
+            "source": device_name,
+            "record_type": record_type,
+            "metric": "tx_rate",
+            "value": rate_tx,
+            "label": "HIGH_TX" if rate_tx > 1e6 else "",
+            "message": ""
+        })
+
+    return rows
+
+def build_poll_jobs(devices):
+    # One job per (device, interval): metrics without an entry in the
+    # device's "oid_intervals" share the device "interval" together with the
+    # interface counters, the others are grouped by their own interval.
+    jobs = []
+    for device_name, device in devices.items():
+        base_interval = device.get("interval", POLLING_INTERVAL)
+        oid_intervals = device.get("oid_intervals", {})
+        groups = {base_interval: []}
+        for metric in device.get("oids", {}):
+            groups.setdefault(oid_intervals.get(metric, base_interval), []).append(metric)
+        for interval, metrics in groups.items():
+            counters = interval == base_interval and has_interface_counters(device)
+            if not metrics and not counters:
+                continue
+            jobs.append({
+                "device": device_name,
+                "interval": interval,
+                "metrics": metrics,
+                "counters": counters
+            })
+    return jobs
 
+def job_rows(job, oid_values, sample_time, timestamp, if_table=None):
+    device_name = job["device"]
+    device = DEVICES[device_name]
+    oids = device.get("oids", {})
+
+    fresh = {metric: oid_values.get(oids[metric]) for metric in job["metrics"]}
+    # Metrics polled on a slower interval (e.g. memTotal) are still needed for
+    # derived values, so keep the last known value of every metric around
+    cached = last_values.setdefault(device_name, {})
+    cached.update((metric, value) for metric, value in fresh.items() if value is not None)
+    values = dict(cached)
+    values.update(fresh)
+
+    rates = None
+    if_rows = []
+    if if_table is not None:
+        if_rows, rates = interface_rows(device_name, device, if_table, sample_time,
+                                        device_uptime(device, oid_values), timestamp)
+
+    rows = build_device_rows(device_name, device, values, rates, timestamp,
+                             job["metrics"]) + if_rows
+    if detectors is not None:
+        detectors.label_rows(rows)
+    return rows
+
+def poll_job(job):
+    device = DEVICES[job["device"]]
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    if_table = None
+    with poller_metrics.timer("stage_seconds", stage="request"):
+        oid_values = snmp_get_many(device["ip"], device["community"],
+                                   job_request_oids(device, job))
+    if job["counters"]:
+        with poller_metrics.timer("stage_seconds", stage="walk"):
+            if_table = poll_interfaces(job["device"], device,
+                                       device_uptime(device, oid_values))
+    with poller_metrics.timer("stage_seconds", stage="label"):
+        return job_rows(job, oid_values, time.monotonic(), timestamp, if_table)
+
+async def async_poll_job(job):
+    device = DEVICES[job["device"]]
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    started = time.perf_counter()
+    if_table = None
+    oid_values = await async_snmp_get_many(device["ip"], device["community"],
+                                           job_request_oids(device, job))
+    poller_metrics.observe("stage_seconds", time.perf_counter() - started, stage="request")
+    if job["counters"]:
+        started = time.perf_counter()
+        if_table = await async_poll_interfaces(job["device"], device,
+                                               device_uptime(device, oid_values))
+        poller_metrics.observe("stage_seconds", time.perf_counter() - started, stage="walk")
+    with poller_metrics.timer("stage_seconds", stage="label"):
+        return job_rows(job, oid_values, time.monotonic(), timestamp, if_table)
+
+def missing_rows(job):
+    # None rows of a job whose poll did not complete
+    return build_device_rows(job["device"], DEVICES[job["device"]], {}, None,
+                             time.strftime("%Y-%m-%d %H:%M:%S"), job["metrics"])
+
+def report_lateness(job, deadline, scheduler):
+    lateness = time.monotonic() - deadline
+    poller_metrics.inc("polls_total")
+    poller_metrics.observe("poll_lateness_seconds", lateness)
+    if lateness > job["interval"]:
+        # the poll cycle overran a whole interval
+        poller_metrics.inc("poll_overruns_total", device=job["device"])
+        print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - Poll of {job['device']} "
+              f"{lateness:.2f}s late, {scheduler.skipped} slots skipped so far")
+
+def poll_metrics(jitter=DEFAULT_JITTER, storage=STORAGE, live=None):
+    scheduler = PollScheduler(build_poll_jobs(DEVICES), jitter=jitter)
+    sink = open_sink("snmp_poll", fieldnames, storage, metrics=poller_metrics, live=live)
+    poller_metrics.track("slots_skipped_total", lambda: scheduler.skipped, "counter")
+
+    print("Starting SNMP polling (snmp_poll.csv)...")
+    try:
+        while True:
+            for deadline, job in scheduler.pop_due():
+                report_lateness(job, deadline, scheduler)
+                try:
+                    rows = poll_job(job)
+                except Exception as e:
+                    # one bad device or value must not stop the polling of the others
+                    ip = DEVICES[job["device"]]["ip"]
+                    poller_metrics.inc("snmp_errors_total", device=ip, error="exception")
+                    print(f"SNMP poll of {ip} failed: {e!r}")
+                    rows = missing_rows(job)
+                with poller_metrics.timer("stage_seconds", stage="write"):
+                    sink.write_rows(rows)
+
+            time.sleep(scheduler.sleep_time())
+    finally:
+        sink.close()
+
+async def poll_metrics_async(max_concurrency=MAX_CONCURRENCY, device_timeout=DEVICE_TIMEOUT,
+                             jitter=DEFAULT_JITTER, storage=STORAGE, live=None):
+    load_async_hlapi()
+    scheduler = PollScheduler(build_poll_jobs(DEVICES), jitter=jitter)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    sink = open_sink("snmp_poll", fieldnames, storage, metrics=poller_metrics, live=live)
+    in_flight = {}
+    poller_metrics.track("slots_skipped_total", lambda: scheduler.skipped, "counter")
+    poller_metrics.track("polls_in_flight", lambda: len(in_flight))
+
+    async def run_job(job, deadline):
+        key = (job["device"], job["interval"])
+        try:
+            async with semaphore:
+                report_lateness(job, deadline, scheduler)
+                device = DEVICES[job["device"]]
+                try:
+                    rows = await asyncio.wait_for(async_poll_job(job),
+                                                  timeout=device_timeout)
+                except asyncio.TimeoutError:
+                    poller_metrics.inc("device_timeouts_total", device=job["device"])
+                    print(f"SNMP timeout on {device['ip']} after {device_timeout}s")
+                    rows = missing_rows(job)
+                except Exception as e:
+                    # a failed poll still writes its (empty) rows, never drops them
+                    poller_metrics.inc("snmp_errors_total", device=device["ip"], error="exception")
+                    print(f"SNMP poll of {device['ip']} failed: {e!r}")
+                    rows = missing_rows(job)
+            with poller_metrics.timer("stage_seconds", stage="write"):
+                sink.write_rows(rows)
+        finally:
+            in_flight.pop(key, None)
+
+    print(f"Starting asyncio SNMP polling (snmp_poll.csv), "
+          f"max {max_concurrency} devices in flight...")
+    try:
+        while True:
+            for deadline, job in scheduler.pop_due():
+                key = (job["device"], job["interval"])
+                if key in in_flight:
+                    # previous poll of this job has not returned yet
+                    scheduler.skipped += 1
+                    continue
+                in_flight[key] = asyncio.create_task(run_job(job, deadline))
+
+            await asyncio.sleep(scheduler.sleep_time())
+    finally:
+        sink.close()
+
+def main():
+    global detectors, SNMP_PORT
+    parser = argparse.ArgumentParser(description="SNMP poller (snmp_poll.csv)")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="poll all devices concurrently with asyncio")
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY,
+                        help="maximum number of devices polled at once")
+    parser.add_argument("--device-timeout", type=float, default=DEVICE_TIMEOUT,
+                        help="seconds before a device poll is abandoned")
+    parser.add_argument("--jitter", type=float, default=DEFAULT_JITTER,
+                        help="fraction of each interval used to spread first polls")
+    parser.add_argument("--storage", choices=["csv", "parquet", "arrow"], default=STORAGE,
+                        help="output format (parquet/arrow write snmp_poll/ partitions)")
+    parser.add_argument("--detector", choices=sorted(DETECTORS), default=DETECTOR,
+                        help="online anomaly detector applied to every sample")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="detector score above which a sample is labelled ANOMALY")
+    parser.add_argument("--devices", default=None,
+                        help="JSON file replacing the DEVICES dict (e.g. benchmark agent farm)")
+    parser.add_argument("--port", type=int, default=SNMP_PORT, help="agents' SNMP port")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="serve self-telemetry in Prometheus format on 127.0.0.1:PORT")
+    parser.add_argument("--stats-file", default=STATS_FILE,
+                        help=f"append self-telemetry as JSON lines every {STATS_INTERVAL}s")
+    parser.add_argument("--profile", dest="profile_file", default=PROFILE_FILE,
+                        help="sample all thread stacks and write folded stacks to this file")
+    parser.add_argument("--live-port", type=int, default=LIVE_PORT,
+                        help="keep recent samples in memory and serve them on 127.0.0.1:PORT")
+    parser.add_argument("--live-socket", default=LIVE_SOCKET,
+                        help="serve the live store on this Unix socket")
+    parser.add_argument("--live-hours", type=float, default=LIVE_HOURS,
+                        help="hours of samples kept per series by the live store")
+    args = parser.parse_args()
+
+    SNMP_PORT = args.port
+    if args.devices is not None:
+        with open(args.devices, encoding="utf-8") as f:
+            DEVICES.clear()
+            DEVICES.update(json.load(f))
+    if args.detector is not None:
+        detectors = DetectorBank(args.detector, args.threshold)
+
+    telemetry = SelfTelemetry(poller_metrics, args.metrics_port, args.stats_file,
+                              STATS_INTERVAL, args.profile_file).start()
+    # one sample per base interval of the fastest device
+    resolution = min((device.get("interval", POLLING_INTERVAL) for device in DEVICES.values()),
+                     default=POLLING_INTERVAL)
+    live, live_server = open_live(poller_metrics, args.live_port, args.live_socket,
+                                  args.live_hours, resolution, LIVE_MAX_SERIES)
+    try:
+        if args.use_async:
+            asyncio.run(poll_metrics_async(args.max_concurrency, args.device_timeout,
+                                           args.jitter, args.storage, live))
+        else:
+            poll_metrics(args.jitter, args.storage, live)
+    finally:
+        if live_server is not None:
+            live_server.stop()
+        telemetry.stop()
+
+if __name__ == "__main__":
+    main()
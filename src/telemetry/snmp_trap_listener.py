@@ -1,23 +1,72 @@
 #!/usr/bin/env python3
+import argparse
 from pysnmp.entity import engine, config
 from pysnmp.carrier.asyncore.dgram import udp
 from pysnmp.entity.rfc3413 import ntfrcv
-import csv
+import queue
+import sys
+import threading
 import time
 import logging
+from csv_sink import open_sink
+from trap_suppressor import TrapSuppressor, DEDUP_WINDOW, RATE_LIMIT
+from oid_names import OID_TRIE, oid_name
+from self_metrics import Metrics, SelfTelemetry, STATS_INTERVAL
+from live_store import open_live, LIVE_MAX_SERIES
 
 snmpEngine = engine.SnmpEngine()
 
 TRAP_ADDRESS = '0.0.0.0'
 TRAP_PORT = 162
 
-fieldnames = ["timestamp", "source", "record_type", "metric", "value", "label", "message"]
+# "csv", or "parquet" / "arrow" for a columnar dataset (see columnar_sink.py)
+STORAGE = "csv"
 
-csvfile = open("snmp_traps.csv", "a", newline="")
-writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-csvfile.seek(0, 2)
-if csvfile.tell() == 0:
-    writer.writeheader()
+# Traps waiting between the dispatcher and the processing thread; beyond
+# this the callback drops and counts them instead of stalling the dispatcher
+MAX_PENDING_TRAPS = 100000
+# Per (agent, trap OID) storm suppression, see trap_suppressor.py; a
+# RATE_LIMIT of None records every trap
+SUPPRESS_WINDOW = DEDUP_WINDOW
+SUPPRESS_RATE_LIMIT = RATE_LIMIT
+# Echo every recorded trap on stdout as well as in received_traps.log
+ECHO_TRAPS = False
+# Self-telemetry (self_metrics.py): Prometheus endpoint port, JSON lines
+# stats file and folded-stacks profile file; None disables each
+METRICS_PORT = None
+STATS_FILE = None
+PROFILE_FILE = None
+# Live store (live_store.py): numeric trap rows (storm summaries) kept in
+# memory and served as JSON on 127.0.0.1:LIVE_PORT and/or the Unix socket
+# LIVE_SOCKET; None disables each. Traps are sparse, LIVE_RESOLUTION only
+# sizes the ring buffers
+LIVE_PORT = None
+LIVE_SOCKET = None
+LIVE_HOURS = 6
+LIVE_RESOLUTION = 60
+
+fieldnames = ["timestamp", "source", "record_type", "metric", "value", "label", "message",
+              "agent", "trap_oid", "trap_name", "sys_uptime", "if_index", "if_name"]
+
+parser = argparse.ArgumentParser(description="SNMP trap listener (snmp_traps.csv)")
+parser.add_argument("--listen-ip", default=TRAP_ADDRESS)
+parser.add_argument("--port", type=int, default=TRAP_PORT,
+                    help="ports below 1024 need root (or CAP_NET_BIND_SERVICE)")
+parser.add_argument("--echo", action="store_true", default=ECHO_TRAPS,
+                    help="print every recorded trap on stdout")
+args = parser.parse_args()
+TRAP_ADDRESS, TRAP_PORT, ECHO_TRAPS = args.listen_ip, args.port, args.echo
+
+metrics = Metrics("snmp_traps")
+live, live_server = open_live(metrics, LIVE_PORT, LIVE_SOCKET, LIVE_HOURS, LIVE_RESOLUTION,
+                              LIVE_MAX_SERIES)
+sink = open_sink("snmp_traps", fieldnames, STORAGE, metrics=metrics, live=live)
+trap_queue = queue.Queue(maxsize=MAX_PENDING_TRAPS)
+dropped_traps = 0
+metrics.track("queue_depth", trap_queue.qsize)
+metrics.track("dropped_total", lambda: dropped_traps, "counter")
+telemetry = SelfTelemetry(metrics, METRICS_PORT, STATS_FILE, STATS_INTERVAL,
+                          PROFILE_FILE).start()
 
 logging.basicConfig(filename='received_traps.log',
                     filemode='a',
@@ -35,51 +84,178 @@ config.addTransport(
 config.addV1System(snmpEngine, 'my-area', 'public')
 
 def trap_callback(snmpEngine, stateReference, contextEngineId, contextName, varBinds, cbCtx):
-    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-    source = "UNKNOWN"  
-    record_type = "SNMP_TRAP"
+    # Runs in the dispatcher: only hand the raw varbinds over, with the
+    # sender address in case the trap carries no snmpTrapAddress
+    global dropped_traps
+    transportDomain, transportAddress = snmpEngine.msgAndPduDsp.getTransportInfo(stateReference)
+    try:
+        trap_queue.put_nowait((time.time(), transportAddress[0], varBinds))
+    except queue.Full:
+        dropped_traps += 1
+
+def summary_row(agent, trap_oid, duplicates, suppressed, window_start):
+    return {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(window_start)),
+        "source": agent,
+        "record_type": "SNMP_TRAP",
+        "metric": "trap_storm",
+        "value": duplicates + suppressed,
+        "label": "",
+        "message": (f"{duplicates} duplicate and {suppressed} rate-limited traps "
+                    f"suppressed within {SUPPRESS_WINDOW}s"),
+        "agent": agent,
+        "trap_oid": trap_oid,
+        "trap_name": oid_name(trap_oid) if trap_oid else ""
+    }
+
+IF_TABLE_COLUMNS = ("ifDescr", "ifType", "ifAdminStatus", "ifOperStatus", "ifName",
+                    "locIfReason")
+
+def decode_trap(varBinds, sender):
+    # Typed trap fields, resolved through the precompiled OID trie; the
+    # payload (every varbind but sysUpTime) is what deduplication compares
+    fields = {"agent": sender, "trap_oid": "", "trap_name": "", "sys_uptime": "",
+              "if_index": "", "if_name": ""}
     lines = []
+    payload = []
     for name, val in varBinds:
-        lines.append(f"{name.prettyPrint()} = {val.prettyPrint()}")
-    message_str = " | ".join(lines)
+        text = val.prettyPrint()
+        lines.append(f"{name.prettyPrint()} = {text}")
+        column, index = OID_TRIE.lookup(name.asTuple())
+        if column == "sysUpTime":
+            if fields["sys_uptime"] == "":
+                fields["sys_uptime"] = int(val)
+            continue
+        payload.append((name.asTuple(), text))
+        if column == "snmpTrapOID":
+            fields["trap_oid"] = text
+            fields["trap_name"] = oid_name(val.asTuple()) or ""
+        elif column == "snmpTrapAddress":
+            fields["agent"] = text
+        elif column == "ifIndex":
+            fields["if_index"] = int(val)
+        elif column == "ifName" or (column == "ifDescr" and not fields["if_name"]):
+            fields["if_name"] = text
+        if column in IF_TABLE_COLUMNS and index and fields["if_index"] == "":
+            # the instance index of any ifTable column is the ifIndex
+            fields["if_index"] = index[0]
+    return fields, lines, tuple(payload)
 
+def trap_row(received, fields, lines):
     row = {
-        "timestamp": timestamp,
-        "source": source,
-        "record_type": record_type,
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(received)),
+        "source": fields["agent"],
+        "record_type": "SNMP_TRAP",
         "metric": "trap",
         "value": "",
         "label": "",
-        "message": message_str
+        "message": " | ".join(lines)
     }
-    writer.writerow(row)
-    csvfile.flush()
+    row.update(fields)
+    return row
 
-    logging.info("Received new Trap message")
-    for name, val in varBinds:
-        logging.info('%s = %s' % (name.prettyPrint(), val.prettyPrint()))
-    logging.info("==== End of Trap ====")
+def log_trap(lines):
+    logging.info("Received new Trap message: %s", " | ".join(lines))
+    if ECHO_TRAPS:
+        print("Received new Trap message")
+        print("\n".join(lines))
+        print("---- End of Trap ----")
 
-    print("Received new Trap message")
-    for name, val in varBinds:
-        print(f"{name.prettyPrint()} = {val.prettyPrint()}")
-    print("---- End of Trap ----")
+def process_traps():
+    suppressor = None
+    if SUPPRESS_RATE_LIMIT is not None:
+        suppressor = TrapSuppressor(SUPPRESS_WINDOW, SUPPRESS_RATE_LIMIT)
+    reported_drops = 0
+    next_expire = time.monotonic() + 1
+
+    while True:
+        try:
+            item = trap_queue.get(timeout=1)
+        except queue.Empty:
+            item = ()
+        if item is None:
+            break
+
+        rows = []
+        if item:
+            received, sender, varBinds = item
+            metrics.inc("received_total")
+            metrics.observe("stage_seconds", max(time.time() - received, 0.0), stage="queue")
+            try:
+                with metrics.timer("stage_seconds", stage="decode"):
+                    fields, lines, payload = decode_trap(varBinds, sender)
+                    row = trap_row(received, fields, lines)
+            except Exception as e:
+                metrics.inc("decode_errors_total", agent=sender)
+                print(f"Failed to decode trap from {sender}: {e}")
+                item = ()
+        if item:
+            accepted = True
+            with metrics.timer("stage_seconds", stage="label"):
+                if suppressor is not None:
+                    accepted, summaries = suppressor.check(fields["agent"], fields["trap_oid"],
+                                                           payload, received)
+                    rows.extend(summary_row(*summary) for summary in summaries)
+            if accepted:
+                rows.append(row)
+                log_trap(lines)
+            else:
+                metrics.inc("suppressed_total")
+        if suppressor is not None and time.monotonic() >= next_expire:
+            next_expire = time.monotonic() + 1
+            rows.extend(summary_row(*summary) for summary in suppressor.expire(time.time()))
+        if rows:
+            with metrics.timer("stage_seconds", stage="write"):
+                sink.write_rows(rows)
+            metrics.inc("rows_written_total", len(rows))
+
+        if dropped_traps > reported_drops:
+            logging.info(f"Trap queue full, {dropped_traps - reported_drops} traps dropped")
+            reported_drops = dropped_traps
+
+    if suppressor is not None:
+        sink.write_rows([summary_row(*summary)
+                         for summary in suppressor.expire(float("inf"))])
+
+def check_processor(now):
+    # Runs in the dispatcher: once the processing thread is gone (the sink
+    # failed, ...) stop receiving instead of queueing traps nobody reads
+    if not processor.is_alive() and snmpEngine.transportDispatcher.jobsArePending():
+        snmpEngine.transportDispatcher.jobFinished(1)
+
+def shutdown():
+    snmpEngine.transportDispatcher.closeDispatcher()
+    if processor.is_alive():
+        trap_queue.put(None)
+    processor.join()
+    sink.close()
+    if live_server is not None:
+        live_server.stop()
+    telemetry.stop()
+
+processor = threading.Thread(target=process_traps, name="trap-processor", daemon=True)
+processor.start()
 
 ntfrcv.NotificationReceiver(snmpEngine, trap_callback)
 
 snmpEngine.transportDispatcher.jobStarted(1)
+snmpEngine.transportDispatcher.registerTimerCbFun(check_processor)
 
 try:
     snmpEngine.transportDispatcher.runDispatcher()
 except KeyboardInterrupt:
     print("Exiting trap listener...")
     logging.info("Exiting trap listener due to KeyboardInterrupt")
-    snmpEngine.transportDispatcher.closeDispatcher()
-    csvfile.close()
+    shutdown()
 except Exception as e:
     print(f"Error in trap listener: {e}")
     logging.info(f"Error in trap listener: {e}")
-    snmpEngine.transportDispatcher.closeDispatcher()
-    csvfile.close()
+    shutdown()
     raise
-
+else:
+    # only left when the processing thread stopped: exit non-zero, raising
+    # the sink's error from sink.close() if it is the cause
+    print("Trap processing stopped, exiting trap listener")
+    logging.info("Exiting trap listener, trap processing stopped")
+    shutdown()
+    sys.exit(1)
@@ -0,0 +1,66 @@
+import csv
+import threading
+import time
+import pandas as pd
+from csv_sink import CsvSink
+
+OLD_FIELDS = ["timestamp", "source", "record_type", "metric", "value", "label", "message"]
+NEW_FIELDS = OLD_FIELDS + ["agent", "trap_oid", "trap_name"]
+
+def test_append_to_old_format_file(tmp_path):
+    path = tmp_path / "snmp_traps.csv"
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=OLD_FIELDS)
+        writer.writeheader()
+        writer.writerow(dict.fromkeys(OLD_FIELDS, "old"))
+
+    sink = CsvSink(str(path), NEW_FIELDS)
+    sink.write(dict.fromkeys(NEW_FIELDS, "new"))
+    sink.close()
+
+    # the new rows start a file of their own, the old one is kept aside
+    new = pd.read_csv(path, dtype=str)
+    assert list(new.columns) == NEW_FIELDS
+    assert new["agent"].tolist() == ["new"]
+    rotated = list(tmp_path.glob("snmp_traps.*.csv"))
+    assert len(rotated) == 1
+    old = pd.read_csv(rotated[0], dtype=str)
+    assert list(old.columns) == OLD_FIELDS
+    assert old["value"].tolist() == ["old"]
+
+def test_append_to_same_format_file(tmp_path):
+    path = tmp_path / "snmp_traps.csv"
+    for value in ("a", "b"):
+        sink = CsvSink(str(path), NEW_FIELDS)
+        sink.write(dict.fromkeys(NEW_FIELDS, value))
+        sink.close()
+
+    assert pd.read_csv(path, dtype=str)["value"].tolist() == ["a", "b"]
+    assert not list(tmp_path.glob("snmp_traps.*.csv"))
+
+class Live:
+
+    def __init__(self):
+        self.rows = []
+
+    def append_rows(self, rows):
+        self.rows.extend(rows)
+
+def test_dropped_rows_skip_the_live_store(tmp_path):
+    # the writer is held on its first batch, so the queue fills up
+    live = Live()
+    sink = CsvSink(str(tmp_path / "out.csv"), ["x"], flush_rows=1, max_pending=100,
+                   block=False, live=live)
+    gate = threading.Event()
+    flush = sink._flush
+    sink._flush = lambda batch: (gate.wait(), flush(batch))
+    sink.write_rows([{"x": 0}] * 40)
+    while sink.pending():
+        time.sleep(0.01)
+    for i in range(1, 5):
+        sink.write_rows([{"x": i}] * 40)
+    gate.set()
+    sink.close()
+
+    assert sink.dropped_rows == 80
+    assert len(live.rows) == sink.written_rows == 120
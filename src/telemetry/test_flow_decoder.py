@@ -0,0 +1,123 @@
+import socket
+import struct
+import netflow
+import pytest
+import flow_decoder
+from flow_decoder import FlowDecoder, TemplateCache
+
+# Packets are packed field by field here, independently of the decoder's
+# dtypes, and checked against the netflow library
+EXPORTER = "192.0.2.1"
+FLOWS = [
+    # src, dst, src port, dst port, proto, packets, octets
+    ("10.0.0.1", "20.0.0.1", 40000, 443, 6, 12, 9000),
+    ("10.0.0.2", "20.0.0.2", 53000, 53, 17, 1, 80),
+    ("10.0.0.3", "20.0.0.3", 0, 0, 1, 4, 336),
+    ("172.16.5.9", "8.8.8.8", 65535, 445, 6, 4294967295, 4294967295),
+]
+V9_TEMPLATE_ID = 300
+# IPV4_SRC_ADDR, IPV4_DST_ADDR, L4_SRC_PORT, L4_DST_PORT, PROTOCOL, IN_PKTS,
+# IN_BYTES, plus TCP_FLAGS which the decoder skips
+V9_FIELDS = [(8, 4), (12, 4), (7, 2), (11, 2), (4, 1), (2, 4), (1, 4), (6, 1)]
+
+def addr(ip):
+    return struct.unpack("!I", socket.inet_aton(ip))[0]
+
+def v5_packet(flows):
+    data = struct.pack("!HHIIIIBBH", 5, len(flows), 1000, 1700000000, 0, 7, 0, 0, 0)
+    for src, dst, sport, dport, proto, packets, octets in flows:
+        data += struct.pack("!III", addr(src), addr(dst), 0)       # addresses, next hop
+        data += struct.pack("!HH", 1, 2)                            # input, output
+        data += struct.pack("!IIII", packets, octets, 100, 900)     # counters, first, last
+        data += struct.pack("!HHBBBB", sport, dport, 0, 0x18, proto, 0)
+        data += struct.pack("!HHBBH", 0, 0, 24, 24, 0)              # AS, masks, pad
+    return data
+
+def v9_template_set(template_id=V9_TEMPLATE_ID):
+    body = struct.pack("!HH", template_id, len(V9_FIELDS))
+    body += b"".join(struct.pack("!HH", *field) for field in V9_FIELDS)
+    return struct.pack("!HH", 0, 4 + len(body)) + body
+
+def v9_data_set(flows, template_id=V9_TEMPLATE_ID):
+    body = b"".join(struct.pack("!IIHHBIIB", addr(src), addr(dst), sport, dport, proto,
+                                packets, octets, 0x10)
+                    for src, dst, sport, dport, proto, packets, octets in flows)
+    body += b"\0" * (-len(body) % 4)
+    return struct.pack("!HH", template_id, 4 + len(body)) + body
+
+def v9_packet(*sets, count=0, source_id=1):
+    return struct.pack("!HHIIII", 9, count, 1000, 1700000000, 7, source_id) + b"".join(sets)
+
+def decoded(flows):
+    return [(int(f["src_addr"]), int(f["dst_addr"]), int(f["src_port"]), int(f["dst_port"]),
+             int(f["proto"]), int(f["packets"]), int(f["octets"])) for f in flows]
+
+def library(packet, v9=False):
+    names = (("IPV4_SRC_ADDR", "IPV4_DST_ADDR", "L4_SRC_PORT", "L4_DST_PORT", "PROTOCOL",
+              "IN_PKTS", "IN_BYTES") if v9 else
+             ("IPV4_SRC_ADDR", "IPV4_DST_ADDR", "SRC_PORT", "DST_PORT", "PROTO",
+              "IN_PACKETS", "IN_OCTETS"))
+    # v9 hands addresses back as dotted strings, v5 as integers
+    return [tuple(addr(value) if isinstance(value, str) else value
+                  for value in (flow.data[name] for name in names))
+            for flow in packet.flows]
+
+def test_v5_matches_netflow_library():
+    data = v5_packet(FLOWS)
+    flows = FlowDecoder().decode(data, EXPORTER)
+    assert decoded(flows) == library(netflow.parse_packet(data))
+    assert flows["exporter"].tolist() == [addr(EXPORTER)] * len(FLOWS)
+    assert flows["flow_index"].tolist() == [1, 2, 3, 4]
+    assert set(flows["version"].tolist()) == {5}
+
+def test_truncated_v5_is_rejected():
+    with pytest.raises(ValueError):
+        FlowDecoder().decode(v5_packet(FLOWS)[:-10], EXPORTER)
+
+def test_v9_matches_netflow_library():
+    templates = {"netflow": {}, "ipfix": {}}
+    first = v9_packet(v9_template_set(), v9_data_set(FLOWS[:2]), count=3)
+    second = v9_packet(v9_data_set(FLOWS[2:]), count=2)
+    decoder = FlowDecoder()
+    for data, expected in ((first, FLOWS[:2]), (second, FLOWS[2:])):
+        packet = netflow.parse_packet(data, templates)
+        flows = decoder.decode(data, EXPORTER)
+        assert decoded(flows) == library(packet, v9=True)
+        assert len(flows) == len(expected)
+    assert decoder.missing_template == 0
+
+def test_v9_data_before_template_is_counted():
+    decoder = FlowDecoder()
+    assert len(decoder.decode(v9_packet(v9_data_set(FLOWS)), EXPORTER)) == 0
+    assert decoder.missing_template == 1
+
+def test_templates_are_per_exporter():
+    decoder = FlowDecoder()
+    decoder.decode(v9_packet(v9_template_set()), EXPORTER)
+    assert len(decoder.decode(v9_packet(v9_data_set(FLOWS)), "192.0.2.2")) == 0
+    assert len(decoder.decode(v9_packet(v9_data_set(FLOWS)), EXPORTER)) == len(FLOWS)
+
+def test_template_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(flow_decoder.time, "monotonic", lambda: now[0])
+    decoder = FlowDecoder(ttl=60)
+    decoder.decode(v9_packet(v9_template_set()), EXPORTER)
+    now[0] += 59
+    assert len(decoder.decode(v9_packet(v9_data_set(FLOWS)), EXPORTER)) == len(FLOWS)
+    # a use is not a refresh: only a template set is
+    now[0] += 2
+    assert len(decoder.decode(v9_packet(v9_data_set(FLOWS)), EXPORTER)) == 0
+    assert decoder.missing_template == 1
+    assert decoder.templates.evicted == 1
+    decoder.decode(v9_packet(v9_template_set()), EXPORTER)
+    assert len(decoder.decode(v9_packet(v9_data_set(FLOWS)), EXPORTER)) == len(FLOWS)
+
+def test_template_cache_evicts_least_recently_used():
+    cache = TemplateCache(max_entries=2)
+    cache.put("a", "dtype a")
+    cache.put("b", "dtype b")
+    assert cache.get("a") == "dtype a"
+    cache.put("c", "dtype c")
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == ("dtype a", "dtype c")
+    assert len(cache) == 2 and cache.evicted == 1
@@ -0,0 +1,41 @@
+import pytest
+from online_detectors import DetectorBank, DETECTORS
+import snmp_poller
+from snmp_poller import DEVICES, build_device_rows
+
+@pytest.mark.parametrize("kind", sorted(DETECTORS))
+def test_steady_device_raises_no_anomaly(kind):
+    # 10 minutes of 5 s polls of a quiet Linux VM whose CPU figures wiggle
+    # around a level, cpuUser being polled every 30 s only: each metric,
+    # derived ones included, is its own stream, so nothing is far from its
+    # baseline
+    device = DEVICES["VM1"]
+    bank = DetectorBank(kind)
+    wiggle = [0.0, 0.2, 0.0, -0.2]
+    for step in range(120):
+        noise = wiggle[step % len(wiggle)]
+        values = {"sysUpTime": str(1000 + 500 * step),
+                  "load1": "0.5", "load5": "0.5", "load15": "0.5",
+                  "cpuUser": str(5 + noise), "cpuSystem": str(2 - noise),
+                  "cpuIdle": str(60 + noise),
+                  "memTotal": "4046844", "memUsed": "2000000", "memFree": "2046844",
+                  "swapTotal": "1000000", "swapAvail": "1000000"}
+        metrics = [metric for metric in device["oids"] if metric != "cpuUser" or step % 6 == 0]
+        rows = build_device_rows("VM1", device, values, None,
+                                 f"2025-03-01 10:{step // 12:02d}:{step % 12 * 5:02d}", metrics)
+        assert [row["metric"] for row in rows].count("cpuUsage") == 1
+        bank.label_rows(rows)
+        assert not [row for row in rows if row["label"] == "ANOMALY"], step
+
+def test_rates_use_the_receive_time_of_each_row():
+    # the second walk took 4 s to come back: the rate is over the 10 s
+    # between the two responses, not up to the time rows are labelled
+    device = {"type": "linux", "snmp_if_index": 1}
+    snmp_poller.interface_cache["R9"] = {"names": {1: "eth0"}, "indexes": {1},
+                                         "discovered": 0.0, "seen_up": set(), "uptime": None}
+    for received, octets, labelled in ((100.0, 0, 101.0), (110.0, 1000, 114.0)):
+        table = {1: {snmp_poller.RECEIVED: received, "ifHCInOctets": str(octets),
+                     "ifHCOutOctets": str(2 * octets)}}
+        rows, rates = snmp_poller.interface_rows("R9", device, table, labelled, None,
+                                                 "2025-03-01 10:00:00")
+    assert rates == (100.0, 200.0)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+# Per (agent, trap OID) deduplication and rate limiting for the trap
+# listener. Within a window of `window` seconds for a key:
+#   - a trap whose payload equals one already seen in the window is a
+#     duplicate (payloads exclude sysUpTime, which changes on every trap)
+#   - once `rate_limit` traps have been let through, the rest are suppressed
+# When the window of a key closes with anything held back, one summary
+# (agent, trap OID, duplicates, suppressed, window start) is produced, so a
+# link-flap storm turns into a handful of counted records.
+
+DEDUP_WINDOW = 10
+RATE_LIMIT = 5
+# Distinct payloads remembered per key and window, to bound memory in a storm
+MAX_PAYLOADS = 1024
+
+class TrapSuppressor:
+
+    def __init__(self, window=DEDUP_WINDOW, rate_limit=RATE_LIMIT):
+        self.window = window
+        self.rate_limit = rate_limit
+        # key -> [window start, passed, duplicates, suppressed, set of payloads]
+        self.keys = {}
+
+    def check(self, agent, trap_oid, payload, now):
+        # Returns (accepted, summaries): accepted is False when the trap is
+        # held back, summaries covers a window of this key that just closed
+        key = (agent, trap_oid)
+        summaries = []
+        state = self.keys.get(key)
+        if state is not None and now - state[0] >= self.window:
+            summary = self.close(key, state)
+            if summary is not None:
+                summaries.append(summary)
+            state = None
+        if state is None:
+            state = self.keys[key] = [now, 0, 0, 0, set()]
+
+        if payload in state[4]:
+            state[2] += 1
+            return False, summaries
+        if len(state[4]) < MAX_PAYLOADS:
+            state[4].add(payload)
+        if state[1] >= self.rate_limit:
+            state[3] += 1
+            return False, summaries
+        state[1] += 1
+        return True, summaries
+
+    def expire(self, now):
+        # Summaries for every key whose window is over
+        summaries = []
+        for key, state in list(self.keys.items()):
+            if now - state[0] >= self.window:
+                summary = self.close(key, state)
+                if summary is not None:
+                    summaries.append(summary)
+        return summaries
+
+    def close(self, key, state):
+        del self.keys[key]
+        window_start, passed, duplicates, suppressed, payloads = state
+        if not duplicates and not suppressed:
+            return None
+        agent, trap_oid = key
+        return (agent, trap_oid, duplicates, suppressed, window_start)